@@ -0,0 +1,13 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-15 10:02:41
+@LastEditTime: 2019-09-16 21:37:18
+@Description: BarStore persists bars as memory-mapped numpy column files.
+'''
+
+from tpro.api.bar_store.bar_store import BAR_FIELDS, BarStore, sync_from_mongo
+
+__all__ = ['BAR_FIELDS', 'BarStore', 'sync_from_mongo']
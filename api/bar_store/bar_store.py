@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-15 10:02:41
+@LastEditTime: 2019-09-16 21:37:18
+@Description: Columnar local bar store based on memory-mapped numpy files
+'''
+
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING
+
+from tpro.utils import load_json
+
+# 默认字段及存储类型，datetime 以 int64 纳秒时间戳存储
+BAR_FIELDS = OrderedDict([
+    ('datetime', 'int64'),
+    ('open', 'float64'),
+    ('high', 'float64'),
+    ('low', 'float64'),
+    ('close', 'float64'),
+    ('volume', 'float64'),
+    ('total_turnover', 'float64'),
+    ('open_interest', 'float64'),
+])
+
+META_FILE = 'meta.json'
+
+
+def to_datetime_int(values: Any):
+    """
+    将 datetime 序列转换为 int64 纳秒时间戳数组
+    """
+    return np.asarray(pd.to_datetime(values)).astype('datetime64[ns]').view(np.int64)
+
+
+class BarStore():
+    """
+    本地列式 bar 存储，每个合约/周期一个目录，每个字段一个只追加的二进制列文件，
+    读取时以 numpy.memmap 零拷贝映射，并通过二分查找按时间区间切片
+    """
+    config = "api.json"
+
+    def __init__(self, root: str = None):
+        if root is None:
+            setting = load_json(self.config, 'BarStore') or {}
+            root = setting.get('PATH', os.path.join(os.path.expanduser('~'), '.tpro', 'bar_store'))
+
+        self.root = root
+
+    # ------------------------------------------------------------------
+    def _path(self, symbol: str, freq: str, name: str = ''):
+        return os.path.join(self.root, freq, symbol, name)
+
+    # ------------------------------------------------------------------
+    def _load_meta(self, symbol: str, freq: str):
+        try:
+            with open(self._path(symbol, freq, META_FILE), mode='r', encoding='UTF-8') as f:
+                return json.load(f, object_pairs_hook=OrderedDict)
+        except FileNotFoundError:
+            return None
+
+    # ------------------------------------------------------------------
+    def _save_meta(self, symbol: str, freq: str, meta: dict):
+        """
+        先写临时文件再原子替换，meta 中的 length 是数据提交点
+        """
+        path = self._path(symbol, freq, META_FILE)
+        with open(path + '.tmp', mode='w', encoding='UTF-8') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    # ------------------------------------------------------------------
+    def symbols(self, freq: str):
+        """
+        已存储指定周期数据的合约列表
+        """
+        path = os.path.join(self.root, freq)
+        if not os.path.isdir(path):
+            return []
+        return sorted(x for x in os.listdir(path) if os.path.exists(self._path(x, freq, META_FILE)))
+
+    # ------------------------------------------------------------------
+    def length(self, symbol: str, freq: str):
+        meta = self._load_meta(symbol, freq)
+        return meta['length'] if meta else 0
+
+    # ------------------------------------------------------------------
+    def last_datetime(self, symbol: str, freq: str):
+        """
+        最后一条数据的时间，无数据时返回 None
+        """
+        meta = self._load_meta(symbol, freq)
+        if not meta or not meta['length']:
+            return None
+        return pd.Timestamp(meta['last'])
+
+    # ------------------------------------------------------------------
+    def append(self, symbol: str, freq: str, data: Any, fields: Dict[str, str] = None):
+        """
+        追加数据，data为 DataFrame 或 {字段: 数组} 字典(须包含升序的 datetime 字段)，
+        早于或等于已存储最后时间的数据将被忽略，返回实际追加的条数
+        """
+        if isinstance(data, pd.DataFrame):
+            data = {k: data[k].values for k in data.columns}
+
+        if 'datetime' not in data or not len(data['datetime']):
+            return 0
+
+        meta = self._load_meta(symbol, freq)
+
+        if meta is None:
+            fields = fields or OrderedDict((k, v) for k, v in BAR_FIELDS.items() if k in data)
+            meta = OrderedDict([('length', 0), ('last', None), ('fields', fields)])
+            os.makedirs(self._path(symbol, freq), exist_ok=True)
+
+        dt = to_datetime_int(data['datetime'])
+        start = 0 if meta['last'] is None else int(np.searchsorted(dt, meta['last'], side='right'))
+
+        if start >= len(dt):
+            return 0
+
+        for name, dtype in meta['fields'].items():
+            if name == 'datetime':
+                column = dt
+            else:
+                column = pd.Series(data[name]).astype(dtype).values if name in data else np.full(len(dt), np.nan)
+            path = self._path(symbol, freq, name + '.dat')
+            itemsize = np.dtype(dtype).itemsize
+
+            with open(path, mode='ab') as f:
+                # 丢弃上次中断写入的未提交数据
+                f.truncate(meta['length'] * itemsize)
+                f.write(np.ascontiguousarray(column[start:], dtype=dtype).tobytes())
+
+        meta['length'] += len(dt) - start
+        meta['last'] = int(dt[-1])
+        self._save_meta(symbol, freq, meta)
+
+        return len(dt) - start
+
+    # ------------------------------------------------------------------
+    def truncate(self, symbol: str, freq: str, since: Any):
+        """
+        删除时间不早于 since 的数据(数据源改写历史数据后，从改写处起重新追加)，返回删除的条数；
+        只修改 meta 中的提交长度，列文件在下次追加时截断
+        """
+        meta = self._load_meta(symbol, freq)
+        if not meta or not meta['length']:
+            return 0
+
+        length = meta['length']
+        dt = np.memmap(self._path(symbol, freq, 'datetime.dat'), dtype='int64', mode='r', shape=(length,))
+        keep = int(np.searchsorted(dt, to_datetime_int([since])[0], side='left'))
+
+        if keep >= length:
+            return 0
+
+        meta['last'] = int(dt[keep - 1]) if keep else None
+        meta['length'] = keep
+        del dt
+        self._save_meta(symbol, freq, meta)
+
+        return length - keep
+
+    # ------------------------------------------------------------------
+    def read(self, symbol: str, freq: str, start: Any = None, end: Any = None, fields: List[str] = None):
+        """
+        读取 [start, end] 区间内的数据，返回 {字段: 只读 memmap 切片}，datetime 字段为 datetime64[ns]
+        """
+        meta = self._load_meta(symbol, freq)
+        if not meta:
+            return {}
+
+        fields = fields or list(meta['fields'].keys())
+        length = meta['length']
+
+        columns = OrderedDict()
+        for name in set(fields) | {'datetime'}:
+            dtype = meta['fields'][name]
+            if length == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(self._path(symbol, freq, name + '.dat'), dtype=dtype, mode='r', shape=(length,))
+
+        dt = columns['datetime']
+        left = 0 if start is None else int(np.searchsorted(dt, to_datetime_int([start])[0], side='left'))
+        right = length if end is None else int(np.searchsorted(dt, to_datetime_int([end])[0], side='right'))
+
+        result = OrderedDict()
+        for name in fields:
+            column = columns[name][left:right]
+            result[name] = column.view('datetime64[ns]') if name == 'datetime' else column
+
+        return result
+
+    # ------------------------------------------------------------------
+    def read_frame(self, symbol: str, freq: str, start: Any = None, end: Any = None, fields: List[str] = None):
+        """
+        读取区间数据为以 datetime 为索引的 DataFrame
+        """
+        fields = [x for x in fields or [] if x != 'datetime']
+        columns = self.read(symbol, freq, start, end, ['datetime'] + fields if fields else None)
+        if not columns:
+            return pd.DataFrame()
+
+        index = pd.DatetimeIndex(columns.pop('datetime'), name='datetime')
+        return pd.DataFrame(columns, index=index)
+
+
+# ----------------------------------------------------------------------
+def sync_from_mongo(store: BarStore,
+                    db: Any,
+                    freq: str,
+                    symbols: List[str] = None,
+                    batch_size: int = 50000,
+                    rewrite: Dict[str, Any] = None):
+    """
+    将 MongoDB 数据库(每个合约一个集合)中的增量数据同步到本地列式存储，返回 {合约: 追加条数}；
+    rewrite 为 {合约: 最早被改写的时间}，这些合约先截断本地数据再从该时间起重新同步
+    """
+    fields = list(BAR_FIELDS.keys())
+    projection = {k: 1 for k in fields}
+    projection['_id'] = 0
+
+    result = {}
+
+    for symbol in symbols or db.list_collection_names():
+        if rewrite and symbol in rewrite:
+            store.truncate(symbol, freq, rewrite[symbol])
+
+        last = store.last_datetime(symbol, freq)
+        flt = {} if last is None else {'datetime': {'$gt': last.to_pydatetime()}}
+
+        cursor = db[symbol].find(flt, projection).sort('datetime', ASCENDING).batch_size(batch_size)
+
+        count = 0
+        columns = {k: [] for k in fields}
+
+        for doc in cursor:
+            for k in fields:
+                columns[k].append(doc.get(k, np.nan))
+
+            if len(columns['datetime']) >= batch_size:
+                count += store.append(symbol, freq, columns)
+                columns = {k: [] for k in fields}
+
+        count += store.append(symbol, freq, columns)
+
+        if count:
+            result[symbol] = count
+
+    return result
@@ -8,6 +8,16 @@
 @Description: MongoApi defines standard APIs for communicating with MongoDB.
 '''
 
+from tpro.api.mongo.bar_table import (SCHEMA_SINGLE, SCHEMA_SYMBOL, SCHEMA_TIMESERIES, BarTable, SymbolView,
+                                      migrate_to_table)
+from tpro.api.mongo.bulk_writer import BulkWriter
+from tpro.api.mongo.client import close_clients, connect_client, get_client
+from tpro.api.mongo.frame import cursor_to_frame
+from tpro.api.mongo.indexes import audit_indexes, ensure_index, ensure_indexes, forget_index
 from tpro.api.mongo.mongo_api import MongoApi
 
-__all__ = ['MongoApi']
+__all__ = [
+    'SCHEMA_SINGLE', 'SCHEMA_SYMBOL', 'SCHEMA_TIMESERIES', 'BarTable', 'BulkWriter', 'MongoApi', 'SymbolView',
+    'audit_indexes', 'close_clients', 'connect_client', 'cursor_to_frame', 'ensure_index',
+    'ensure_indexes', 'forget_index', 'get_client'
+]
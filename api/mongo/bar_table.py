@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-20 20:41:27
+@LastEditTime: 2019-09-21 10:26:05
+@Description: Single-collection bar schema keyed on (symbol, datetime)
+'''
+
+from typing import Any, Callable, List
+
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid
+
+from tpro.api.mongo.bulk_writer import BulkWriter
+from tpro.api.mongo.frame import cursor_to_frame
+
+SYMBOL_KEY = 'symbol'
+DEFAULT_TABLE = 'bars'
+
+# 数据库结构：每个合约一个集合 / 每个周期一个集合 / 每个周期一个 MongoDB 时间序列集合
+SCHEMA_SYMBOL = 'symbol'
+SCHEMA_SINGLE = 'single'
+SCHEMA_TIMESERIES = 'timeseries'
+
+
+def _time_filter(start: Any = None, end: Any = None):
+    flt = {}
+    if start is not None:
+        flt['$gte'] = pd.Timestamp(start).to_pydatetime()
+    if end is not None:
+        flt['$lte'] = pd.Timestamp(end).to_pydatetime()
+    return flt
+
+
+def _projection(fields: List[str] = None, *keys: str):
+    if not fields:
+        return {'_id': 0}
+    return dict({k: 1 for k in list(keys) + list(fields)}, _id=0)
+
+
+class SymbolView():
+    """
+    单一集合中某个合约的数据视图，提供与按合约分集合时相同的集合操作接口，
+    查询条件及写入文档自动附加合约字段
+    """
+
+    def __init__(self, table: 'BarTable', symbol: str):
+        self.table = table
+        self.collection = table.collection
+        self.name = symbol
+        self.scope = {SYMBOL_KEY: symbol}
+
+    # ------------------------------------------------------------------
+    @property
+    def database(self):
+        return self.collection.database
+
+    @property
+    def full_name(self):
+        return self.collection.full_name
+
+    # ------------------------------------------------------------------
+    def _filter(self, flt: dict = None):
+        return dict(flt or {}, **self.scope)
+
+    def _tag(self, doc: dict):
+        doc.update(self.scope)
+        return doc
+
+    # ------------------------------------------------------------------
+    def find(self, filter: dict = None, *args, **kwargs):
+        return self.collection.find(self._filter(filter), *args, **kwargs)
+
+    def find_one(self, filter: dict = None, *args, **kwargs):
+        return self.collection.find_one(self._filter(filter), *args, **kwargs)
+
+    def count_documents(self, filter: dict = None, **kwargs):
+        return self.collection.count_documents(self._filter(filter), **kwargs)
+
+    def insert_one(self, document: dict, **kwargs):
+        return self.collection.insert_one(self._tag(document), **kwargs)
+
+    def insert_many(self, documents: List[dict], **kwargs):
+        return self.collection.insert_many([self._tag(x) for x in documents], **kwargs)
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs):
+        return self.collection.replace_one(self._filter(filter), self._tag(replacement), upsert, **kwargs)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return self.collection.update_one(self._filter(filter), update, upsert, **kwargs)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        return self.collection.update_many(self._filter(filter), update, upsert, **kwargs)
+
+    def delete_many(self, filter: dict = None, **kwargs):
+        return self.collection.delete_many(self._filter(filter), **kwargs)
+
+    def bulk_write(self, requests: List[Any], **kwargs):
+        """
+        请求须已包含合约条件(BulkWriter 根据 scope 自动附加)
+        """
+        return self.collection.bulk_write(requests, **kwargs)
+
+    def create_index(self, keys: List[Any], **kwargs):
+        """
+        合约索引以 (合约, 字段...) 复合索引的形式建立在单一集合上
+        """
+        return self.table.create_index(keys, **kwargs)
+
+
+class BarTable():
+    """
+    以单一集合存储某一周期全部合约 bar 数据，(symbol, datetime) 为唯一键；
+    支持与 Database 相同的 db[合约] 与 list_collection_names() 访问方式，
+    timeseries为 True 时使用 MongoDB(5.0+) 时间序列集合(不支持唯一索引)
+    """
+
+    def __init__(self, db: Any, name: str = DEFAULT_TABLE, timeseries: bool = False, granularity: str = 'minutes'):
+        self.db = db
+        self.table_name = name
+        self.timeseries = timeseries
+        self.granularity = granularity
+
+        self.collection = db[name]
+
+    # ------------------------------------------------------------------
+    @property
+    def name(self):
+        return self.db.name
+
+    @property
+    def client(self):
+        return self.db.client
+
+    # ------------------------------------------------------------------
+    def __getitem__(self, symbol: str):
+        return SymbolView(self, symbol)
+
+    # ------------------------------------------------------------------
+    def list_collection_names(self):
+        """
+        已存储数据的合约列表
+        """
+        return sorted(self.collection.distinct(SYMBOL_KEY))
+
+    # ------------------------------------------------------------------
+    def create_index(self, keys: List[Any], unique: bool = True, **kwargs):
+        keys = [(SYMBOL_KEY, ASCENDING)] + [x for x in keys if x[0] != SYMBOL_KEY]
+        return self.collection.create_index(keys, unique=unique and not self.timeseries, **kwargs)
+
+    # ------------------------------------------------------------------
+    def ensure(self):
+        """
+        创建集合及索引：(symbol, datetime) 用于单合约查询，(datetime, symbol) 用于截面查询
+        """
+        if self.timeseries and self.table_name not in self.db.list_collection_names():
+            try:
+                self.db.create_collection(self.table_name,
+                                          timeseries={'timeField': 'datetime', 'metaField': SYMBOL_KEY,
+                                                      'granularity': self.granularity})
+            except CollectionInvalid:
+                pass
+
+        self.create_index([('datetime', ASCENDING)])
+        self.collection.create_index([('datetime', ASCENDING), (SYMBOL_KEY, ASCENDING)])
+        return self
+
+    # ------------------------------------------------------------------
+    def read(self, symbol: str, start: Any = None, end: Any = None, fields: List[str] = None):
+        """
+        读取单个合约 [start, end] 区间的数据
+        """
+        flt = {SYMBOL_KEY: symbol}
+        time_flt = _time_filter(start, end)
+        if time_flt:
+            flt['datetime'] = time_flt
+
+        cursor = self.collection.find(flt, _projection(fields, 'datetime')).sort('datetime', ASCENDING)
+        return cursor_to_frame(cursor.batch_size(10000), ['datetime'] + [x for x in fields if x != 'datetime']
+                               if fields else None)
+
+    # ------------------------------------------------------------------
+    def cross_section(self, start: Any, end: Any = None, symbols: List[str] = None, fields: List[str] = None):
+        """
+        读取 [start, end] 区间(end为空时仅 start 时点)全部或指定合约的截面数据
+        """
+        flt = {'datetime': _time_filter(start, start if end is None else end)}
+        if symbols is not None:
+            flt[SYMBOL_KEY] = {'$in': list(symbols)}
+
+        cursor = self.collection.find(flt, _projection(fields, 'datetime', SYMBOL_KEY))
+        cursor = cursor.sort([('datetime', ASCENDING), (SYMBOL_KEY, ASCENDING)]).batch_size(10000)
+        keys = ['datetime', SYMBOL_KEY]
+        return cursor_to_frame(cursor, keys + [x for x in fields if x not in keys] if fields else None)
+
+
+# ----------------------------------------------------------------------
+def migrate_to_table(source_db: Any,
+                     table: BarTable,
+                     symbols: List[str] = None,
+                     batch_size: int = 5000,
+                     on_progress: Callable = None):
+    """
+    将按合约分集合存储的数据库迁移到单一集合，可重复执行(按 (symbol, datetime) upsert；
+    时间序列集合不支持唯一键，只复制晚于该合约已迁移最后时间的数据)，
+    on_progress回调参数为 (合约, 写入条数)，返回写入总条数
+    """
+    table.ensure()
+    total = 0
+
+    for symbol in symbols or source_db.list_collection_names():
+        if symbol == table.table_name and source_db.name == table.name:
+            continue
+
+        # 时间序列集合不支持 upsert，只插入尚未迁移的数据
+        flt = {}
+        if table.timeseries:
+            last = table.collection.find_one({SYMBOL_KEY: symbol}, {'_id': 0, 'datetime': 1},
+                                             sort=[('datetime', DESCENDING)])
+            if last is not None:
+                flt['datetime'] = {'$gt': last['datetime']}
+
+        cursor = source_db[symbol].find(flt, {'_id': 0}).sort('datetime', ASCENDING).batch_size(batch_size)
+
+        with BulkWriter.for_collection(table[symbol], batch_size=batch_size) as writer:
+            writer.extend(cursor)
+        count = writer.written
+
+        total += count
+        if on_progress:
+            on_progress(symbol, count)
+
+    return total
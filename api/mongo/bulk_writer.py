@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-18 21:05:47
+@LastEditTime: 2019-09-19 06:52:10
+@Description: Buffered, idempotent bulk upsert writer
+'''
+
+import time
+from typing import Any, Callable, Iterable
+
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class BulkWriter():
+    """
+    批量幂等写入器：缓存文档并以无序 bulk_write 批量 upsert，
+    以 key 字段(默认'datetime')作为唯一键，重复执行结果一致
+
+    mode为'replace'时整条替换文档，为'update'时仅以 $set 更新给定字段，
+    为'insert'时直接插入(时间序列集合不支持 upsert，不保证幂等)；
+    on_error回调参数为 (批次序号, BulkWriteError.details)，未指定时写入错误以 BulkWriteError 抛出
+    (计数已更新，其余批次仍在缓存中)；
+    collection带有 scope 属性(如单一集合中的合约视图)时，scope 同时附加到唯一键条件及文档
+    """
+
+    def __init__(self,
+                 collection: Any,
+                 key: str = 'datetime',
+                 batch_size: int = 1000,
+                 flush_interval: float = 0,
+                 mode: str = 'replace',
+                 on_error: Callable = None):
+        assert mode in ('replace', 'update', 'insert'), "Invaild bulk write mode: %s." % mode
+
+        self.collection = collection
+        self.key = key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mode = mode
+        self.on_error = on_error
+        self.scope = dict(getattr(collection, 'scope', {}))
+
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+        self.batches = 0
+        self.inserted = 0
+        self.upserted = 0
+        self.modified = 0
+        self.errors = 0
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def for_collection(cls, collection: Any, **kwargs):
+        """
+        按集合类型选择写入方式：时间序列集合中的合约视图直接插入，其余按唯一键 upsert
+        """
+        if getattr(getattr(collection, 'table', None), 'timeseries', False):
+            kwargs['mode'] = 'insert'
+        return cls(collection, **kwargs)
+
+    # ------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.flush()
+
+    # ------------------------------------------------------------------
+    def _request(self, doc: dict):
+        flt = dict(self.scope, **{self.key: doc[self.key]})
+        doc.update(self.scope)
+        if self.mode == 'insert':
+            return InsertOne(doc)
+        if self.mode == 'replace':
+            return ReplaceOne(flt, doc, upsert=True)
+        return UpdateOne(flt, {'$set': doc}, upsert=True)
+
+    # ------------------------------------------------------------------
+    def add(self, doc: dict):
+        """
+        添加一条文档，缓存达到批量大小或超过写入间隔时自动写入
+        """
+        self._buffer.append(self._request(doc))
+
+        if len(self._buffer) >= self.batch_size or (
+                self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    # ------------------------------------------------------------------
+    def extend(self, docs: Iterable[dict]):
+        for doc in docs:
+            self.add(doc)
+
+    # ------------------------------------------------------------------
+    def flush(self):
+        """
+        写入全部缓存文档，返回本批次是否全部成功(未指定 on_error 时写入失败抛出 BulkWriteError)
+        """
+        self._last_flush = time.monotonic()
+
+        if not self._buffer:
+            return True
+
+        requests, self._buffer = self._buffer, []
+        self.batches += 1
+
+        try:
+            result = self.collection.bulk_write(requests, ordered=False)
+            self.inserted += result.inserted_count
+            self.upserted += result.upserted_count
+            self.modified += result.modified_count
+            return True
+        except BulkWriteError as e:
+            details = e.details
+            self.inserted += details.get('nInserted', 0)
+            self.upserted += details.get('nUpserted', 0)
+            self.modified += details.get('nModified', 0)
+            self.errors += len(details.get('writeErrors', []))
+
+            if self.on_error is None:
+                raise
+            self.on_error(self.batches, details)
+            return False
+
+    # ------------------------------------------------------------------
+    @property
+    def written(self):
+        """
+        已写入(新增及修改)的文档数
+        """
+        return self.inserted + self.upserted + self.modified
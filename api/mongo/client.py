@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-17 20:16:05
+@LastEditTime: 2019-09-18 07:41:33
+@Description: Process-wide MongoClient registry keyed by URI
+'''
+
+from threading import Lock
+
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+
+_clients = {}
+_lock = Lock()
+
+
+def make_uri(config: dict = None):
+    """
+    根据配置生成连接URI，配置项：URI 或 HOST、PORT
+    """
+    config = config or {}
+    if config.get('URI'):
+        return config['URI']
+    return 'mongodb://{}:{}'.format(config.get('HOST', '127.0.0.1') or '127.0.0.1', config.get('PORT', 27017) or 27017)
+
+
+def get_client(config: dict = None):
+    """
+    获取进程内共享的 MongoClient(同一URI只创建一次)，配置项：
+    POOL_SIZE - 连接池上限，TIMEOUT - 服务器选择超时(毫秒)，
+    CONNECT_TIMEOUT - 连接超时(毫秒)，SOCKET_TIMEOUT - 读写超时(毫秒)，W - 写关注级别
+    """
+    config = config or {}
+    uri = make_uri(config)
+
+    with _lock:
+        client = _clients.get(uri)
+
+        if client is None:
+            options = {
+                'maxPoolSize': int(config.get('POOL_SIZE', 100)),
+                'serverSelectionTimeoutMS': int(config.get('TIMEOUT', 3000)),
+                'connectTimeoutMS': int(config.get('CONNECT_TIMEOUT', 5000)),
+                'w': config.get('W', 1),
+                'connect': False,
+            }
+            if config.get('SOCKET_TIMEOUT'):
+                options['socketTimeoutMS'] = int(config['SOCKET_TIMEOUT'])
+
+            client = MongoClient(uri, **options)
+            _clients[uri] = client
+
+    return client
+
+
+def connect_client(config: dict = None):
+    """
+    获取共享的 MongoClient 并检查服务器是否可用，不可用时返回 None
+    """
+    client = get_client(config)
+
+    try:
+        client.admin.command('ping')
+        return client
+    except ConnectionFailure:
+        return None
+
+
+def close_clients():
+    """
+    关闭全部共享连接(仅在程序退出时调用)
+    """
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
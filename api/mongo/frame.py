@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-08-27 22:49:33
+@LastEditTime: 2019-09-20 21:03:44
+@Description: Columnar conversion of MongoDB query cursors
+'''
+
+from typing import Any, List
+
+import pandas as pd
+
+
+def cursor_to_frame(cursor: Any, fields: List[str] = None, chunk_size: int = 0):
+    """
+    将查询指针按列直接转换为 DataFrame，不构建中间的字典列表；
+    fields为空时以首条文档的字段为列，chunk_size大于0时返回逐块DataFrame的生成器
+    """
+    def _frames():
+        columns = None
+        count = 0
+
+        for doc in cursor:
+            if columns is None:
+                columns = {k: [] for k in (fields or doc.keys())}
+
+            for k, v in columns.items():
+                v.append(doc.get(k))
+            count += 1
+
+            if chunk_size and count >= chunk_size:
+                yield pd.DataFrame(columns, columns=list(columns.keys()))
+                columns = {k: [] for k in columns.keys()}
+                count = 0
+
+        if columns is None:
+            yield pd.DataFrame(columns=fields)
+        elif count or not chunk_size:
+            yield pd.DataFrame(columns, columns=list(columns.keys()))
+
+    if chunk_size:
+        return _frames()
+    return next(_frames())
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-19 20:32:16
+@LastEditTime: 2019-09-20 07:15:48
+@Description: Process-wide registry of collections with ensured indexes
+'''
+
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING
+
+DATETIME_INDEX = [('datetime', ASCENDING)]
+
+_indexed = set()
+_lock = Lock()
+
+
+def _collection_key(collection: Any):
+    return (id(collection.database.client), collection.full_name)
+
+
+def ensure_index(collection: Any, keys: List[Tuple[str, int]] = None, unique: bool = True):
+    """
+    为集合创建索引(默认 datetime 唯一索引)，同一进程内每个集合只请求服务器一次
+    """
+    keys = keys or DATETIME_INDEX
+    key = _collection_key(collection) + (tuple(keys), unique)
+
+    with _lock:
+        if key in _indexed:
+            return False
+
+    collection.create_index(keys, unique=unique)
+
+    with _lock:
+        _indexed.add(key)
+    return True
+
+
+def ensure_indexes(db: Any, keys: List[Tuple[str, int]] = None, unique: bool = True, names: List[str] = None):
+    """
+    启动时为数据库中全部(或指定)合约集合一次性创建索引，返回新创建索引的集合数
+    """
+    names = db.list_collection_names() if names is None else names
+    return sum(ensure_index(db[name], keys, unique) for name in names)
+
+
+def forget_index(collection: Any = None):
+    """
+    集合被删除后清除其登记记录，collection为 None 时清空全部记录
+    """
+    with _lock:
+        if collection is None:
+            _indexed.clear()
+        else:
+            prefix = _collection_key(collection)
+            _indexed.difference_update([x for x in _indexed if x[:2] == prefix])
+
+
+def audit_indexes(db: Any, keys: List[Tuple[str, int]] = None, unique: bool = True, names: List[str] = None):
+    """
+    检查数据库中各集合的索引，返回存在问题的集合 {集合名: {'missing': bool, 'redundant': [索引名]}}
+
+    missing - 缺少所需的(唯一)索引；
+    redundant - 与其它索引键相同，或为其它索引键前缀的多余索引(不含 _id_)
+    """
+    keys = [tuple(x) for x in keys or DATETIME_INDEX]
+    names = db.list_collection_names() if names is None else names
+
+    report: Dict[str, Dict[str, Any]] = {}
+
+    for name in names:
+        info = db[name].index_information()
+        indexes = {k: [tuple(x) for x in v['key']] for k, v in info.items() if k != '_id_'}
+
+        missing = not any(v['key'] and [tuple(x) for x in v['key']] == keys and (v.get('unique', False) or not unique)
+                          for v in info.values())
+
+        redundant = []
+        for index_name, index_keys in sorted(indexes.items()):
+            for other_name, other_keys in indexes.items():
+                if other_name == index_name or len(index_keys) > len(other_keys):
+                    continue
+                if other_keys[:len(index_keys)] != index_keys:
+                    continue
+                # 键完全相同时保留唯一索引(或名称较小者)
+                if len(index_keys) == len(other_keys):
+                    this_unique = info[index_name].get('unique', False)
+                    other_unique = info[other_name].get('unique', False)
+                    if this_unique and not other_unique or this_unique == other_unique and index_name < other_name:
+                        continue
+                elif info[index_name].get('unique', False):
+                    # 唯一约束不能由更长的复合索引替代
+                    continue
+                redundant.append(index_name)
+                break
+
+        if missing or redundant:
+            report[name] = {'missing': missing, 'redundant': redundant}
+
+    return report
@@ -8,11 +8,15 @@
 @Description: MongoDB data service api
 '''
 
-from typing import Any
+from typing import Any, Iterator, List
 
-from pymongo import ASCENDING, DESCENDING, MongoClient
-from pymongo.errors import ConnectionFailure
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
 
+from tpro.api.mongo.bar_table import DEFAULT_TABLE, SCHEMA_SYMBOL, SCHEMA_TIMESERIES, SYMBOL_KEY, BarTable
+from tpro.api.mongo.client import connect_client
+from tpro.api.mongo.frame import cursor_to_frame
+from tpro.api.mongo.indexes import ensure_index
 from tpro.utils import load_json
 
 
@@ -23,14 +27,66 @@ class MongoApi():
     config = "api.json"
 
     def __init__(self):
-        setting = load_json(self.config, 'MongoDB')
-        uri = 'mongodb://{}:{}'.format(setting.get('HOST', '127.0.0.1'), setting.get('PORT', 27017))
+        setting = load_json(self.config, 'MongoDB') or {}
+        self.db_client = connect_client(setting)
 
-        try:
-            self.db_client = MongoClient(uri, serverSelectionTimeoutMS=10)
-            self.db_client.server_info()
-        except ConnectionFailure:
-            self.db_client = None
+        # bar 数据库结构：'symbol' 每个合约一个集合，'single'/'timeseries' 每个周期一个集合
+        self.schema = setting.get('SCHEMA', SCHEMA_SYMBOL)
+        self.table_name = setting.get('TABLE', DEFAULT_TABLE)
+
+    # ------------------------------------------------------------------
+    def bar_table(self, db_name: str):
+        """
+        单一集合结构下返回指定周期数据库的 BarTable，按合约分集合时返回 None
+        """
+        if not self.db_client or self.schema == SCHEMA_SYMBOL:
+            return None
+        return BarTable(self.db_client[db_name], self.table_name, timeseries=self.schema == SCHEMA_TIMESERIES)
+
+    # ------------------------------------------------------------------
+    def query_bars(self, db_name: str, symbol: str, start: Any = None, end: Any = None, fields: List[str] = None):
+        """
+        读取单个合约 [start, end] 区间的 bar 数据为 DataFrame，两种数据库结构通用
+        """
+        table = self.bar_table(db_name)
+        if table is not None:
+            return table.read(symbol, start, end, fields)
+
+        flt = {}
+        if start is not None or end is not None:
+            flt['datetime'] = {k: pd.Timestamp(v).to_pydatetime() for k, v in (('$gte', start), ('$lte', end))
+                               if v is not None}
+        fields = ['datetime'] + [x for x in fields if x != 'datetime'] if fields else None
+        return self.query_frame(db_name, symbol, flt, fields, sort_key='datetime')
+
+    # ------------------------------------------------------------------
+    def query_cross_section(self,
+                            db_name: str,
+                            start: Any,
+                            end: Any = None,
+                            symbols: List[str] = None,
+                            fields: List[str] = None):
+        """
+        读取 [start, end] 区间(end为空时仅 start 时点)多个合约的截面数据，结果含 datetime、symbol 列；
+        单一集合结构下只需一次查询，按合约分集合时逐个集合查询后合并
+        """
+        table = self.bar_table(db_name)
+        if table is not None:
+            return table.cross_section(start, end, symbols, fields)
+
+        if not self.db_client:
+            return pd.DataFrame()
+
+        frames = []
+        for symbol in symbols or self.db_client[db_name].list_collection_names():
+            df = self.query_bars(db_name, symbol, start, start if end is None else end, fields)
+            if not df.empty:
+                df[SYMBOL_KEY] = symbol
+                frames.append(df)
+
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values(['datetime', SYMBOL_KEY]).reset_index(drop=True)
 
     # ------------------------------------------------------------------
     def query(self,
@@ -38,20 +94,100 @@ class MongoApi():
               collection_name: str,
               flt: dict = None,
               sort_key: str = '',
-              direction: int = ASCENDING):
+              direction: int = ASCENDING,
+              projection: Any = None,
+              limit: int = 0):
         """
-        查询数据，flt为查询条件，sort_key为排序关键字，direction为排序方式
+        查询数据，flt为查询条件，sort_key为排序关键字，direction为排序方式，
+        projection为返回字段，limit为最大返回条数(0表示不限)
+        """
+        cursor = self.find(db_name, collection_name, flt, sort_key, direction, projection, limit=limit)
+        return False if cursor is None else list(cursor)
+
+    # ------------------------------------------------------------------
+    def find(self,
+             db_name: str,
+             collection_name: str,
+             flt: dict = None,
+             sort_key: str = '',
+             direction: int = ASCENDING,
+             projection: Any = None,
+             batch_size: int = 0,
+             limit: int = 0,
+             skip: int = 0,
+             hint: Any = None):
+        """
+        返回查询指针，batch_size为每次从服务器获取的文档数，hint为指定使用的索引
         """
         flt = {} if flt is None else flt
 
         assert isinstance(flt, dict), "Invaild query filtering conditions."
 
-        if self.db_client:
-            cl = self.db_client[db_name][collection_name]
-            direction = ASCENDING if direction > 0 else DESCENDING
-            cursor = cl.find(flt).sort(sort_key, direction) if sort_key else cl.find(flt)
-            return list(cursor)
-        return False
+        if not self.db_client:
+            return None
+
+        cl = self.db_client[db_name][collection_name]
+        cursor = cl.find(flt, projection, skip=skip, limit=limit)
+
+        if sort_key:
+            cursor = cursor.sort(sort_key, ASCENDING if direction > 0 else DESCENDING)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if hint:
+            cursor = cursor.hint(hint)
+
+        return cursor
+
+    # ------------------------------------------------------------------
+    def stream(self, db_name: str, collection_name: str, flt: dict = None, **kwargs) -> Iterator[dict]:
+        """
+        逐条惰性返回查询结果，参数同 find
+        """
+        kwargs.setdefault('batch_size', 1000)
+        cursor = self.find(db_name, collection_name, flt, **kwargs)
+
+        if cursor is not None:
+            try:
+                yield from cursor
+            finally:
+                cursor.close()
+
+    # ------------------------------------------------------------------
+    def stream_frames(self,
+                      db_name: str,
+                      collection_name: str,
+                      flt: dict = None,
+                      chunk_size: int = 10000,
+                      fields: List[str] = None,
+                      **kwargs) -> Iterator[pd.DataFrame]:
+        """
+        按块惰性返回查询结果的 DataFrame，fields同时作为查询的返回字段
+        """
+        assert chunk_size > 0, "Invaild chunk size."
+
+        if fields and 'projection' not in kwargs:
+            kwargs['projection'] = dict({k: 1 for k in fields}, _id=int('_id' in fields))
+        kwargs.setdefault('batch_size', chunk_size)
+
+        cursor = self.find(db_name, collection_name, flt, **kwargs)
+
+        if cursor is not None:
+            try:
+                yield from cursor_to_frame(cursor, fields, chunk_size)
+            finally:
+                cursor.close()
+
+    # ------------------------------------------------------------------
+    def query_frame(self, db_name: str, collection_name: str, flt: dict = None, fields: List[str] = None, **kwargs):
+        """
+        查询数据并按列直接构建 DataFrame
+        """
+        if fields and 'projection' not in kwargs:
+            kwargs['projection'] = dict({k: 1 for k in fields}, _id=int('_id' in fields))
+        kwargs.setdefault('batch_size', 10000)
+
+        cursor = self.find(db_name, collection_name, flt, **kwargs)
+        return pd.DataFrame(columns=fields) if cursor is None else cursor_to_frame(cursor, fields)
 
     # ------------------------------------------------------------------
     def insert(self, db_name: str, collection_name: str, data: Any, index_key: str = 'datetime'):
@@ -62,7 +198,7 @@ class MongoApi():
 
         if self.db_client:
             cl = self.db_client[db_name][collection_name]
-            cl.ensure_index([(index_key, ASCENDING)], unique=True)
+            ensure_index(cl, [(index_key, ASCENDING)])
 
             try:
                 if isinstance(data, dict):
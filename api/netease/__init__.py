@@ -0,0 +1,13 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-29 19:40:12
+@LastEditTime: 2019-09-30 07:55:48
+@Description: Asynchronous fetcher of 163.com (NetEase) tick data
+'''
+
+from tpro.api.netease.tick_fetcher import TickFetcher, netease_code, parse_last_tick
+
+__all__ = ['TickFetcher', 'netease_code', 'parse_last_tick']
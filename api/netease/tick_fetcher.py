@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+'''
+@Author: freemoses
+@Since: 2019-09-29 19:40:12
+@LastEditTime: 2019-09-30 07:55:48
+@Description: Asynchronous, concurrency-limited fetcher of 163.com daily tick files
+'''
+
+import asyncio
+import io
+import shelve
+import urllib.request
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+TICK_URL = 'http://quotes.money.163.com/cjmx/{0}/{1}/{2}.xls'
+
+# 逐笔成交明细的字段
+PRICE_COLUMN = '成交价'
+VOLUME_COLUMN = '成交量（手）'
+TURNOVER_COLUMN = '成交额（元）'
+
+
+def netease_code(symbol: str):
+    """
+    将 QuantOS 格式的股票代码(如 600000.SH)转换为网易代码(上海前缀0，深圳前缀1)
+    """
+    code, suffix = symbol.split('.')
+    return ('0' if suffix == 'SH' else '1') + code
+
+
+def _to_tick(header: List[Any], row: List[Any]):
+    values = dict(zip(header, row))
+    return {'price': float(values.get(PRICE_COLUMN, row[1])),
+            'volume': float(values.get(VOLUME_COLUMN, row[3])),
+            'turnover': float(values.get(TURNOVER_COLUMN, row[4]))}
+
+
+def parse_last_tick(content: bytes):
+    """
+    解析逐笔成交文件的最后一笔成交，返回 {'price', 'volume'(手), 'turnover'(元)}，文件无数据时返回 None；
+    xls 为整块的 BIFF 格式，无法只下载或解析末尾：整个文件仍需下载，xlrd 也会解析全部单元格，
+    安装 xlrd 时只是省去构建整张 DataFrame 的开销，减少下载次数依靠 TickFetcher 的硬盘缓存
+    """
+    if not content:
+        return None
+
+    if xlrd is not None:
+        try:
+            sheet = xlrd.open_workbook(file_contents=content, on_demand=True).sheet_by_index(0)
+            if sheet.nrows < 2:
+                return None
+            return _to_tick(sheet.row_values(0), sheet.row_values(sheet.nrows - 1))
+        except xlrd.XLRDError:
+            pass
+
+    df = pd.read_excel(io.BytesIO(content))
+    if df.empty:
+        return None
+    return _to_tick(list(df.columns), df.iloc[-1].tolist())
+
+
+class TickFetcher():
+    """
+    网易逐笔成交数据异步下载器：在后台事件循环中复用连接并发下载，
+    以信号量限制在途请求数，单次请求超时后按指数退避重试；
+    已取得的 (交易日, 代码) 结果缓存在硬盘，重复调整时不再下载。
+    安装 aiohttp 时使用连接池，否则在线程池中以 urllib 下载
+    """
+
+    def __init__(self,
+                 concurrency: int = 8,
+                 timeout: float = 10,
+                 retries: int = 4,
+                 backoff: float = 0.2,
+                 cache_path: str = None):
+        self.concurrency = max(int(concurrency), 1)
+        self.timeout = timeout
+        self.retries = max(int(retries), 1)
+        self.backoff = backoff
+        self.cache_path = cache_path
+
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._semaphore = None
+        self._cache = None
+        self._lock = Lock()
+
+        self.downloaded = 0
+        self.cached = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _cache_key(date: Any, code: str):
+        return '%s/%s' % (pd.Timestamp(date).strftime('%Y%m%d'), code)
+
+    def _open_cache(self):
+        if self._cache is None and self.cache_path:
+            self._cache = shelve.open(self.cache_path)
+        return self._cache
+
+    # ------------------------------------------------------------------
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    # ------------------------------------------------------------------
+    def fetch(self, keys: List[Tuple[Any, str]]):
+        """
+        获取多个 (交易日, 网易代码) 的最后一笔成交，返回与 keys 对应的列表，取不到的为 None
+        """
+        cache_keys = [self._cache_key(d, c) for d, c in keys]
+        result = [None] * len(keys)
+
+        with self._lock:
+            cache = self._open_cache()
+            missing = []
+            for i, k in enumerate(cache_keys):
+                if cache is not None and k in cache:
+                    result[i] = cache[k]
+                    self.cached += 1
+                else:
+                    missing.append(i)
+
+        if not missing:
+            return result
+
+        future = asyncio.run_coroutine_threadsafe(self._fetch_all([keys[i] for i in missing]), self._ensure_loop())
+        ticks = future.result()
+
+        with self._lock:
+            cache = self._open_cache()
+            for i, tick in zip(missing, ticks):
+                result[i] = tick
+                if tick is None:
+                    self.failed += 1
+                    continue
+                self.downloaded += 1
+                if cache is not None:
+                    cache[cache_keys[i]] = tick
+            if cache is not None:
+                cache.sync()
+
+        return result
+
+    # ------------------------------------------------------------------
+    async def _fetch_all(self, keys: List[Tuple[Any, str]]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._session is None and aiohttp is not None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return await asyncio.gather(*[self._fetch_one(date, code) for date, code in keys])
+
+    # ------------------------------------------------------------------
+    async def _fetch_one(self, date: Any, code: str) -> Optional[Dict[str, float]]:
+        date = pd.Timestamp(date)
+        url = TICK_URL.format(date.year, date.strftime('%Y%m%d'), code)
+        delay = self.backoff
+        loop = asyncio.get_event_loop()
+
+        for attempt in range(self.retries):
+            try:
+                async with self._semaphore:
+                    content = await self._download(url)
+                # 解析整个文件较慢，放到线程池中执行，避免阻塞事件循环中的其他请求
+                tick = await loop.run_in_executor(None, parse_last_tick, content)
+                if tick is not None:
+                    return tick
+            except Exception:
+                pass
+
+            if attempt < self.retries - 1:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        return None
+
+    # ------------------------------------------------------------------
+    async def _download(self, url: str):
+        if self._session is None:
+            loop = asyncio.get_event_loop()
+            return await asyncio.wait_for(loop.run_in_executor(None, self._urlopen, url), self.timeout)
+
+        async with self._session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+    def _urlopen(self, url: str):
+        with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+            return resp.read()
+
+    # ------------------------------------------------------------------
+    def close(self):
+        """
+        关闭连接池及后台事件循环，并写入硬盘缓存
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+            session, self._session = self._session, None
+            self._semaphore = None
+
+            if self._cache is not None:
+                self._cache.close()
+                self._cache = None
+
+        if loop is None:
+            return
+
+        if session is not None:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -7,11 +7,12 @@ import time
 import datetime
 
 import requests
-from pymongo import MongoClient, ASCENDING
 
 from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
 
+from QuanTrader.api.mongo import BulkWriter, ensure_index, get_client
+
 
 # 加载配置
 config = open('config.json')
@@ -22,7 +23,7 @@ MONGO_PORT = setting['MONGO_PORT']
 APIKEY = setting['APIKEY']
 SYMBOLS = setting['SYMBOLS']
 
-mc = MongoClient(MONGO_HOST, MONGO_PORT)                        # Mongo连接
+mc = get_client({'HOST': MONGO_HOST, 'PORT': MONGO_PORT})                        # Mongo连接
 db = mc[MINUTE_DB_NAME]                                         # 数据库
 headers = {'X-CoinAPI-Key': APIKEY}
 
@@ -47,13 +48,19 @@ def generateVtBar(symbol, d):
     
     return bar
 
+#----------------------------------------------------------------------
+def reportBulkError(batch, details):
+    """输出批量写入错误"""
+    errors = details.get('writeErrors', [])
+    print(u'第%s批数据写入失败%s条：%s' %(batch, len(errors), errors[:1]))
+
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol, period, start, end):
     """下载某一合约的分钟线数据"""
     startTime = time.time()
     
     cl = db[symbol]                                                 
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         
+    ensure_index(cl)                                                # 添加索引
     
     startDt = datetime.datetime.strptime(start, '%Y%m%d')
     endDt = datetime.datetime.strptime(end, '%Y%m%d')
@@ -73,11 +80,12 @@ def downMinuteBarBySymbol(symbol, period, start, end):
     
     l = resp.json()
         
-    for d in l:
-        bar = generateVtBar(symbol, d)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        for d in l:
+            writer.add(generateVtBar(symbol, d).__dict__)
+
+    if writer.errors:
+        print(u'合约%s共%s条数据写入失败' %(symbol, writer.errors))
         
     endTime = time.time()
     cost = (endTime - startTime) * 1000
@@ -6,11 +6,12 @@ import json
 from datetime import datetime, timedelta
 from time import time, sleep
 
-from pymongo import MongoClient, ASCENDING
 
 from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
 
+from QuanTrader.api.mongo import BulkWriter, ensure_index, get_client
+
 import futuquant as ft
 
 # 加载配置
@@ -21,7 +22,7 @@ MONGO_HOST = setting['MONGO_HOST']
 MONGO_PORT = setting['MONGO_PORT']
 SYMBOLS = setting['SYMBOLS']
 
-mc = MongoClient(MONGO_HOST, MONGO_PORT)        # Mongo连接
+mc = get_client({'HOST': MONGO_HOST, 'PORT': MONGO_PORT})        # Mongo连接
 db = mc[MINUTE_DB_NAME]                         # 数据库
 quote = ft.OpenQuoteContext()                   # 富途行情接口
 today = datetime.now().date()
@@ -47,13 +48,19 @@ def generateVtBar(row):
     
     return bar
 
+#----------------------------------------------------------------------
+def reportBulkError(batch, details):
+    """输出批量写入错误"""
+    errors = details.get('writeErrors', [])
+    print(u'第%s批数据写入失败%s条：%s' %(batch, len(errors), errors[:1]))
+
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol):
     """下载某一合约的分钟线数据"""
     start = time()
 
     cl = db[symbol]
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
+    ensure_index(cl)                                                # 添加索引
     
     code, data = quote.get_history_kline(symbol, start=startDate, ktype='K_1M')
     if code:
@@ -62,11 +69,12 @@ def downMinuteBarBySymbol(symbol):
         
     data = data.sort_index()
     
-    for ix, row in data.iterrows():
-        bar = generateVtBar(row)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)            
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        for ix, row in data.iterrows():
+            writer.add(generateVtBar(row).__dict__)
+
+    if writer.errors:
+        print(u'合约%s共%s条数据写入失败' %(symbol, writer.errors))
 
     end = time()
     cost = (end - start) * 1000
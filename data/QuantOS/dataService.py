@@ -5,22 +5,74 @@
 # @Last Modified by:   Freemoses
 # @Last Modified time: 2019-08-21 21:06:29
 import functools
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from time import sleep
-from collections import OrderedDict
+import numpy as np
 import pandas as pd
+from pymongo.errors import BulkWriteError
 
-from pymongo import ASCENDING, DESCENDING
 from rqalpha.model.instrument import Instrument
 
 from QuanTrader.api.jaqs import DataApi
-from QuanTrader.data.basic import BaseDataService
-from QuanTrader.utils.datetime_func import convert_dt_to_date_int, convert_int_to_date, convert_int_to_datetime
+from QuanTrader.api.netease import TickFetcher, netease_code
+from QuanTrader.data.basic import (BaseDataService, Constant, DateColumn, DateTimeColumn,
+                                   build_documents, compute_limit_prices, forward_fill_close, repair_collection,
+                                   scan_zero_close)
+from QuanTrader.utils import get_temp_file
+from QuanTrader.utils.datetime_func import convert_dt_to_date_int, convert_int_to_date
 
 
 SUFFIX_MAP = {"XSHE": "SZ", "XSHG": "SH", "CFFEX": "CFE", "CZCE": "CZC",
               "DCE": "DCE", "SHFE": "SHF", "SGEX": "SGE"}
 SUFFIX_MAP_REVERSE = {v: k for k, v in SUFFIX_MAP.items()}
 
+# 日线数据字段映射
+DAY_BAR_SPEC = [
+    ('datetime', DateColumn('trade_date')),
+    ('open', 'open'),
+    ('high', 'high'),
+    ('low', 'low'),
+    ('close', 'close'),
+    ('volume', 'volume'),
+    ('total_turnover', 'turnover'),
+    ('limit_up', 'limit_up'),
+    ('limit_down', 'limit_down'),
+    ('open_interest', 'oi'),                    # 【期货专用】 持仓量
+    ('settlement', 'settle'),                   # 【期货专用】 结算价
+]
+
+# 分钟线数据字段映射
+MINUTE_BAR_SPEC = [
+    ('datetime', DateTimeColumn('trade_date', 'time')),
+    ('open', 'open'),
+    ('high', 'high'),
+    ('low', 'low'),
+    ('close', 'close'),
+    ('volume', 'volume'),
+    ('total_turnover', 'turnover'),
+    ('open_interest', 'oi'),                    # 【期货专用】 当前持仓量
+]
+
+# 每日因子数据字段映射
+DAILY_FACTOR_SPEC = [
+    ('datetime', DateColumn('trade_date')),
+    ('close', 'close'),                         # 收盘价
+    ('turnover_rate', 'turnover_ratio'),        # 换手率
+    ('adj_factor', 'adjust_factor'),            # 复权因子
+    ('pe', 'pe'),                               # 市盈率(总市值/净利润)
+    ('pe_ttm', 'pe_ttm'),                       # 市盈率(TTM)
+    ('pb', 'pb'),                               # 市净率(总市值/净资产)
+    ('ps', 'ps'),                               # 市销率
+    ('ps_ttm', 'ps_ttm'),                       # 市销率(TTM)
+    ('total_share', 'total_share'),             # 总股本(万)
+    ('float_share', 'float_share'),             # 流通股本(万)
+    ('total_mv', 'total_mv'),                   # 总市值(万元)
+    ('float_mv', 'float_mv'),                   # 流通市值(万元)
+    ('from', Constant('QuantOS')),
+]
+
 
 def trans_suffix(instrument):
     """转换交易所编码后缀"""
@@ -53,15 +105,30 @@ class DataService(BaseDataService):
         super(DataService, self).__init__()
 
         self._api = None
+        self._login_lock = Lock()
+
+        self._prefetched = {}           # 批量预取的数据 {(类型, 合约): (起始日期, 数据)}
+
+        self._ticks = None              # 网易逐笔成交下载器
+        self._ticks_lock = Lock()
+
+        self._downloader = None         # 各工作线程共享的分钟线下载线程池
+        self._downloader_lock = Lock()
+        self._minute_concurrency = max(int(self._setting.get('QuantOS', {}).get('MINUTE_CONCURRENCY', 8)), 1)
 
     # ------------------------------------------------------------------
     def ensure_api_login(func):
         @functools.wraps(func)
         def wrapper(self, *args, **kwargs):
+            self.throttle()
             try:
                 return func(self, *args, **kwargs)
             except:
-                self.api_login(self._setting.get('QuantOS', {}))
+                api = self._api
+                with self._login_lock:
+                    # 其他工作线程已重新登录时无需重复登录
+                    if self._api is api:
+                        self.api_login(self._setting.get('QuantOS', {}))
                 return func(self, *args, **kwargs)
         return wrapper
 
@@ -89,26 +156,42 @@ class DataService(BaseDataService):
                 else:
                     sleep(_retry)
 
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _split_daily_frame(df, symbols):
+        """将多合约日频数据按合约拆分并去重、排序，未返回数据的合约对应空 DataFrame"""
+        result = {symbol: pd.DataFrame() for symbol in symbols}
+
+        if isinstance(df, pd.DataFrame) and not df.empty:
+            for symbol, group in df.groupby('symbol', sort=False):
+                group = group.drop_duplicates(['trade_date'], keep='last')  # 去重
+                group = group.sort_values(by=['trade_date'])                # 排序
+                result[symbol] = group.reset_index(drop=True)               # 重建索引
+
+        return result
+
     # ------------------------------------------------------------------
     @ensure_api_login
-    def _get_day_bar(self, symbol, start_date, end_date):
-        """下载指定合约日线数据"""
-        df, msg = self._api.daily(symbol=symbol,
+    def _get_day_bars(self, symbols, start_date, end_date):
+        """
+         批量下载多个合约日线数据
+
+         :param list[str] symbols: 合约代码列表(QuantOS格式)
+         :return: dict{symbol: pd.DataFrame}
+        """
+        df, msg = self._api.daily(symbol=','.join(symbols),
                                   freq='1d',
                                   start_date=str(start_date.date()),
                                   end_date=str(end_date.date()),
                                   data_format='pandas')
 
-        if isinstance(df, pd.DataFrame) and not df.empty:
-            df.drop_duplicates(['trade_date'], keep='last', inplace=True)  # 去重
-            df.sort_values(by=['trade_date'], inplace=True)                # 排序
-            df = df.reset_index(drop=True)                                 # 重建索引
-
-            df['limit_up'] = df['preclose'] * 1.1
-            df['limit_down'] = df['preclose'] * 0.9
-            return df
+        result = self._split_daily_frame(df, symbols)
+        return {k: compute_limit_prices(v, 0.1) if not v.empty else v for k, v in result.items()}
 
-        return pd.DataFrame()
+    # ------------------------------------------------------------------
+    def _get_day_bar(self, symbol, start_date, end_date):
+        """下载指定合约日线数据"""
+        return self._get_day_bars([symbol], start_date, end_date)[symbol]
 
     # ------------------------------------------------------------------
     @ensure_api_login
@@ -142,37 +225,102 @@ class DataService(BaseDataService):
 
     # ------------------------------------------------------------------
     @ensure_api_login
-    def _get_daily_indicator(self, symbol, start_date, end_date):
-        """下载指定合约每日指标数据"""
+    def _get_daily_indicators(self, symbols, start_date, end_date):
+        """批量下载多个合约每日指标数据"""
         df, msg = self._api.query(view="lb.secDailyIndicator",
                                   fields="trade_date,close,turnover_ratio,pe,pe_ttm,pb,ps,ps_ttm,total_share,float_share,total_mv,float_mv",
                                   filter="symbol={0}&start_date={1}&end_date={2}".format(
-                                      symbol, convert_dt_to_date_int(start_date), convert_dt_to_date_int(end_date)),
+                                      ','.join(symbols), convert_dt_to_date_int(start_date), convert_dt_to_date_int(end_date)),
                                   data_format='pandas')
 
-        if isinstance(df, pd.DataFrame) and not df.empty:
-            df.drop_duplicates(['trade_date'], keep='last', inplace=True)  # 去重
-            df.sort_values(by=['trade_date'], inplace=True)               # 排序
-            return df.reset_index(drop=True)                              # 重建索引
-
-        return pd.DataFrame()
+        return self._split_daily_frame(df, symbols)
 
     # ------------------------------------------------------------------
     @ensure_api_login
-    def _get_adjust_factor(self, symbol, start_date, end_date):
-        """下载指定合约复权因子数据"""
+    def _get_adjust_factors(self, symbols, start_date, end_date):
+        """批量下载多个合约复权因子数据"""
         df, msg = self._api.query(view="jy.secAdjFactor",
                                   fields="trade_date,adjust_factor",
                                   filter="symbol={0}&start_date={1}&end_date={2}".format(
-                                      symbol, convert_dt_to_date_int(start_date), convert_dt_to_date_int(end_date)),
+                                      ','.join(symbols), convert_dt_to_date_int(start_date), convert_dt_to_date_int(end_date)),
                                   data_format='pandas')
 
-        if isinstance(df, pd.DataFrame) and not df.empty:
-            df.drop_duplicates(['trade_date'], keep='last', inplace=True)  # 去重
-            df.sort_values(by=['trade_date'], inplace=True)               # 排序
-            return df.reset_index(drop=True)                              # 重建索引
+        return self._split_daily_frame(df, symbols)
+
+    # ------------------------------------------------------------------
+    def _start_date(self, cl, default):
+        """根据集合中最后一条数据的时间确定起始更新日期"""
+        last_dt = self.last_datetime(cl)
+        return self.get_next_trading_date(last_dt) if last_dt else default
+
+    # ------------------------------------------------------------------
+    def prepare_update(self, daily_db, minute_db, factor_db, instruments, end_date):
+        """按起始日期分组，跨合约批量预取日线及每日指标数据"""
+        config = self._setting.get('QuantOS', {})
+        batch_size = max(int(config.get('BATCH_SIZE', 100)), 1)
+        max_days = int(config.get('BATCH_MAX_DAYS', 20))
+
+        def _batchable(start_date):
+            # 初次下载的长区间数据量过大，仍逐个合约下载
+            return start_date <= end_date and len(self.get_trading_dates(start_date, end_date)) <= max_days
+
+        self._prefetched = {}
+        day_groups, factor_groups = defaultdict(list), defaultdict(list)
+
+        for instrument in instruments:
+            if not self._active:
+                return
+            if not self.is_updatable(instrument, end_date):
+                continue
+
+            symbol = trans_suffix(instrument)
+
+            start_date = self._start_date(daily_db[symbol], instrument.listed_date)
+            if _batchable(start_date):
+                day_groups[start_date].append(symbol)
+
+            if instrument.type == 'CS':
+                start_date = self._start_date(factor_db[symbol], instrument.listed_date)
+                if _batchable(start_date):
+                    factor_groups[start_date].append(symbol)
+
+        for start_date, symbols in day_groups.items():
+            for i in range(0, len(symbols), batch_size):
+                for symbol, df in self._get_day_bars(symbols[i:i + batch_size], start_date, end_date).items():
+                    self._prefetched[('day', symbol)] = (start_date, df)
 
-        return pd.DataFrame()
+        for start_date, symbols in factor_groups.items():
+            for i in range(0, len(symbols), batch_size):
+                batch = symbols[i:i + batch_size]
+                indicators = self._get_daily_indicators(batch, start_date, end_date)
+                adjfactors = self._get_adjust_factors(batch, start_date, end_date)
+
+                for symbol in batch:
+                    self._prefetched[('factor', symbol)] = (start_date, (indicators[symbol], adjfactors[symbol]))
+
+        self.writeLog('批量预取数据完成：日线 %d 个合约，每日指标 %d 个合约' % (
+            sum(len(x) for x in day_groups.values()), sum(len(x) for x in factor_groups.values())))
+
+    # ------------------------------------------------------------------
+    def _take_prefetched(self, kind, symbol, start_date):
+        """取出预取的数据，起始日期不一致时视为未预取"""
+        item = self._prefetched.pop((kind, symbol), None)
+        if item is not None and item[0] == start_date:
+            return item[1]
+        return None
+
+    # ------------------------------------------------------------------
+    def bar_symbol(self, instrument):
+        return trans_suffix(instrument)
+
+    # ------------------------------------------------------------------
+    def is_instrument_up_to_date(self, daily_db, minute_db, factor_db, instrument, end_date):
+        symbol = trans_suffix(instrument)
+
+        if not (self.is_up_to_date(daily_db, symbol, end_date) and self.is_up_to_date(minute_db, symbol, end_date)):
+            return False
+
+        return instrument.type != 'CS' or self.is_up_to_date(factor_db, symbol, end_date)
 
     # ------------------------------------------------------------------
     def update_day_bar(self, db, instrument, end_date):
@@ -186,38 +334,77 @@ class DataService(BaseDataService):
         if self._active:
             symbol = trans_suffix(instrument)
             cl = db[symbol]
-            last_record = cl.find_one(sort=[('datetime', DESCENDING)])
-
-            start_date = self.get_next_trading_date(last_record['datetime']) if last_record else instrument.listed_date
+            start_date = self._start_date(cl, instrument.listed_date)
 
             if start_date <= end_date:
-                datas = self._get_day_bar(symbol, start_date, end_date)
+                datas = self._take_prefetched('day', symbol, start_date)
+                if datas is None:
+                    datas = self._get_day_bar(symbol, start_date, end_date)
 
                 if not datas.empty:
                     # 针对ST股票及科创板股票调整涨跌幅
                     if instrument.type == 'CS':
-                        _is_st = self.is_st_stock(instrument.order_book_id, datas['trade_date'].tolist())
-                        datas.loc[_is_st, 'limit_up'] = datas.loc[_is_st, 'preclose'] * 1.05
-                        datas.loc[_is_st, 'limit_down'] = datas.loc[_is_st, 'preclose'] * 0.95
+                        ratio = np.full(len(datas), 0.1)
+                        ratio[self.is_st_stock(instrument.order_book_id, datas['trade_date'].tolist())] = 0.05
 
                         if instrument.board_type == 'KSH':
-                            datas['limit_up'] = datas['preclose'] * 1.2
-                            datas['limit_down'] = datas['preclose'] * 0.8
+                            ratio[:] = 0.2
+
+                        compute_limit_prices(datas, ratio)
 
                     # 更新到数据库
-                    cl.ensure_index([('datetime', ASCENDING)], unique=True)
+                    _bars = build_documents(datas, DAY_BAR_SPEC)
+                    self.save_bars(cl, _bars)
+
+    # ------------------------------------------------------------------
+    def _minute_bar_dates(self, instrument, start_date, end_date):
+        """获取区间内合约未停牌的全部交易日"""
+        dates = self.get_trading_dates(start_date, end_date)
+
+        if len(dates) == 0:
+            return dates
+
+        date_ints = self.get_trading_dates_int(start_date, end_date).tolist()
+        suspended = np.asarray(self.is_suspended(instrument.order_book_id, date_ints), dtype=bool)
+
+        return dates[~suspended]
 
-                    _bars = []
+    # ------------------------------------------------------------------
+    def _minute_downloader(self):
+        """
+         各工作线程共享的分钟线下载线程池，MINUTE_CONCURRENCY 为全部合约同时下载的交易日总数上限，配置例如：
+         "QuantOS": {"MINUTE_CONCURRENCY": 8}
+        """
+        with self._downloader_lock:
+            if self._downloader is None:
+                self._downloader = ThreadPoolExecutor(max_workers=self._minute_concurrency)
+            return self._downloader
 
-                    for _, row in datas.iterrows():
-                        bar = self._generate_day_bar(row)
-                        _bars.append(bar)
+    # ------------------------------------------------------------------
+    def _iter_minute_bars(self, symbol, dates):
+        """流水线并发下载多个交易日的分钟线数据，按日期顺序逐日返回 (trade_date, DataFrame)"""
+        executor = self._minute_downloader()
+        pending = deque()
+
+        try:
+            for trade_date in dates:
+                if not self._active:
+                    break
+
+                pending.append((trade_date, executor.submit(self._get_minute_bar, symbol, trade_date)))
 
-                    if _bars:
-                        cl.insert_many(_bars)
+                # 限制单个合约的在途请求数量，避免长区间回补时积压过多数据
+                if len(pending) >= self._minute_concurrency:
+                    trade_date, future = pending.popleft()
+                    yield trade_date, future.result()
 
-            if cl.count() == 0:
-                cl.drop()
+            while pending:
+                trade_date, future = pending.popleft()
+                yield trade_date, future.result()
+        finally:
+            # 中途退出时取消尚未开始的请求
+            for _, future in pending:
+                future.cancel()
 
     # ------------------------------------------------------------------
     def update_minute_bar(self, db, instrument, end_date):
@@ -228,41 +415,34 @@ class DataService(BaseDataService):
          :param Instrument instrument: 合约对象
          :param datetime.datetime end_date: 更新日期
         """
-        # TODO: 获取非停牌日期的Series，从而避免无效数据申请
         if self._active:
             symbol = trans_suffix(instrument)
             cl = db[symbol]
-            last_record = cl.find_one(sort=[('datetime', DESCENDING)])
 
-            start_date = self.get_next_trading_date(last_record['datetime']) if last_record else max(
-                convert_int_to_date(20110104), instrument.listed_date)
+            start_date = self._start_date(cl, max(convert_int_to_date(20110104), instrument.listed_date))
 
-            while start_date <= end_date and self._active:
-                if self.is_trading_date(start_date) and not self.is_suspended(instrument.order_book_id, start_date)[0]:
-                    datas = self._get_minute_bar(symbol, start_date)
-                else:
-                    start_date = self.get_next_trading_date(start_date)
-                    continue
-
-                datas = datas if datas.loc[datas['close'] ==
-                                           0].empty else self._get_vaild_minute_bars(symbol, start_date, datas)
+            if start_date > end_date:
+                return
 
-                # 更新到数据库
-                cl.ensure_index([('datetime', ASCENDING)], unique=True)
+            dates = self._minute_bar_dates(instrument, start_date, end_date)
 
-                _bars = []
+            if len(dates) > 20:
+                self.writeLog('回补 %s 分钟线数据：%s 至 %s，共 %d 个交易日' % (
+                    symbol, dates[0].date(), dates[-1].date(), len(dates)))
 
-                for _, row in datas.iterrows():
-                    bar = self._generate_minute_bar(row)
-                    _bars.append(bar)
+            for trade_date, datas in self._iter_minute_bars(symbol, dates):
+                if not self._active:
+                    break
 
-                if _bars:
-                    cl.insert_many(_bars)
+                if datas.empty:
+                    continue
 
-                start_date = self.get_next_trading_date(start_date)
+                if not datas.loc[datas['close'] == 0].empty:
+                    datas = self._get_vaild_minute_bars(symbol, trade_date, datas)
 
-            if cl.count() == 0:
-                cl.drop()
+                # 更新到数据库
+                _bars = build_documents(datas, MINUTE_BAR_SPEC)
+                self.save_bars(cl, _bars)
 
     # ------------------------------------------------------------------
     def update_daily_factor(self, db, instrument, end_date):
@@ -276,13 +456,15 @@ class DataService(BaseDataService):
         if self._active and instrument.type == 'CS':
             symbol = trans_suffix(instrument)
             cl = db[symbol]
-            last_record = cl.find_one(sort=[('datetime', DESCENDING)])
-
-            start_date = self.get_next_trading_date(last_record['datetime']) if last_record else instrument.listed_date
+            start_date = self._start_date(cl, instrument.listed_date)
 
             if start_date <= end_date:
-                indicators = self._get_daily_indicator(symbol, start_date, end_date)
-                adjfactors = self._get_adjust_factor(symbol, start_date, end_date)
+                prefetched = self._take_prefetched('factor', symbol, start_date)
+                if prefetched is None:
+                    indicators = self._get_daily_indicators([symbol], start_date, end_date)[symbol]
+                    adjfactors = self._get_adjust_factors([symbol], start_date, end_date)[symbol]
+                else:
+                    indicators, adjfactors = prefetched
 
                 if indicators.empty or adjfactors.empty:
                     return
@@ -294,78 +476,8 @@ class DataService(BaseDataService):
                 datas.dropna(subset=['symbol'], inplace=True)
 
                 # 更新到数据库
-                cl.ensure_index([('datetime', ASCENDING)], unique=True)
-
-                _bars = []          # 暂存bar的列表
-
-                for _, row in datas.iterrows():
-                    bar = self._generate_daily_factor(row)
-                    _bars.append(bar)
-
-                if _bars:
-                    cl.insert_many(_bars)
-
-            if cl.count() == 0:
-                cl.drop()
-
-    # ------------------------------------------------------------------
-    def _generate_day_bar(self, row):
-        bar = OrderedDict()
-        bar['datetime'] = convert_int_to_date(row.trade_date)
-
-        bar['open'] = row.open
-        bar['high'] = row.high
-        bar['low'] = row.low
-
-        bar['close'] = row.close
-        bar['volume'] = row.volume
-        bar['total_turnover'] = row.turnover
-
-        bar['limit_up'] = row.limit_up
-        bar['limit_down'] = row.limit_down
-
-        bar['open_interest'] = row.oi               # 【期货专用】 持仓量
-        bar['settlement'] = row.settle              # 【期货专用】 结算价
-
-        return bar
-
-    # ------------------------------------------------------------------
-    def _generate_minute_bar(self, row):
-        bar = OrderedDict()
-        bar['datetime'] = convert_int_to_datetime(row.trade_date * 1000000 + row.time)
-
-        bar['open'] = row.open
-        bar['high'] = row.high
-        bar['low'] = row.low
-        bar['close'] = row.close
-        bar['volume'] = row.volume
-        bar['total_turnover'] = row.turnover
-
-        bar['open_interest'] = row.oi               # 【期货专用】 当前持仓量
-
-        return bar
-
-    # ------------------------------------------------------------------
-    def _generate_daily_factor(self, row):
-        bar = OrderedDict()
-        bar['datetime'] = convert_int_to_date(row.trade_date)
-
-        bar['close'] = row.close                        # 收盘价
-        bar['turnover_rate'] = row.turnover_ratio       # 换手率
-        bar['adj_factor'] = row.adjust_factor           # 复权因子
-        bar['pe'] = row.pe                              # 市盈率(总市值/净利润)
-        bar['pe_ttm'] = row.pe_ttm                      # 市盈率(TTM)
-        bar['pb'] = row.pb                              # 市净率(总市值/净资产)
-        bar['ps'] = row.ps                              # 市销率
-        bar['ps_ttm'] = row.ps_ttm                      # 市销率(TTM)
-        bar['total_share'] = row.total_share            # 总股本(万)
-        bar['float_share'] = row.float_share            # 流通股本(万)
-        bar['total_mv'] = row.total_mv                  # 总市值(万元)
-        bar['float_mv'] = row.float_mv                  # 流通市值(万元)
-
-        bar['from'] = 'QuantOS'
-
-        return bar
+                _bars = build_documents(datas, DAILY_FACTOR_SPEC)
+                self.save_bars(cl, _bars)
 
     # ------------------------------------------------------------------
     def _get_vaild_minute_bars(self, symbol, trade_date, datas=None):
@@ -377,15 +489,38 @@ class DataService(BaseDataService):
         if df.empty or datas.empty:
             return datas
 
-        if datas.iloc[0]['close'] == 0:
-            datas.loc[0, ['open', 'high', 'low', 'close']] = df.iloc[0]['preclose']
-
-        for row in range(1, len(datas)):
-            if datas.iloc[row]['close'] == 0:
-                datas.loc[row, ['open', 'high', 'low', 'close']] = datas.iloc[row - 1]['close']
+        forward_fill_close(datas, df.iloc[0]['preclose'])
 
         return datas
 
+    # ------------------------------------------------------------------
+    def _tick_fetcher(self):
+        """
+         共享的网易逐笔成交下载器，配置例如：
+         "QuantOS": {"TICK": {"CONCURRENCY": 8, "TIMEOUT": 10, "RETRY": 4}}
+        """
+        with self._ticks_lock:
+            if self._ticks is None:
+                _setting = self._setting.get('QuantOS', {}).get('TICK', {})
+                self._ticks = TickFetcher(concurrency=_setting.get('CONCURRENCY', 8),
+                                          timeout=_setting.get('TIMEOUT', 10),
+                                          retries=_setting.get('RETRY', 4),
+                                          cache_path=get_temp_file('netease_ticks.qt'))
+            return self._ticks
+
+    # ------------------------------------------------------------------
+    def exit(self):
+        super(DataService, self).exit()
+
+        with self._downloader_lock:
+            downloader, self._downloader = self._downloader, None
+        if downloader is not None:
+            downloader.shutdown(wait=False)
+
+        if self._ticks is not None:
+            self._ticks.close()
+            self._ticks = None
+
     # ------------------------------------------------------------------
     def adjust_minute_bar(self, db, instrument, end_date, prev_nday=5):
         """
@@ -396,52 +531,36 @@ class DataService(BaseDataService):
          :param datetime.datetime end_date: 更新日期
          :param int prev_nday: 向前调整 n 日分钟线数据(默认为5天)
         """
-        # TODO: 实现超时控制功能
-        def _get_last_bar(url, max_retry=10):
-            _try = max_retry
-            while _try > 0:
-                _try -= 1
-                sleep(0.1)
-                try:
-                    tick_bars = pd.read_excel(url)
-                    if tick_bars.empty:
-                        continue
-                    else:
-                        return tick_bars.iloc[-1]
-                except:
-                    if _try == 0:
-                        break
-                    else:
-                        continue
-            return pd.DataFrame()
-
         symbol = trans_suffix(instrument)
         cl = db[symbol]
+        code = netease_code(symbol)
 
-        code, suffix = symbol.split('.')
-        code = '0' + code if suffix == 'SH' else '1' + code
+        # 最近 prev_nday 个交易日(由远及近)收盘 bar 中成交量为 0 的记录
+        t_dates = self.get_previous_trading_dates([end_date] * prev_nday, np.arange(prev_nday - 1, -1, -1))
+        t_dates = [t_date.replace(hour=15).to_pydatetime() for t_date in t_dates]
+        records = sorted(cl.find({'datetime': {'$in': t_dates}, 'volume': 0}), key=lambda x: x['datetime'])
 
-        while prev_nday > 0:
-            prev_nday -= 1
-            t_date = self.get_previous_trading_date(end_date, prev_nday).replace(hour=15)
-            record = cl.find_one({'datetime': t_date})
+        if not records:
+            return
 
-            if record is None or record['volume'] > 0:
-                continue
+        ticks = self._tick_fetcher().fetch([(x['datetime'], code) for x in records])
+        adjusted = []
 
-            url = 'http://quotes.money.163.com/cjmx/{0}/{1}/{2}.xls'.format(
-                t_date.year, convert_dt_to_date_int(t_date), code)
+        for record, last_tick in zip(records, ticks):
+            if last_tick is None:
+                continue
 
-            last_bar = _get_last_bar(url)
+            record['close'] = round(last_tick['price'], ndigits=2)
+            record['high'] = max(record['high'], record['close'])
+            record['low'] = min(record['low'], record['close'])
+            record['volume'] = last_tick['volume'] * 100.0
+            record['total_turnover'] = round(last_tick['turnover'], ndigits=2)
 
-            if isinstance(last_bar, pd.Series) and not last_bar.empty:
-                record['close'] = round(last_bar['成交价'] * 1.0, ndigits=2)
-                record['high'] = max(record['high'], record['close'])
-                record['low'] = min(record['low'], record['close'])
-                record['volume'] = last_bar['成交量（手）'] * 100.0
-                record['total_turnover'] = round(last_bar['成交额（元）'] * 1.0, ndigits=2)
+            cl.update_one({'datetime': record['datetime']}, {'$set': record})
+            adjusted.append(record['datetime'])
 
-                cl.update_one({'datetime': t_date}, {'$set': record})
+        if adjusted:
+            self.mark_rewritten(cl, adjusted[0])
 
     # ------------------------------------------------------------------
     def fix_minute_bar(self):
@@ -451,28 +570,36 @@ class DataService(BaseDataService):
         if _conn is None:
             return
         else:
-            minute_db = _conn['minute_db']
+            minute_db = self.bar_db(_conn['minute_db'])
 
         self.writeLog('开始修复分钟线数据库...')
 
-        for symbol in sorted([x for x in minute_db.list_collection_names() if x.endswith(('SH', 'SZ'))]):
-            cl = minute_db[symbol]
-            invaild_datas = cl.find({'close': 0})
+        symbols = sorted([x for x in minute_db.list_collection_names() if x.endswith(('SH', 'SZ'))])
+        invaild = scan_zero_close(minute_db, symbols)
+        repaired = set()
 
-            if invaild_datas.count() > 0:
-                print('%s: %d' % (symbol, invaild_datas.count()))
-                fix_dates = set()
-                cl.ensure_index([('datetime', ASCENDING)], unique=True)
+        for symbol, days in sorted(invaild.items()):
+            self.writeLog('%s: %d 个交易日共 %d 条无效数据' % (symbol, len(days), sum(days.values())))
 
-                for x in invaild_datas:
-                    fix_dates.add(x['datetime'].replace(hour=0, minute=0, second=0))
-
-                for fix_date in sorted(fix_dates):
-                    vaild_datas = self._get_vaild_minute_bars(symbol, fix_date)
-
-                    for _, row in vaild_datas.iterrows():
-                        bar = self._generate_minute_bar(row)
-                        cl.replace_one({'datetime': bar['datetime']}, bar, True)
+            try:
+                # 一次下载覆盖全部待修复交易日的日线，取各日昨收价
+                df = self._get_day_bar(symbol, min(days), max(days))
+                seeds = {} if df.empty else dict(zip(pd.to_datetime(df['trade_date'].astype(str)), df['preclose']))
+
+                if repair_collection(minute_db[symbol], list(days), seeds):
+                    self.mark_rewritten(minute_db[symbol], min(days))
+                    repaired.add(symbol)
+            except BulkWriteError as e:
+                # 无序批量写入时其余文档已写回
+                self.writeLog('修复 %s 分钟线数据时 %d 条写入失败： %s' %
+                              (symbol, len(e.details.get('writeErrors', [])), e.details.get('writeErrors', [])[:1]))
+                self.mark_rewritten(minute_db[symbol], min(days))
+                repaired.add(symbol)
+            except Exception as e:
+                self.writeLog('修复 %s 分钟线数据时出现错误： %s' % (symbol, e))
+
+        # 被修复的合约从修复处起重新合成 N 分钟线
+        if repaired and self._setting.get('Resample', {}).get('ENABLED', False):
+            self.resample_minute_bars(_conn, [x for x in self.get_stock_contracts() if self.bar_symbol(x) in repaired])
 
         self.writeLog('分钟线数据库修复完毕！')
-        _conn.close()
@@ -6,7 +6,6 @@ import json
 from datetime import datetime
 from time import time, sleep
 
-from pymongo import MongoClient, ASCENDING
 import pandas as pd
 
 from vnpy.trader.vtObject import VtBarData, VtTickData
@@ -16,11 +15,14 @@ from vnpy.trader.app.ctaStrategy.ctaBase import (MINUTE_DB_NAME,
 
 import rqdatac as rq
 
+from QuanTrader.api.mongo import BulkWriter, ensure_index, get_client
+from QuanTrader.data.basic import Constant, Formatted, IndexColumn, build_documents
+
 # 加载配置
 config = open('config.json')
 setting = json.load(config)
 
-mc = MongoClient()                  # Mongo连接
+mc = get_client()                   # Mongo连接
 dbMinute = mc[MINUTE_DB_NAME]       # 数据库
 dbDaily = mc[DAILY_DB_NAME]
 dbTick = mc[TICK_DB_NAME]
@@ -31,23 +33,30 @@ rq.init(USERNAME, PASSWORD)
 
 FIELDS = ['open', 'high', 'low', 'close', 'volume']
 
+# K线数据字段映射(rqdatac 返回以 datetime 为索引的 DataFrame)
+BAR_SPEC = [
+    ('open', 'open'),
+    ('high', 'high'),
+    ('low', 'low'),
+    ('close', 'close'),
+    ('volume', 'volume'),
+    ('datetime', IndexColumn()),
+    ('date', Formatted(IndexColumn(), '%Y%m%d')),
+    ('time', Formatted(IndexColumn(), '%H:%M:%S')),
+]
+
+
 #----------------------------------------------------------------------
-def generateVtBar(row, symbol):
-    """生成K线"""
-    bar = VtBarData()
-    
-    bar.symbol = symbol
-    bar.vtSymbol = symbol
-    bar.open = row['open']
-    bar.high = row['high']
-    bar.low = row['low']
-    bar.close = row['close']
-    bar.volume = row['volume']
-    bar.datetime = row.name
-    bar.date = bar.datetime.strftime("%Y%m%d")
-    bar.time = bar.datetime.strftime("%H:%M:%S")
-    
-    return bar
+def reportBulkError(batch, details):
+    """输出批量写入错误"""
+    errors = details.get('writeErrors', [])
+    print(u'第%s批数据写入失败%s条：%s' %(batch, len(errors), errors[:1]))
+
+#----------------------------------------------------------------------
+def generateVtBars(df, symbol):
+    """整列生成K线数据字典"""
+    spec = BAR_SPEC + [('symbol', Constant(symbol)), ('vtSymbol', Constant(symbol))]
+    return build_documents(df, spec, defaults=VtBarData().__dict__)
 
 #----------------------------------------------------------------------
 def generateVtTick(row, symbol):
@@ -99,15 +108,12 @@ def downloadMinuteBarBySymbol(symbol):
     start = time()
 
     cl = dbMinute[symbol]
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
+    ensure_index(cl)                                                # 添加索引
     
     df = rq.get_price(symbol, frequency='1m', fields=FIELDS)
     
-    for ix, row in df.iterrows():
-        bar = generateVtBar(row, symbol)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)            
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        writer.extend(generateVtBars(df, symbol))
 
     end = time()
     cost = (end - start) * 1000
@@ -120,15 +126,12 @@ def downloadDailyBarBySymbol(symbol):
     start = time()
 
     cl = dbDaily[symbol]
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
+    ensure_index(cl)                                                # 添加索引
     
     df = rq.get_price(symbol, frequency='1d', fields=FIELDS, end_date=datetime.now().strftime('%Y%m%d'))
     
-    for ix, row in df.iterrows():
-        bar = generateVtBar(row, symbol)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)            
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        writer.extend(generateVtBars(df, symbol))
 
     end = time()
     cost = (end - start) * 1000
@@ -141,18 +144,16 @@ def downloadTickBySymbol(symbol, date):
     start = time()
 
     cl = dbTick[symbol]
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
+    ensure_index(cl)                                                # 添加索引
     
     df = rq.get_price(symbol, 
                       frequency='tick', 
                       start_date=date, 
                       end_date=date)
     
-    for ix, row in df.iterrows():
-        tick = generateVtTick(row, symbol)
-        d = tick.__dict__
-        flt = {'datetime': tick.datetime}
-        cl.replace_one(flt, d, True)            
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        for ix, row in df.iterrows():
+            writer.add(generateVtTick(row, symbol).__dict__)
 
     end = time()
     cost = (end - start) * 1000
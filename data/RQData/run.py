@@ -10,13 +10,14 @@ from threading import Thread
 from collections import OrderedDict
 
 import qdarkstyle
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure
+from pymongo import ASCENDING, DESCENDING
 
 from vnpy.trader.uiQt import QtCore, QtWidgets, QtGui
 from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME, DAILY_DB_NAME
 
+from QuanTrader.api.mongo import BulkWriter, connect_client
+
 
 DAY_START = time(9, 0)         # 日盘启动和停止时间
 DAY_END = time(15, 15)
@@ -58,16 +59,15 @@ class RqDataManager(QtWidgets.QWidget):
     # ----------------------------------------------------------------------
     def connectMongo(self):
         """连接数据库"""
-        try:
-            self.client = MongoClient(serverSelectionTimeoutMS=10)
-            self.client.server_info()
-            self.writeLog(u'MongoDB连接成功')
-            return True
-        except ConnectionFailure:
-            self.client = None
+        self.client = connect_client()
+
+        if self.client is None:
             self.writeLog(u'MongoDB连接失败')
             return False
 
+        self.writeLog(u'MongoDB连接成功')
+        return True
+
     # ----------------------------------------------------------------------
     def initUi(self):
         """初始化界面"""
@@ -175,11 +175,9 @@ class RqDataManager(QtWidgets.QWidget):
                                end_date=datetime.now())
 
         # 插入到数据库
-        for ix, row in df.iterrows():
-            bar = self.generateBar(row, localSymbol)
-            d = bar.__dict__
-            flt = {'datetime': bar.datetime}
-            collection.replace_one(flt, d, True)
+        with BulkWriter(collection, on_error=self.reportBulkError) as writer:
+            for ix, row in df.iterrows():
+                writer.add(self.generateBar(row, localSymbol).__dict__)
 
         self.writeLog(u'%s数据更新完成：%s - %s' % (localSymbol, df.index[0], df.index[-1]))
 
@@ -201,6 +199,12 @@ class RqDataManager(QtWidgets.QWidget):
 
         return bar
 
+    # ----------------------------------------------------------------------
+    def reportBulkError(self, batch, details):
+        """记录批量写入错误"""
+        errors = details.get('writeErrors', [])
+        self.writeLog(u'第%s批数据写入失败%s条：%s' % (batch, len(errors), errors[:1]))
+
     # ----------------------------------------------------------------------
     def writeLog(self, msg):
         """记录日志"""
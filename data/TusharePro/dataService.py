@@ -3,25 +3,25 @@
 """
 Tushare Pro 数据接口，提供全市场数据服务
 """
-import os
 import datetime
+import numpy as np
 import pandas as pd
 
 from time import sleep
 from threading import Thread
-from collections import OrderedDict
 
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure
+from pymongo import ASCENDING, DESCENDING
 
 import tushare as ts
 
-from rqalpha.data.date_set import DateSet
-from rqalpha.data.instrument_store import InstrumentStore
 from rqalpha.model.instrument import Instrument
 
 from PyQt5 import QtCore
 
+from QuanTrader.api.mongo import connect_client, ensure_index
+from QuanTrader.data.basic import (SUSPENSION_CACHE, Column, Constant, DateTimeColumn, IntervalStore,
+                                   SuspensionStore, TradingCalendar, build_documents, get_bundle)
+from QuanTrader.utils import get_temp_file
 from utils.common_func import loadJsonSetting
 from utils.datetime_func import convert_dt_to_date_int, convert_int_to_date, convert_int_to_datetime
 from utils.constant import DATABASE_NAME
@@ -38,6 +38,54 @@ suffixMap = {
 }
 suffixMapReverse = {v: k for k, v in suffixMap.items()}
 
+# 交易日历二进制缓存文件(int64 YYYYMMDD)
+CALENDAR_CACHE = 'trade_calendar.npy'
+
+# ST 区间缓存文件及刷新周期(秒)
+ST_CACHE = 'st_intervals.npz'
+ST_REFRESH = 24 * 3600
+
+# 接口单次返回的最大记录数
+PAGE_SIZE = 10000
+
+# K线数据字段映射
+BAR_SPEC = [
+    ('vtSymbol', 'ts_code'),
+    ('date', 'trade_date'),
+    ('time', Column('time', default='000000')),
+    ('open', 'open'),
+    ('high', 'high'),
+    ('low', 'low'),
+    ('close', 'close'),
+    ('change', 'change'),
+    ('pct_chg', 'pct_chg'),
+    ('volume', Column('vol', scale=100)),
+    ('turnover', Column('amount', scale=1000, default=0)),
+    ('datetime', DateTimeColumn('trade_date', 'time')),
+    ('status', Column('trade_status', default='')),
+    ('insttype', 'insttype'),
+    ('gatewayName', Constant('tushare')),
+]
+
+# 基本面数据字段映射
+BASIS_SPEC = [
+    ('vtSymbol', 'ts_code'),
+    ('date', 'trade_date'),
+    ('close', 'close'),                         # 收盘价
+    ('adj_factor', 'adj_factor'),               # 复权因子
+    ('turnover_rate', 'turnover_rate'),         # 换手率
+    ('pe', 'pe'),                               # 市盈率(总市值/净利润)
+    ('pe_ttm', 'pe_ttm'),                       # 市盈率(TTM)
+    ('pb', 'pb'),                               # 市净率(总市值/净资产)
+    ('ps', 'ps'),                               # 市销率
+    ('ps_ttm', 'ps_ttm'),                       # 市销率(TTM)
+    ('total_share', 'total_share'),             # 总股本(万)
+    ('float_share', 'float_share'),             # 流通股本(万)
+    ('total_mv', 'total_mv'),                   # 总市值(万元)
+    ('float_mv', 'circ_mv'),                    # 流通市值(万元)
+    ('gatewayName', Constant('tushare')),
+]
+
 
 def trans_suffix(contract):
     """转换交易所编码后缀"""
@@ -57,6 +105,14 @@ def trans_suffix(contract):
         return code.upper()
 
 
+def order_book_id(symbol):
+    """股票代码统一为 order_book_id 格式(000001.SZ -> 000001.XSHE)，其他格式原样返回"""
+    code, _, suffix = symbol.partition('.')
+    if suffix in ('SH', 'SZ'):
+        return '.'.join([code, suffixMapReverse[suffix]])
+    return symbol
+
+
 ########################################################################
 class TProService(QtCore.QObject):
     """tushare数据下载服务"""
@@ -76,24 +132,38 @@ class TProService(QtCore.QObject):
 
         self.thread = Thread(target=self.run)
 
-        def _p(name):
-            return os.path.join(os.path.expanduser("~/.rqalpha"), "bundle", name)
-
-        # 合约列表
-        self._instruments = [x for x in InstrumentStore(_p('instruments.pk')).get_all_instruments() if x.type in ('CS', 'INDX') and x.exchange in ('XSHE', 'XSHG')]
-        self._total_of_instrument = len(self._instruments)
-
-        # 交易日历
+        # 交易日历(优先读取二进制缓存)
+        self._calendar = None
+        self._tradingCalendar = None
         try:
-            self._trading_calendar = pd.read_csv('etc/calendar.csv').trade_date
+            self.__setCalendar(TradingCalendar.from_file(get_temp_file(CALENDAR_CACHE)))
         except Exception:
-            self._trading_calendar = None
+            pass
 
         # 股票ST信息
-        self._st_stock_days = DateSet(_p('st_stock_days.bcolz'))
+        self._stIntervals = None
 
         # 股票停牌信息
-        self._suspend_days = DateSet(_p('suspended_days.bcolz'))
+        self._suspensions = None
+
+    # ------------------------------------------------------------------
+    @property
+    def _instruments(self):
+        """合约列表(来自进程内共享的 bundle 缓存)"""
+        return [x for x in get_bundle().get('instruments').all_instruments(['CS', 'INDX'])
+                if x.exchange in ('XSHE', 'XSHG')]
+
+    @property
+    def _total_of_instrument(self):
+        return len(self._instruments)
+
+    @property
+    def _st_stock_days(self):
+        return get_bundle().get('st_stock_days')
+
+    @property
+    def _suspend_days(self):
+        return get_bundle().get('suspended_days')
 
     # ------------------------------------------------------------------
     @property
@@ -105,25 +175,110 @@ class TProService(QtCore.QObject):
         if isinstance(act, bool):
             self._active = act
 
+    # ------------------------------------------------------------------
+    def __setCalendar(self, calendar):
+        """设置交易日历索引"""
+        self._tradingCalendar = calendar
+        self._calendar = pd.Series(calendar.int_dates, name='trade_date')
+
+    # ------------------------------------------------------------------
+    def __loadCalendar(self):
+        """
+        加载交易日历：二进制缓存未覆盖到今日时，依次尝试 etc/calendar.csv 及数据接口，并更新缓存
+        """
+        today = int(pd.Timestamp.now().strftime('%Y%m%d'))
+
+        if self._tradingCalendar is not None and self._tradingCalendar.int_dates[-1] >= today:
+            return True
+
+        try:
+            calendar = TradingCalendar(pd.read_csv('etc/calendar.csv').trade_date.values)
+            if calendar.int_dates[-1] < today:
+                raise ValueError('calendar.csv is out of date')
+        except Exception:
+            cal = self.tradeCalendar()
+            if cal is None:
+                return False
+            calendar = TradingCalendar(cal.astype('int64').values)
+
+        calendar.save(get_temp_file(CALENDAR_CACHE))
+        self.__setCalendar(calendar)
+        return True
+
     # ------------------------------------------------------------------
     def prevTradeDay(self, date):
         """取得前一交易日期"""
-        if self._calendar is not None:
-            index = self._calendar[self._calendar == int(date)].index.values[0]
-            return self._calendar.iloc[index - 1]
+        if self._tradingCalendar is not None:
+            pos = self._tradingCalendar.previous_position(int(date))
+            return str(self._tradingCalendar.int_dates[pos])
 
     # ------------------------------------------------------------------
     def nextTradeDay(self, date):
         """取得下一交易日期"""
-        if self._calendar is not None:
-            index = self._calendar[self._calendar == int(date)].index.values[0]
-            return self._calendar.iloc[index + 1]
+        if self._tradingCalendar is not None:
+            pos = self._tradingCalendar.next_position(int(date))
+            return str(self._tradingCalendar.int_dates[pos])
 
     # ------------------------------------------------------------------
     def isTrade(self, date):
         """是否是交易日"""
-        traded = True if int(date) in self._calendar.values else False
-        return traded
+        return self._tradingCalendar is not None and self._tradingCalendar.is_trading_date(int(date))
+
+    # ------------------------------------------------------------------
+    def tradeDays(self, start, end):
+        """区间 [start, end] 内的交易日(int64 YYYYMMDD 数组)"""
+        if self._tradingCalendar is not None:
+            return self._tradingCalendar.trading_dates_int(int(start), int(end))
+
+    # ------------------------------------------------------------------
+    def queryAll(self, apiName, **kwargs):
+        """分页获取接口的全部记录"""
+        frames = []
+        offset = 0
+
+        while True:
+            df = getattr(self._api, apiName)(limit=PAGE_SIZE, offset=offset, **kwargs)
+
+            if df is None or df.empty:
+                break
+
+            frames.append(df)
+            if len(df) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    # ------------------------------------------------------------------
+    def loadSTIntervals(self, refresh=False):
+        """
+        加载全市场 ST 区间：优先读取未过期的磁盘缓存，否则批量获取全部更名记录后重建并保存
+        """
+        path = get_temp_file(ST_CACHE)
+
+        if not refresh:
+            if self._stIntervals is not None and self._stIntervals.age() < ST_REFRESH:
+                return self._stIntervals
+            try:
+                store = IntervalStore.load(path)
+                if store.age() < ST_REFRESH or not self._api:
+                    self._stIntervals = store
+                    return store
+            except Exception:
+                pass
+
+        if not self._api:
+            return self._stIntervals
+
+        df = self.queryAll('namechange', fields='ts_code,name,start_date,end_date')
+
+        if df.empty:
+            self.writeLog('获取股票更名记录失败，请检查')
+            return self._stIntervals
+
+        self._stIntervals = IntervalStore.from_frame(df[df['name'].str.contains('ST', na=False)])
+        self._stIntervals.save(path)
+        return self._stIntervals
 
     # ------------------------------------------------------------------
     def isST(self, vtSymbol, date):
@@ -131,39 +286,67 @@ class TProService(QtCore.QObject):
         检查指定股票的指定日期是否是ST股
         param - "date"： 20000101
         """
-        df = self.__st.get(vtSymbol, None)
+        store = self.loadSTIntervals()
+        return store is not None and store.contains(vtSymbol, int(date))
 
-        if df is None:
-            if self._api:
-                df = self._api.namechange(ts_code=vtSymbol, fields='name,start_date,end_date')
+    # ------------------------------------------------------------------
+    def stDays(self, vtSymbol, dates):
+        """
+        批量检查指定股票在各日期是否是ST股
+        param - "dates"： [20000101, ...]
+        return： bool 数组
+        """
+        store = self.loadSTIntervals()
+        if store is None:
+            return np.zeros(len(dates), dtype=bool)
+        return store.contains(vtSymbol, np.asarray(dates, dtype='int64'))
 
-                if df is None or df.empty:
-                    return False
-                else:
-                    df = df[df.name.apply(lambda x: True if 'ST' in x else False)]
-                    self.__st[vtSymbol] = df
-            else:
-                return False
+    # ------------------------------------------------------------------
+    def loadSuspensions(self, start, end):
+        """
+        加载停牌日历并确保覆盖 [start, end] 区间的交易日，缺失部分一次批量获取后保存到磁盘；
+        合约统一以 order_book_id 为键，与 rqalpha 数据及其他数据服务共用
+        """
+        path = get_temp_file(SUSPENSION_CACHE)
 
-        for _, row in df.iterrows():
-            if row.start_date <= date < row.end_date:
-                return True
-        return False
+        if self._suspensions is None:
+            try:
+                self._suspensions = SuspensionStore.load(path)
+            except Exception:
+                self._suspensions = SuspensionStore()
+
+        days = self.tradeDays(start, end)
+        if days is None or not self._api:
+            return self._suspensions
+
+        missing = [x for x in days.tolist() if not self._suspensions.covers(x)]
+        if not missing:
+            return self._suspensions
+
+        df = self.queryAll('suspend_d', suspend_type='S', start_date=str(missing[0]), end_date=str(missing[-1]),
+                           fields='ts_code,trade_date')
+
+        self._suspensions.extend([order_book_id(x) for x in self.contractList], missing)
+        if not df.empty:
+            self._suspensions.mark(zip(df['ts_code'].map(order_book_id).values,
+                                       df['trade_date'].astype('int64').values))
+        self._suspensions.save(path)
+
+        return self._suspensions
 
     # ------------------------------------------------------------------
     def isSuspend(self, vtSymbol, date):
         """
         合约指定日期是否停牌
+        param - "vtSymbol"： 000001.SZ 或 000001.XSHE
         param - "date"： 20000101
         """
-        if self._api:
-            df = self._api.suspend(ts_code=vtSymbol, suspend=date)
+        return self.loadSuspensions(date, date).is_suspended_on(order_book_id(vtSymbol), date)
 
-            if df is None or df.empty:
-                return False
-            else:
-                return True
-        return False
+    # ------------------------------------------------------------------
+    def suspendedSymbols(self, date):
+        """指定日期全部停牌的合约(order_book_id)"""
+        return self.loadSuspensions(date, date).suspended_symbols(date)
 
     # ------------------------------------------------------------------
     def connect(self):
@@ -190,20 +373,12 @@ class TProService(QtCore.QObject):
     # ------------------------------------------------------------------
     def __dbConnect(self, config):
         """连接数据库"""
-        if config:
-            host = config.get('HOST', '')
-            port = config.get('PORT', '')
-        else:
+        if not config:
             self.writeLog('MongoDB 数据库参数读取错误，请检查')
             return False
 
-        try:
-            self._dbClient = MongoClient(host, port, serverSelectionTimeoutMS=10)
-            self._dbClient.server_info()
-            return True
-        except ConnectionFailure:
-            self._dbClient = None
-            return False
+        self._dbClient = connect_client(config)
+        return self._dbClient is not None
 
     # ------------------------------------------------------------------
     def __apiConnect(self, config):
@@ -244,16 +419,9 @@ class TProService(QtCore.QObject):
                 self._indexDict = df.T.to_dict()
 
                 # 构建交易日历
-                try:
-                    self._calendar = pd.read_csv('etc/calendar.csv').trade_date
-                except Exception:
-                    cal = self.tradeCalendar()
-                    if cal is None:
-                        self.writeLog('获取交易日历失败，请检查')
-                        return False
-                    else:
-                        self._calendar = cal
-                        self._calendar.to_csv('etc/calendar.csv', header=True, index=False)
+                if not self.__loadCalendar():
+                    self.writeLog('获取交易日历失败，请检查')
+                    return False
                 return True
             except Exception as e:
                 self.writeLog('程序错误： %s' % e)
@@ -331,13 +499,9 @@ class TProService(QtCore.QObject):
                 df['insttype'] = ctype
 
                 # 更新至数据库
-                cl.ensure_index([('datetime', ASCENDING)], unique=True)
+                ensure_index(cl)
 
-                blist = []          # 暂存bar的列表
-
-                for ix, row in df.iterrows():
-                    bar = self.generateBar(row)
-                    blist.append(bar)
+                blist = build_documents(df, BAR_SPEC)
 
                 if blist:
                     cl.insert_many(blist)
@@ -383,19 +547,15 @@ class TProService(QtCore.QObject):
 
                 df['ts_code'] = vtSymbol
                 df['insttype'] = ctype
-                df['trade_date'], df['time'] = df.date.apply(lambda x: x.split(' '))
-                df['trade_date'] = df.trade_date.apply(lambda x: x.replace('-', ''))
-                df['time'] = df.time.apply(lambda x: x.replace(':', ''))
+                parts = df['date'].str.split(' ', n=1, expand=True)
+                df['trade_date'] = parts[0].str.replace('-', '')
+                df['time'] = parts[1].str.replace(':', '').str.ljust(6, '0')
                 df.rename(columns={'volume': 'vol', 'price_change': 'change', 'p_change': 'pct_chg'}, inplace=True)
 
                 # 更新到数据库
-                cl.ensure_index([('datetime', ASCENDING)], unique=True)
-
-                blist = []          # 暂存bar的列表
+                ensure_index(cl)
 
-                for ix, row in df.iterrows():
-                    bar = self.generateBar(row)
-                    blist.append(bar)
+                blist = build_documents(df, BAR_SPEC)
 
                 if blist:
                     cl.insert_many(blist)
@@ -437,69 +597,13 @@ class TProService(QtCore.QObject):
                 df.sort_values(by=['trade_date'], inplace=True)
 
                 # 更新至数据库
-                cl.ensure_index([('date', ASCENDING)], unique=True)
+                ensure_index(cl, [('date', ASCENDING)])
 
-                blist = []          # 暂存bar的列表
-
-                for ix, row in df.iterrows():
-                    bar = self.generateBasis(row)
-                    blist.append(bar)
+                blist = build_documents(df, BASIS_SPEC)
 
                 if blist:
                     cl.insert_many(blist)
 
-    # ------------------------------------------------------------------
-    def generateBar(self, row):
-        """生成数据k线"""
-        bar = OrderedDict()
-        bar['vtSymbol'] = row.ts_code
-        bar['date'] = row.trade_date
-        bar['time'] = row.get(time, '000000').rjust(6, '0')
-
-        bar['open'] = row.open
-        bar['high'] = row.high
-        bar['low'] = row.low
-        bar['close'] = row.close
-
-        bar['change'] = row.change
-        bar['pct_chg'] = row.pct_chg
-
-        bar['volume'] = row.vol * 100
-        bar['turnover'] = row.get('amount', 0) * 1000
-
-        bar['datetime'] = datetime.strptime(' '.join([bar['date'], bar['time']]), '%Y%m%d %H%M%S')
-
-        bar['status'] = row.get('trade_status', '')
-        bar['insttype'] = row.insttype
-        bar['gatewayName'] = self.dataSource
-
-        return bar
-
-    # ------------------------------------------------------------------
-    def generateBasis(self, row):
-        """生成基本面记录"""
-        bar = OrderedDict()
-
-        bar['vtSymbol'] = row.ts_code
-        bar['date'] = row.trade_date
-
-        bar['close'] = row.close                        # 收盘价
-        bar['adj_factor'] = row.adj_factor              # 复权因子
-        bar['turnover_rate'] = row.turnover_rate        # 换手率
-        bar['pe'] = row.pe                              # 市盈率(总市值/净利润)
-        bar['pe_ttm'] = row.pe_ttm                      # 市盈率(TTM)
-        bar['pb'] = row.pb                              # 市净率(总市值/净资产)
-        bar['ps'] = row.ps                              # 市销率
-        bar['ps_ttm'] = row.ps_ttm                      # 市销率(TTM)
-        bar['total_share'] = row.total_share            # 总股本(万)
-        bar['float_share'] = row.float_share            # 流通股本(万)
-        bar['total_mv'] = row.total_mv                  # 总市值(万元)
-        bar['float_mv'] = row.circ_mv                   # 流通市值(万元)
-
-        bar['gatewayName'] = self.dataSource
-
-        return bar
-
     # ------------------------------------------------------------------
     def run(self):
         """运行"""
@@ -520,7 +624,7 @@ class TProService(QtCore.QObject):
             digit = 0
 
             # 每日到达任务执行时间后，执行数据更新的操作
-            if int(t.date().strftime('%Y%m%d')) in self._calendar.values:
+            if self.isTrade(t.date().strftime('%Y%m%d')):
                 if t.time() > taskTime and t.date() != completedDate:
                     for symbol in self._contractDict.keys():
                         self.update_DailyBar(symbol, '1d', 'CS')
@@ -561,8 +665,8 @@ class TProService(QtCore.QObject):
         """关闭"""
         self._active = False
 
-        if self._dbClient:
-            self._dbClient.close()
+        # 共享连接由连接池统一管理，此处只释放引用
+        self._dbClient = None
 
         if self.thread.isAlive():
             self.thread.join()
@@ -14,4 +14,19 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from .adjust import AdjustedPriceService
 from .base_dataserive import BaseDataService
+from .bar_repair import forward_fill_close, repair_collection, scan_zero_close, scan_zero_volume_close
+from .bundle import BundleCache, get_bundle
+from .bar_builder import (Column, Constant, DateColumn, DateTimeColumn, Field, Formatted, IndexColumn,
+                          build_documents, compute_limit_prices)
+from .checkpoint import UpdateCheckpoint
+from .instrument_catalog import InstrumentCatalog
+from .interval_store import IntervalStore
+from .manifest import RewriteLog, UpdateManifest
+from .panel import PanelLoader
+from .resample import SESSIONS_FUTURES, SESSIONS_STOCK, SessionResampler, resample_collection, resample_db_name
+from .suspension_store import SUSPENSION_CACHE, SuspensionStore
+from .trading_calendar import TradingCalendar
+from .validation import (BarValidator, Check, LimitPriceCheck, OHLCCheck, PriceCheck, QualityMetrics,
+                         SessionCountCheck, StaleTimestampCheck, TimestampCheck, default_checks)
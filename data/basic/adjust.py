@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-22 15:26:40
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-23 08:12:19
+"""
+复权价格服务：根据因子数据库中的 adj_factor 返回前复权/后复权的日线及分钟线数据
+
+每个合约的复权因子序列只读取一次并缓存在内存中(LRU淘汰)，缓存以因子集合最后一条
+数据的时间作为版本，refresh() 重新读取更新清单后仅使因子有变化的合约失效。
+
+示例::
+
+    service = AdjustedPriceService(client)
+    df = service.get_bars('000001.SZ', '2019-01-01', '2019-06-30', freq='1d', how='pre')
+"""
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
+
+from .manifest import UpdateManifest
+from .panel import to_db_symbol
+from .resample import RESAMPLE_FREQUENCIES, resample_db_name
+
+
+ADJUST_FIELDS = ['open', 'high', 'low', 'close']
+
+BAR_DB_MAP = {'1d': 'daily_db', '1m': 'minute_db'}
+BAR_DB_MAP.update({'%dm' % x: resample_db_name(x) for x in RESAMPLE_FREQUENCIES})
+
+
+########################################################################
+class AdjustedPriceService(object):
+    """
+     复权价格服务(线程安全)
+
+     :param pymongo.MongoClient client: Mongo客户端
+     :param callable bar_db: Database -> bar 数据库的转换(如 BaseDataService.bar_db)，默认不转换
+     :param int maxsize: 缓存的合约数上限
+     :param str factor_db: 因子数据库名
+    """
+
+    def __init__(self, client, bar_db=None, maxsize=512, factor_db='factor_db'):
+        self._client = client
+        self._bar_db = bar_db or (lambda db: db)
+        self._maxsize = max(int(maxsize), 1)
+        self._factor_db = self._bar_db(client[factor_db])
+
+        self._manifest = UpdateManifest(client).load()
+        self._vectors = OrderedDict()
+        self._lock = Lock()
+
+    # ------------------------------------------------------------------
+    def refresh(self):
+        """重新读取更新清单，因子数据有变化的合约在下次访问时重新计算"""
+        self._manifest.load()
+
+        with self._lock:
+            for symbol in list(self._vectors.keys()):
+                if self._vectors[symbol][0] != self._manifest.get(self._factor_db.name, symbol):
+                    del self._vectors[symbol]
+
+    # ------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+    # ------------------------------------------------------------------
+    def _version(self, symbol):
+        """因子数据的最后时间，清单中没有记录时只读查询集合(不补录清单)"""
+        version = self._manifest.get(self._factor_db.name, symbol)
+        if version is None:
+            last_record = self._factor_db[symbol].find_one(sort=[('datetime', DESCENDING)],
+                                                           projection={'_id': 0, 'datetime': 1})
+            version = last_record['datetime'] if last_record else None
+        return version
+
+    # ------------------------------------------------------------------
+    def factor_vector(self, symbol):
+        """
+         获取合约的复权因子序列
+
+         :return: (日期 datetime64 数组, 累计复权因子数组)
+        """
+        symbol = to_db_symbol(symbol)
+        version = self._version(symbol)
+
+        with self._lock:
+            cached = self._vectors.get(symbol)
+            if cached is not None and cached[0] == version:
+                self._vectors.move_to_end(symbol)
+                return cached[1]
+
+        cursor = self._factor_db[symbol].find({'adj_factor': {'$gt': 0}}, {'_id': 0, 'datetime': 1, 'adj_factor': 1})
+        docs = list(cursor.sort('datetime', ASCENDING))
+
+        dates = pd.to_datetime([x['datetime'] for x in docs]).normalize().values
+        factors = np.array([x['adj_factor'] for x in docs], dtype=float)
+        vector = (dates, factors)
+
+        with self._lock:
+            self._vectors[symbol] = (version, vector)
+            self._vectors.move_to_end(symbol)
+            while len(self._vectors) > self._maxsize:
+                self._vectors.popitem(last=False)
+
+        return vector
+
+    # ------------------------------------------------------------------
+    def factors_for(self, symbol, datetimes):
+        """
+         获取各时间点对应的复权因子(取当日或之前最近一个交易日的因子)，无因子数据时为 1.0
+
+         :param datetimes: bar 时间序列
+         :return: (复权因子数组, 最新复权因子)
+        """
+        dates, factors = self.factor_vector(symbol)
+        datetimes = pd.DatetimeIndex(datetimes)
+
+        if not len(factors):
+            return np.ones(len(datetimes)), 1.0
+
+        pos = np.searchsorted(dates, datetimes.normalize().values, side='right') - 1
+        # 早于第一个因子日期的数据使用第一个因子
+        return factors[np.maximum(pos, 0)], factors[-1]
+
+    # ------------------------------------------------------------------
+    def adjust(self, df, symbol, how='pre', fields=None):
+        """
+         对 bar 数据进行复权
+
+         :param pandas.DataFrame df: 含 datetime 列的 bar 数据
+         :param str how: 'pre' - 前复权(以最新因子为基准)，'post' - 后复权，'none' - 不复权
+         :param list[str] fields: 需复权的价格字段，默认为 open/high/low/close
+        """
+        assert how in ('pre', 'post', 'none'), "Invaild adjust type: %s." % how
+
+        if how == 'none' or df.empty:
+            return df
+
+        factors, latest = self.factors_for(symbol, df['datetime'])
+        ratio = factors / latest if how == 'pre' else factors
+
+        df = df.copy()
+        for k in fields or ADJUST_FIELDS:
+            if k in df.columns:
+                df[k] = df[k].values.astype(float) * ratio
+
+        return df
+
+    # ------------------------------------------------------------------
+    def get_bars(self, symbol, start_date=None, end_date=None, freq='1d', how='pre', fields=None):
+        """
+         读取复权后的日线或分钟线数据
+
+         :param str freq: '1d' - 日线，'1m' - 分钟线，'5m'/'15m'/'30m'/'60m' - 合成的 N 分钟线
+         :return: pandas.DataFrame
+        """
+        assert freq in BAR_DB_MAP, "Invaild frequency: %s." % freq
+
+        symbol = to_db_symbol(symbol)
+        flt = {}
+        if start_date is not None:
+            flt['$gte'] = pd.Timestamp(start_date).to_pydatetime()
+        if end_date is not None:
+            flt['$lte'] = pd.Timestamp(end_date).replace(hour=23, minute=59, second=59).to_pydatetime()
+
+        projection = dict({k: 1 for k in fields}, datetime=1, _id=0) if fields else {'_id': 0}
+        cursor = self._bar_db(self._client[BAR_DB_MAP[freq]])[symbol].find({'datetime': flt} if flt else {}, projection)
+        df = pd.DataFrame(list(cursor.sort('datetime', ASCENDING)))
+
+        return self.adjust(df, symbol, how)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-08-24 10:12:37
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-08-24 16:45:02
+"""
+列式 bar 文档构建器
+
+各数据服务只需声明 "目标字段 -> 源字段" 的映射规格(spec)，由 build_documents
+以整列运算完成日期/时间解析、单位换算等转换，直接生成可写入 MongoDB 的文档列表，
+避免逐行 iterrows() 构建 OrderedDict 的开销。
+
+示例::
+
+    DAY_BAR_SPEC = [
+        ('datetime', DateColumn('trade_date')),
+        ('open', 'open'),
+        ('volume', Column('vol', scale=100)),
+        ('gatewayName', Constant('tushare')),
+    ]
+    bars = build_documents(df, DAY_BAR_SPEC)
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+########################################################################
+class Field(object):
+    """字段映射基础类，子类以整列方式从 DataFrame 计算目标字段"""
+
+    def __call__(self, df):
+        raise NotImplementedError
+
+
+class Column(Field):
+    """
+     直接映射源字段
+
+     :param str name: 源字段名
+     :param float scale: 换算系数(如 vol * 100)
+     :param default: 源字段缺失或为空时的默认值
+    """
+
+    def __init__(self, name, scale=None, default=None):
+        self.name = name
+        self.scale = scale
+        self.default = default
+
+    def __call__(self, df):
+        if self.name not in df.columns:
+            values = pd.Series(self.default, index=df.index)
+        elif self.default is not None:
+            values = df[self.name].fillna(self.default)
+        else:
+            values = df[self.name]
+
+        if self.scale is not None:
+            values = values * self.scale
+        return values
+
+
+class DateColumn(Field):
+    """
+     将 YYYYMMDD 格式(整数或字符串)的源字段解析为 datetime
+
+     :param str name: 源字段名
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, df):
+        return pd.to_datetime(df[self.name].astype(np.int64).astype(str), format='%Y%m%d')
+
+
+class DateTimeColumn(Field):
+    """
+     将 YYYYMMDD 日期字段与 HHMMSS 时间字段合并解析为 datetime
+
+     :param str date: 日期字段名
+     :param str time: 时间字段名(整数或字符串，字符串允许包含 ':')，字段缺失时取 00:00:00
+    """
+
+    def __init__(self, date, time):
+        self.date = date
+        self.time = time
+
+    def __call__(self, df):
+        dates = df[self.date].astype(str).str.replace('-', '')
+        if self.time in df.columns:
+            times = df[self.time].astype(str).str.replace(':', '').str.zfill(6)
+        else:
+            times = '000000'
+        return pd.to_datetime(dates + times, format='%Y%m%d%H%M%S')
+
+
+class IndexColumn(Field):
+    """取 DataFrame 的索引作为字段值(如 rqdatac 以 datetime 为索引的数据)"""
+
+    def __call__(self, df):
+        return pd.Series(df.index, index=df.index)
+
+
+class Formatted(Field):
+    """
+     将 datetime 字段按格式转换为字符串
+
+     :param Field source: 源字段(须返回 datetime 列)
+     :param str fmt: strftime 格式
+    """
+
+    def __init__(self, source, fmt):
+        self.source = source
+        self.fmt = fmt
+
+    def __call__(self, df):
+        return self.source(df).dt.strftime(self.fmt)
+
+
+class Constant(Field):
+    """为所有文档填充同一常量值"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, df):
+        return pd.Series([self.value] * len(df), index=df.index, dtype=object)
+
+
+# ----------------------------------------------------------------------
+def compute_limit_prices(df, ratio, preclose='preclose'):
+    """
+     按昨收价整列计算涨跌停价，结果写入 df 的 limit_up / limit_down 字段
+
+     :param pd.DataFrame df: 日线数据
+     :param float|np.ndarray ratio: 涨跌幅限制，可为标量或与 df 等长的数组
+     :param str preclose: 昨收价字段名
+    """
+    ratio = np.asarray(ratio, dtype=np.float64)
+    df['limit_up'] = df[preclose].values * (1 + ratio)
+    df['limit_down'] = df[preclose].values * (1 - ratio)
+    return df
+
+
+# ----------------------------------------------------------------------
+def _to_native(values):
+    """将整列数据转换为 BSON 可编码的 Python 原生对象列表"""
+    if isinstance(values, pd.Series) and pd.api.types.is_datetime64_any_dtype(values):
+        return [None if x is pd.NaT else x for x in values.dt.to_pydatetime()]
+    return np.asarray(values).tolist()
+
+
+def build_documents(df, spec, defaults=None):
+    """
+     按映射规格将 DataFrame 整列转换为文档列表
+
+     :param pd.DataFrame df: 源数据
+     :param list spec: [(目标字段, 源字段名 | Field), ...]，顺序即文档字段顺序
+     :param dict defaults: 每个文档的默认字段(先于 spec 写入，可被 spec 覆盖)
+
+     :return: list[OrderedDict]
+    """
+    if df is None or df.empty:
+        return []
+
+    keys = []
+    columns = []
+
+    for key, source in spec:
+        if isinstance(source, str):
+            source = Column(source)
+        keys.append(key)
+        columns.append(_to_native(source(df)))
+
+    if not defaults:
+        return [OrderedDict(zip(keys, values)) for values in zip(*columns)]
+
+    base = [(k, v) for k, v in defaults.items() if k not in keys]
+    documents = []
+
+    for values in zip(*columns):
+        doc = OrderedDict(base)
+        doc.update(zip(keys, values))
+        documents.append(doc)
+
+    return documents
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-29 08:12:40
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-29 15:26:03
+"""
+分钟线无效数据修复
+
+收盘价为 0 的 bar 以列掩码一次性找出，OHLC 统一取前一根有效 bar 的收盘价
+(每个交易日的首根取当日昨收价)，按交易日分组整列向前填充，
+只将被修复的文档以 $set 批量写回数据库。
+扫描时每个集合(或单一集合结构的整张表)只执行一次聚合，按合约及交易日统计无效 bar 数；
+收盘 bar 成交量为 0 的检测以 $unionWith 将一批合约集合合并为一次聚合。
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+from pymongo.errors import OperationFailure
+
+from QuanTrader.api.mongo import BarTable, BulkWriter, cursor_to_frame
+
+
+OHLC_FIELDS = ['open', 'high', 'low', 'close']
+
+# 按交易日(当日0点)分组的聚合表达式
+_DAY_EXPR = {'$dateFromParts': {'year': {'$year': '$datetime'},
+                                'month': {'$month': '$datetime'},
+                                'day': {'$dayOfMonth': '$datetime'}}}
+
+
+def zero_close_mask(df, field='close'):
+    """收盘价为 0 或缺失的 bar"""
+    close = df[field]
+    return ((close == 0) | close.isnull()).values
+
+
+def forward_fill_close(df, seed, by=None, fields=OHLC_FIELDS):
+    """
+     以前一根有效 bar 的收盘价填充无效 bar 的 OHLC(原地修改)
+
+     :param pd.DataFrame df: 按时间排序的 bar 数据
+     :param seed: 首根 bar 无效时的填充价(昨收价)；by 不为空时为 {分组键: 昨收价} 字典或 Series
+     :param by: 分组键(列名或与 df 等长的 Series，如交易日)，各组分别填充
+     :param list fields: 需要填充的价格字段
+
+     :return: numpy.ndarray[bool]: 被修复的行
+    """
+    mask = zero_close_mask(df)
+
+    if not mask.any():
+        return mask
+
+    close = df['close'].where(~mask)
+
+    if by is None:
+        fill = close.ffill().fillna(np.nan if seed is None else seed)
+    else:
+        keys = df[by] if isinstance(by, str) else pd.Series(np.asarray(by), index=df.index)
+        fill = close.groupby(keys.values).ffill()
+        fill = fill.fillna(keys.map(seed))
+
+    # 缺少昨收价且当日此前没有有效 bar 的无法修复
+    repaired = mask & fill.notnull().values
+
+    if repaired.any():
+        values = fill.values[repaired].astype(float)
+        df.loc[repaired, fields] = np.repeat(values[:, None], len(fields), axis=1)
+
+    return repaired
+
+
+def scan_zero_close(db, symbols=None):
+    """
+     统计各合约收盘价为 0 的 bar 数
+
+     :param db: 分钟线数据库(pymongo.database.Database 或 BarTable)
+     :param list[str] symbols: 合约列表，默认为数据库中全部合约
+
+     :return: dict{合约: dict{交易日(datetime): 条数}}
+    """
+    result = {}
+
+    if isinstance(db, BarTable):
+        match = {'close': 0}
+        if symbols is not None:
+            match['symbol'] = {'$in': list(symbols)}
+
+        pipeline = [{'$match': match},
+                    {'$group': {'_id': {'symbol': '$symbol', 'day': _DAY_EXPR}, 'count': {'$sum': 1}}}]
+
+        for x in db.collection.aggregate(pipeline, allowDiskUse=True):
+            result.setdefault(x['_id']['symbol'], {})[x['_id']['day']] = x['count']
+        return result
+
+    if symbols is None:
+        symbols = db.list_collection_names()
+
+    pipeline = [{'$match': {'close': 0}}, {'$group': {'_id': _DAY_EXPR, 'count': {'$sum': 1}}}]
+
+    for symbol in symbols:
+        days = {x['_id']: x['count'] for x in db[symbol].aggregate(pipeline, allowDiskUse=True)}
+        if days:
+            result[symbol] = days
+
+    return result
+
+
+def repair_collection(cl, days, seeds, fields=OHLC_FIELDS, batch_size=1000):
+    """
+     修复集合中指定交易日的无效 bar，只写回被修复的文档
+
+     :param cl: 合约分钟线集合(pymongo.collection.Collection 或 SymbolView)
+     :param list[datetime.datetime] days: 需要修复的交易日(当日0点)
+     :param dict seeds: {交易日: 昨收价}
+     :param list fields: 需要填充的价格字段
+
+     :return: int: 修复的 bar 数
+     :raises pymongo.errors.BulkWriteError: 部分文档写回失败
+    """
+    if not days:
+        return 0
+
+    one_day = datetime.timedelta(days=1)
+    query = {'$or': [{'datetime': {'$gte': d, '$lt': d + one_day}} for d in sorted(days)]}
+    projection = dict({k: 1 for k in fields}, datetime=1, _id=0)
+
+    df = cursor_to_frame(cl.find(query, projection).sort('datetime', 1), ['datetime'] + list(fields))
+
+    if df.empty:
+        return 0
+
+    seeds = {pd.Timestamp(k): v for k, v in seeds.items()}
+    repaired = forward_fill_close(df, seeds, by=pd.to_datetime(df['datetime']).dt.normalize(), fields=fields)
+
+    if repaired.any():
+        with BulkWriter(cl, mode='update', batch_size=batch_size) as writer:
+            for doc in df.loc[repaired, ['datetime'] + list(fields)].to_dict('records'):
+                doc['datetime'] = pd.Timestamp(doc['datetime']).to_pydatetime()
+                writer.add(doc)
+
+    return int(repaired.sum())
+
+
+def scan_zero_volume_close(db, closes, symbols=None, batch_size=200):
+    """
+     查找指定收盘时间的 bar 中成交量为 0 的合约
+
+     单一集合结构整表执行一次聚合；每个合约一个集合时，每 batch_size 个集合以 $unionWith
+     合并为一次聚合(MongoDB 4.4 以下不支持时逐个集合查询)
+
+     :param db: 分钟线数据库(pymongo.database.Database 或 BarTable)
+     :param list[datetime.datetime] closes: 各交易日收盘 bar 的时间
+     :param list[str] symbols: 合约列表，默认为数据库中全部合约
+
+     :return: dict{合约: list[datetime.datetime]}
+    """
+    match = {'datetime': {'$in': list(closes)}, 'volume': 0}
+    result = {}
+
+    if isinstance(db, BarTable):
+        if symbols is not None:
+            match['symbol'] = {'$in': list(symbols)}
+
+        pipeline = [{'$match': match}, {'$group': {'_id': '$symbol', 'dates': {'$push': '$datetime'}}}]
+
+        for x in db.collection.aggregate(pipeline, allowDiskUse=True):
+            result[x['_id']] = sorted(x['dates'])
+        return result
+
+    if symbols is None:
+        symbols = db.list_collection_names()
+    symbols = list(symbols)
+
+    def _stages(symbol):
+        return [{'$match': match}, {'$project': {'_id': 0, 'datetime': 1, 'symbol': {'$literal': symbol}}}]
+
+    for i in range(0, len(symbols), batch_size):
+        batch = symbols[i:i + batch_size]
+        pipeline = _stages(batch[0]) + [{'$unionWith': {'coll': x, 'pipeline': _stages(x)}} for x in batch[1:]]
+        pipeline.append({'$group': {'_id': '$symbol', 'dates': {'$push': '$datetime'}}})
+
+        try:
+            for x in db[batch[0]].aggregate(pipeline, allowDiskUse=True):
+                result[x['_id']] = sorted(x['dates'])
+        except OperationFailure:
+            for symbol in batch:
+                dates = sorted(x['datetime'] for x in db[symbol].find(match, {'_id': 0, 'datetime': 1}))
+                if dates:
+                    result[symbol] = dates
+
+    return result
@@ -7,20 +7,36 @@
 import datetime
 import shelve
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from time import sleep
-from threading import Thread
+from threading import Lock, Thread, local
+
+import numpy as np
 
 from PyQt5 import QtCore
 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import DESCENDING
 
+from QuanTrader.api.bar_store import BarStore, sync_from_mongo
+from QuanTrader.api.mongo import (SCHEMA_SYMBOL, SCHEMA_TIMESERIES, BarTable, BulkWriter, audit_indexes,
+                                  connect_client, ensure_index, ensure_indexes, migrate_to_table)
 from QuanTrader.utils.constants import DatabaseName
 from QuanTrader.utils import load_json, get_temp_file
 
 
+from .adjust import AdjustedPriceService
+from .bar_repair import scan_zero_volume_close
+from .bundle import get_bundle
+from .checkpoint import STATUS_FAILED, UpdateCheckpoint
 from .instruments_mixin import InstrumentsMixin
+from .manifest import MANIFEST_DB, REWRITE_BAR_STORE, REWRITE_RESAMPLE, RewriteLog, UpdateManifest
+from .panel import PanelLoader
+from .pipeline import BatchWriter, RateLimiter
+from .resample import (RESAMPLE_FREQUENCIES, SESSIONS_STOCK, SessionResampler, resample_collection,
+                       resample_db_name)
+from .suspension_store import SUSPENSION_CACHE, SuspensionStore
 from .trading_dates_mixin import TradingDatesMixin
+from .validation import ACTION_QUARANTINE, BarValidator, default_checks
 
 
 ########################################################################
@@ -33,6 +49,8 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
 
     settingFile = 'DS_setting.json'
 
+    dataSource = ''
+
     def __init__(self, parent=None):
         super(BaseDataService, self).__init__(parent)
 
@@ -41,9 +59,39 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
 
         self.thread = Thread(target=self.run)
 
+        # 并发更新配置，例如：
+        # "Worker": {"SIZE": 8, "QUEUE_SIZE": 64, "BATCH_SIZE": 5000, "RATE_LIMIT": {"QuantOS": 20}}
+        _worker = self._setting.get('Worker', {})
+        self._worker_size = max(int(_worker.get('SIZE', 4)), 1)
+        self._limiter = RateLimiter(_worker.get('RATE_LIMIT', {}).get(self.dataSource))
+        self._writer = BatchWriter(batch_size=_worker.get('BATCH_SIZE', 5000),
+                                   queue_size=_worker.get('QUEUE_SIZE', 64),
+                                   on_error=self._on_write_error,
+                                   on_written=self._on_written)
+        self._progress_lock = Lock()
+        self._progress = 0
+
+        self._manifest = None
+
+        # 更新检查点，_written 记录当前线程正在更新的数据写入了哪些集合
+        self._checkpoint = None
+        self._written = local()
+        self._failures = None
+
+        # 写入前数据质量校验，例如：
+        # "Validation": {"ENABLED": true, "QUARANTINE": true, "LIMIT_TOLERANCE": 0.01, "SESSION_BARS": 240}
+        _validation = self._setting.get('Validation', {})
+        self._validator = None
+        if _validation.get('ENABLED', True):
+            self._validator = BarValidator(default_checks(_validation.get('LIMIT_TOLERANCE', 0.01),
+                                                          _validation.get('SESSION_BARS', 240)))
+
         InstrumentsMixin.__init__(self)
         TradingDatesMixin.__init__(self)
 
+        # bundle 数据首次加载或更新后重新加载时记录耗时
+        get_bundle().add_listener(self._on_bundle_loaded)
+
     # ------------------------------------------------------------------
     @property
     def active(self):
@@ -65,14 +113,62 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
 
     # ------------------------------------------------------------------
     def _connect_db(self, config):
-        url = 'mongodb://{}:{}'.format(config.get('HOST', '127.0.0.1'), config.get('PORT', 27017))
+        """获取进程内共享的数据库连接，服务不可用时返回 None"""
+        return connect_client(config)
 
-        try:
-            _dbClient = MongoClient(url, serverSelectionTimeoutMS=10)
-            _dbClient.server_info()
-            return _dbClient
-        except ConnectionFailure:
-            return None
+    # ------------------------------------------------------------------
+    def bar_db(self, db):
+        """
+         按 MongoDB.SCHEMA 配置返回 bar 数据库：'symbol'(默认) 为每个合约一个集合的原数据库，
+         'single'/'timeseries' 为以单一集合存储全部合约的 BarTable(同样支持 db[合约] 访问)
+
+         :param pymongo.database.Database db: Mongo数据库
+        """
+        _setting = self._setting.get('MongoDB', {})
+        schema = _setting.get('SCHEMA', SCHEMA_SYMBOL)
+
+        if schema == SCHEMA_SYMBOL:
+            return db
+
+        granularity = 'minutes' if db.name.startswith('minute') else 'hours'
+        return BarTable(db, _setting.get('TABLE', 'bars'), schema == SCHEMA_TIMESERIES, granularity)
+
+    # ------------------------------------------------------------------
+    def migrate_schema(self):
+        """将日线、分钟线及因子数据库由每个合约一个集合迁移到 MongoDB.SCHEMA 配置的单一集合结构"""
+        _db_client = self._connect_db(self._setting.get('MongoDB', {}))
+
+        if _db_client is None:
+            return
+
+        for db_name in [DatabaseName.DAILY.value, DatabaseName.MINUTE.value, DatabaseName.FACTOR.value]:
+            table = self.bar_db(_db_client[db_name])
+
+            if not isinstance(table, BarTable):
+                self.writeLog('当前配置为每个合约一个集合，无需迁移')
+                return
+
+            self.writeLog('开始迁移 %s ...' % db_name)
+            symbols = [x for x in _db_client[db_name].list_collection_names() if x != table.table_name]
+            try:
+                total = migrate_to_table(_db_client[db_name], table, symbols,
+                                         on_progress=lambda symbol, count: self.writeLog('%s: %d' % (symbol, count)))
+            except Exception as e:
+                self.writeLog('迁移 %s 时出现错误(可重新执行迁移)： %s' % (db_name, e))
+                return
+            self.writeLog('%s 迁移完毕，共写入 %d 条数据' % (db_name, total))
+
+    # ------------------------------------------------------------------
+    def panel_loader(self, **kwargs):
+        """创建共享本服务合约、交易日历及数据库结构配置的截面面板加载器"""
+        _db_client = self._connect_db(self._setting.get('MongoDB', {}))
+        return PanelLoader(_db_client, self, self.bar_db, self.load_updated_date, **kwargs)
+
+    # ------------------------------------------------------------------
+    def price_service(self, **kwargs):
+        """创建使用本服务数据库结构配置的复权价格服务"""
+        _db_client = self._connect_db(self._setting.get('MongoDB', {}))
+        return AdjustedPriceService(_db_client, self.bar_db, **kwargs)
 
     # ------------------------------------------------------------------
     def load_updated_date(self):
@@ -87,6 +183,138 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
         f['last_updated'] = updated_date
         f.close()
 
+    # ------------------------------------------------------------------
+    def throttle(self):
+        """按数据源限流配置等待请求许可"""
+        self._limiter.acquire()
+
+    # ------------------------------------------------------------------
+    def last_datetime(self, cl):
+        """
+         获取集合中最后一条数据的时间，优先从更新清单中读取
+
+         :param pymongo.collection.Collection cl: Mongo集合
+         :return: datetime.datetime | None
+        """
+        if self._manifest is not None:
+            return self._manifest.last_datetime(cl)
+
+        last_record = cl.find_one(sort=[('datetime', DESCENDING)])
+        return last_record['datetime'] if last_record else None
+
+    # ------------------------------------------------------------------
+    def is_up_to_date(self, db, symbol, end_date):
+        """根据更新清单判断合约在指定数据库中的数据是否已更新至 end_date"""
+        if self._manifest is None:
+            return False
+
+        last = self._manifest.get(db.name, symbol)
+        return last is not None and last.date() >= end_date.date()
+
+    # ------------------------------------------------------------------
+    def load_suspensions(self):
+        """加载 tushare 服务保存的停牌日历(如有)，补充 bundle 中未更新到的停牌数据"""
+        try:
+            self.use_suspension_store(SuspensionStore.load(get_temp_file(SUSPENSION_CACHE)))
+        except Exception:
+            pass
+
+    # ------------------------------------------------------------------
+    def save_bars(self, cl, bars):
+        """
+         保存数据到指定集合(经 BulkWriter 按 datetime 幂等写入)，并发更新期间交由批量写入线程处理
+
+         :param pymongo.collection.Collection cl: Mongo集合
+         :param list[dict] bars: 待写入的文档
+        """
+        if not bars:
+            return
+
+        if self._validator is not None:
+            bars = self._validate(cl, bars)
+            if not bars:
+                return
+
+        written = getattr(self._written, 'keys', None)
+        if written is not None:
+            written.add((cl.database.name, cl.name))
+
+        if self._writer.running:
+            self._writer.put(cl, bars)
+        else:
+            ensure_index(cl)
+            with BulkWriter.for_collection(cl, batch_size=len(bars)) as writer:
+                writer.extend(bars)
+            self._on_written(cl, bars)
+
+    # ------------------------------------------------------------------
+    def mark_rewritten(self, cl, since):
+        """
+         记录集合中自 since 起的历史数据已被原地改写(调整、修复等)，下游据此重新同步
+
+         :param pymongo.collection.Collection cl: Mongo集合
+         :param datetime.datetime since: 最早被改写的数据时间
+        """
+        try:
+            RewriteLog(cl.database.client).mark(cl.database.name, cl.name, since)
+        except Exception as e:
+            self.writeLog('记录 【 %s 】 数据改写时出现错误： %s' % (cl.name, e))
+
+    # ------------------------------------------------------------------
+    def _validate(self, cl, bars):
+        """校验待写入的数据，校验出错时原样写入"""
+        last = self._manifest.get(cl.database.name, cl.name) if self._manifest is not None else None
+        context = {'last': last, 'intraday': cl.database.name == DatabaseName.MINUTE.value}
+
+        try:
+            return self._validator.validate(cl, bars, context)
+        except Exception as e:
+            self.writeLog('校验 【 %s 】 数据时出现错误： %s' % (cl.name, e))
+            return bars
+
+    # ------------------------------------------------------------------
+    def report_quality(self, db_client, end_date):
+        """输出并保存本次更新的数据质量统计"""
+        if self._validator is None:
+            return
+
+        summary = self._validator.metrics.summary()
+        if not summary['issues']:
+            return
+
+        self.writeLog('数据质量：共检查 %d 条数据，%s' % (
+            summary['rows'], '， '.join('%s %d 条' % (k, v) for k, v in sorted(summary['issues'].items()))))
+
+        quarantined = summary['actions'].get(ACTION_QUARANTINE, 0)
+        if quarantined:
+            self.writeLog('隔离 %d 条异常数据，其后数据照常写入，缺口记录在 %s.bar_quarantine' % (quarantined, MANIFEST_DB))
+
+        try:
+            db_client[MANIFEST_DB]['quality_metrics'].insert_one(
+                dict(summary, source=self.dataSource, run=end_date.strftime('%Y%m%d'), created=datetime.datetime.now()))
+        except Exception as e:
+            self.writeLog('保存数据质量统计时出现错误： %s' % e)
+
+    # ------------------------------------------------------------------
+    def _on_write_error(self, name, error):
+        self.writeLog('写入 【 %s 】 数据时出现错误： %s' % (name, error))
+
+    # ------------------------------------------------------------------
+    def _on_bundle_loaded(self, name, path, cost):
+        self.writeLog('加载 %s 耗时 %.3f 秒' % (name, cost))
+
+    # ------------------------------------------------------------------
+    def _on_written(self, cl, bars):
+        if self._manifest is not None:
+            self._manifest.record(cl, bars)
+
+    # ------------------------------------------------------------------
+    def _step_progress(self, total, symbol):
+        """并发更新时推进进度计数"""
+        with self._progress_lock:
+            self._progress += 1
+            self.writeRate(self._progress, total, symbol)
+
     # ------------------------------------------------------------------
     def writeLog(self, msg):
         """记录日志"""
@@ -137,30 +365,39 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
 
     # ------------------------------------------------------------------
     def _to_update(self, update_date):
+        """执行更新任务，存在失败的数据时按检查点只重试失败的合约"""
         _retry = 3
 
-        while _retry > 0:
+        while _retry > 0 and self._active:
+            self._failures = None
+
             _task = Thread(target=self._update_process, args=(update_date,))
             _task.start()
+            _task.join()
 
-            try:
-                _task.join()
-                if self._active:
-                    self.save_updated_date(update_date.date())
+            if not self._active:
+                break
+
+            if self._failures == 0:
+                self.save_updated_date(update_date.date())
                 break
-            except:
-                _retry -= 1
+
+            _retry -= 1
+            if self._failures is not None:
+                self.writeLog('%d 个合约更新失败，%s' % (self._failures, '重试失败的合约...' if _retry else '已放弃重试'))
 
     # ------------------------------------------------------------------
     def _to_adjust(self, end_date):
         # 调整本周每日最后一分钟数据
-        _db = self._connect_db(self._setting.get('MongoDB', {}))[DatabaseName.MINUTE.value]
+        _db_client = self._connect_db(self._setting.get('MongoDB', {}))
+        _db = self.bar_db(_db_client[DatabaseName.MINUTE.value])
         instrument_list = [x for x in self.get_stock_contracts() if x.type == 'CS' and x.status == 'Active']
+        instrument_list = self.instruments_to_adjust(_db, instrument_list, end_date, prev_nday=10)
 
         digit = 0
         total = len(instrument_list)
 
-        self.writeLog('开始调整本周每日最后一分钟数据...')
+        self.writeLog('开始调整本周每日最后一分钟数据，共 %d 个合约需要调整...' % total)
 
         for instrument in instrument_list:
             digit += 1
@@ -171,6 +408,10 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
                 self.writeLog('调整分钟线数据时出现错误： %s ' % e)
                 raise e
 
+        # 被调整的合约从调整处起重新合成 N 分钟线
+        if self._setting.get('Resample', {}).get('ENABLED', False):
+            self.resample_minute_bars(_db_client, instrument_list)
+
         self.writeLog('本周分钟线数据调整完毕！')
         self.writeRate(symbol='finish')
 
@@ -181,47 +422,305 @@ class BaseDataService(QtCore.QObject, InstrumentsMixin, TradingDatesMixin):
         if _db_client is None:
             return
         else:
-            daily_db = _db_client[DatabaseName.DAILY.value]
-            minute_db = _db_client[DatabaseName.MINUTE.value]
-            factor_db = _db_client[DatabaseName.FACTOR.value]
+            daily_db = self.bar_db(_db_client[DatabaseName.DAILY.value])
+            minute_db = self.bar_db(_db_client[DatabaseName.MINUTE.value])
+            factor_db = self.bar_db(_db_client[DatabaseName.FACTOR.value])
 
         self.writeLog('开始更新 %s 数据...' % end_date.date())
 
-        digit = 0
+        self._manifest = UpdateManifest(_db_client).load()
+
+        self.load_suspensions()
+
+        self.check_indexes(daily_db, minute_db, factor_db)
+
+        self._checkpoint = UpdateCheckpoint(_db_client, self.dataSource, end_date).load()
+
+        if self._validator is not None:
+            self._validator.reset()
+            if self._setting.get('Validation', {}).get('QUARANTINE', True):
+                self._validator.quarantine = _db_client[MANIFEST_DB]['bar_quarantine']
 
-        instrument_list = self.get_stock_contracts()
+        all_instruments = self.get_stock_contracts()
+        instrument_list = [x for x in all_instruments
+                           if not self._checkpoint.is_complete(x.order_book_id, self.update_datasets(x))]
         total = len(instrument_list)
 
-        for instrument in instrument_list:
-            if not self._active:
-                return
+        if total < len(all_instruments):
+            self.writeLog('从检查点恢复：%d 个合约已完成，%d 个合约待更新' % (len(all_instruments) - total, total))
 
-            if instrument.de_listed_date < end_date or (instrument.type == 'CS' and instrument.status != 'Active'):
-                digit += 1
-                self.writeRate(digit, total, '正在更新: %s - %s' % (instrument.order_book_id, instrument.symbol))
-                continue
+        try:
+            self.prepare_update(daily_db, minute_db, factor_db, instrument_list, end_date)
+        except Exception as e:
+            self.writeLog('批量预取数据时出现错误，将逐个合约下载： %s' % e)
+
+        self._progress = 0
+        self._writer.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._worker_size) as executor:
+                futures = {executor.submit(self._update_instrument, daily_db, minute_db, factor_db, instrument,
+                                           end_date): instrument for instrument in instrument_list}
+
+                for future in as_completed(futures):
+                    instrument = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # 未完成的数据标记为失败，本次其余步骤照常执行，之后重试
+                        self.writeLog('更新 【 %s -- %s 】 数据时出现错误： %s' % (instrument.order_book_id, instrument.symbol, e))
+                        pending = [x for x in self.update_datasets(instrument)
+                                   if not self._checkpoint.is_done(instrument.order_book_id, x)]
+                        if pending:
+                            self._checkpoint.mark(instrument.order_book_id, pending, STATUS_FAILED, e)
+                    self._step_progress(total, '正在更新: %s - %s' % (instrument.order_book_id, instrument.symbol))
+        finally:
+            self._writer.stop()
+
+        # 分钟线写入完成后再调整当日最后一分钟数据(已调整过的合约跳过)
+        adjust_list = [x for x in all_instruments if x.type == 'CS' and x.status == 'Active' and
+                       x.de_listed_date >= end_date and self._checkpoint.is_done(x.order_book_id, 'minute_bar') and
+                       not self._checkpoint.is_done(x.order_book_id, 'adjust')]
+        adjust_list = self.instruments_to_adjust(minute_db, adjust_list, end_date, prev_nday=1)
+
+        with ThreadPoolExecutor(max_workers=self._worker_size) as executor:
+            for instrument in adjust_list:
+                executor.submit(self._adjust_instrument, minute_db, instrument, end_date)
+
+        self._manifest = None
+        self._failures = len(self._checkpoint.failed())
+
+        self.report_quality(_db_client, end_date)
+
+        if self._active and self._setting.get('Resample', {}).get('ENABLED', False):
+            self.resample_minute_bars(_db_client, [x for x in all_instruments
+                                                   if self._checkpoint.is_done(x.order_book_id, 'minute_bar')])
+
+        if self._active and self._setting.get('BarStore', {}).get('ENABLED', False):
+            self.sync_bar_store(_db_client)
+
+        if not self._active:
+            return
+
+        self.writeLog('数据更新完毕!')
+        self.writeRate(symbol='finish')
+
+        return
+
+    # ------------------------------------------------------------------
+    def check_indexes(self, *dbs):
+        """
+         启动时为各数据库已有集合一次性创建 datetime 唯一索引，之后写入时不再重复请求；
+         配置 MongoDB.INDEX_AUDIT 时先检查并报告缺失或多余的索引
+        """
+        for db in dbs:
+            try:
+                if isinstance(db, BarTable):
+                    # 单一集合结构只需检查一个集合的 (symbol, datetime) 复合索引
+                    audit_args = (db.db, [('symbol', 1), ('datetime', 1)], not db.timeseries, [db.table_name])
+                else:
+                    audit_args = (db, )
+
+                if self._setting.get('MongoDB', {}).get('INDEX_AUDIT', False):
+                    for name, result in sorted(audit_indexes(*audit_args).items()):
+                        self.writeLog('索引检查 【 %s.%s 】： 缺失唯一索引 %s， 多余索引 %s' %
+                                      (db.name, name, result['missing'], result['redundant']))
+
+                if isinstance(db, BarTable):
+                    db.ensure()
+                else:
+                    ensure_indexes(db)
+            except Exception as e:
+                self.writeLog('检查 %s 索引时出现错误： %s' % (db.name, e))
+
+    # ------------------------------------------------------------------
+    def sessions_for(self, instrument):
+        """合约的交易时段，用于合成 N 分钟线"""
+        return SESSIONS_STOCK
+
+    # ------------------------------------------------------------------
+    def resample_minute_bars(self, db_client, instruments):
+        """
+         由已保存的 1 分钟线增量合成各周期分钟线，分别写入 minute<N>_db，配置例如：
+         "Resample": {"ENABLED": true, "FREQUENCIES": [5, 15, 30, 60]}
+        """
+        frequencies = self._setting.get('Resample', {}).get('FREQUENCIES', RESAMPLE_FREQUENCIES)
+        minute_db = self.bar_db(db_client[DatabaseName.MINUTE.value])
+
+        # 1 分钟线被调整或修复过的合约从最早改写处起重新合成
+        rewrites = RewriteLog(db_client)
+        rewritten = rewrites.pending(minute_db.name, REWRITE_RESAMPLE)
+
+        self.writeLog('开始合成 %s 分钟线...' % '/'.join(str(x) for x in frequencies))
+
+        def _resample(instrument):
+            symbol = self.bar_symbol(instrument)
+            since = rewritten.get(symbol)
+            written = 0
+            for minutes in frequencies:
+                resampler = SessionResampler(minutes, self.sessions_for(instrument), self._calendar)
+                target = self.bar_db(db_client[resample_db_name(minutes)])[symbol]
+                written += resample_collection(minute_db[symbol], target, resampler, since=since)
+            if since is not None:
+                rewrites.clear(minute_db.name, REWRITE_RESAMPLE, {symbol: since})
+            return written
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=self._worker_size) as executor:
+            futures = {executor.submit(_resample, x): x for x in instruments}
+            for future in as_completed(futures):
+                try:
+                    total += future.result()
+                except Exception as e:
+                    instrument = futures[future]
+                    self.writeLog('合成 【 %s -- %s 】 分钟线时出现错误： %s' % (instrument.order_book_id, instrument.symbol, e))
+
+        self.writeLog('分钟线合成完毕，共写入 %d 条数据' % total)
+
+    # ------------------------------------------------------------------
+    def sync_bar_store(self, db_client):
+        """将日线及分钟线数据库的增量数据同步到本地列式存储，被改写过的合约从改写处起重新同步"""
+        store = BarStore(self._setting.get('BarStore', {}).get('PATH'))
+        rewrites = RewriteLog(db_client)
+
+        self.writeLog('开始同步本地列式存储...')
+
+        for db_name, freq in [(DatabaseName.DAILY.value, '1d'), (DatabaseName.MINUTE.value, '1m')]:
+            try:
+                rewrite = rewrites.pending(db_name, REWRITE_BAR_STORE)
+                result = sync_from_mongo(store, self.bar_db(db_client[db_name]), freq, rewrite=rewrite)
+                rewrites.clear(db_name, REWRITE_BAR_STORE, rewrite)
+                self.writeLog('%s 同步完成：%d 个合约，%d 条数据' % (db_name, len(result), sum(result.values())))
+            except Exception as e:
+                self.writeLog('同步 %s 到本地列式存储时出现错误： %s' % (db_name, e))
+
+    # ------------------------------------------------------------------
+    def _update_instrument(self, daily_db, minute_db, factor_db, instrument, end_date):
+        """
+         更新单个合约的全部数据(在工作线程中执行)
+
+         各类数据分别记录检查点：已完成的跳过，出错的标记为失败并继续更新其余数据；
+         数据交由批量写入线程时，待其写入数据库后才标记为完成
+        """
+        if not self._active:
+            return instrument
+
+        datasets = self.update_datasets(instrument)
+
+        if not self.is_updatable(instrument, end_date) or \
+                self.is_instrument_up_to_date(daily_db, minute_db, factor_db, instrument, end_date):
+            self._checkpoint.mark(instrument.order_book_id, datasets)
+            return instrument
 
-            # _date = min(end_date, instrument.de_listed_date)
+        # _date = min(end_date, instrument.de_listed_date)
 
+        dbs = {'day_bar': daily_db, 'minute_bar': minute_db, 'daily_factor': factor_db}
+
+        for dataset in datasets:
+            if not self._active:
+                break
+            if self._checkpoint.is_done(instrument.order_book_id, dataset):
+                continue
+
+            self._written.keys = set()
             try:
-                digit += 1
-                self.writeRate(digit, total, '正在更新: %s - %s' % (instrument.order_book_id, instrument.symbol))
-
-                self.update_day_bar(daily_db, instrument, end_date)
-                self.update_minute_bar(minute_db, instrument, end_date)
-                if instrument.type == 'CS':
-                    self.update_daily_factor(factor_db, instrument, end_date)
-                    self.adjust_minute_bar(minute_db, instrument, end_date, prev_nday=1)
+                getattr(self, 'update_' + dataset)(dbs[dataset], instrument, end_date)
             except Exception as e:
                 self.writeLog('更新 【 %s -- %s 】 数据时出现错误： %s' % (instrument.order_book_id, instrument.symbol, e))
+                self._checkpoint.mark(instrument.order_book_id, dataset, STATUS_FAILED, e)
+            else:
+                self._writer.commit(self._written.keys, self._checkpoint_callback(instrument.order_book_id, dataset))
+            finally:
+                self._written.keys = None
 
-        _db_client.close()
-        del _db_client
+        return instrument
 
-        self.writeLog('数据更新完毕!')
-        self.writeRate(symbol='finish')
+    # ------------------------------------------------------------------
+    def _checkpoint_callback(self, symbol, dataset):
+        checkpoint = self._checkpoint
 
-        return
+        def callback(ok):
+            if ok:
+                checkpoint.mark(symbol, dataset)
+            else:
+                checkpoint.mark(symbol, dataset, STATUS_FAILED, '写入数据库失败')
+
+        return callback
+
+    # ------------------------------------------------------------------
+    def update_datasets(self, instrument):
+        """
+         合约需要更新的数据类别，依次对应 update_<类别> 方法
+
+         :return: list[str]
+        """
+        return ['day_bar', 'minute_bar', 'daily_factor'] if instrument.type == 'CS' else ['day_bar', 'minute_bar']
+
+    # ------------------------------------------------------------------
+    def is_updatable(self, instrument, end_date):
+        """合约是否需要更新(未退市的指数及正常交易的股票)"""
+        return not (instrument.de_listed_date < end_date or (instrument.type == 'CS' and instrument.status != 'Active'))
+
+    # ------------------------------------------------------------------
+    def prepare_update(self, daily_db, minute_db, factor_db, instruments, end_date):
+        """
+         并发更新开始前的准备工作(如跨合约批量预取数据)，由子类按需实现
+
+         :param list[Instrument] instruments: 待更新合约列表
+         :param datetime.datetime end_date: 更新日期
+        """
+        pass
+
+    # ------------------------------------------------------------------
+    def is_instrument_up_to_date(self, daily_db, minute_db, factor_db, instrument, end_date):
+        """
+         合约各项数据是否均已更新至 end_date，由子类根据集合命名规则实现
+
+         :return: bool
+        """
+        return False
+
+    # ------------------------------------------------------------------
+    def bar_symbol(self, instrument):
+        """合约在 bar 数据库中的集合名(合约代码)，由子类根据集合命名规则实现"""
+        return instrument.order_book_id
+
+    # ------------------------------------------------------------------
+    def instruments_to_adjust(self, minute_db, instruments, end_date, prev_nday=5):
+        """
+         以聚合查询一次找出最近 prev_nday 个交易日收盘 bar 成交量为 0 的合约，查询出错时返回全部合约
+
+         :param list[Instrument] instruments: 待检查合约列表
+         :return: list[Instrument]
+        """
+        if not instruments:
+            return instruments
+
+        t_dates = self.get_previous_trading_dates([end_date] * prev_nday, np.arange(prev_nday - 1, -1, -1))
+        closes = [t_date.replace(hour=15).to_pydatetime() for t_date in t_dates]
+        names = {self.bar_symbol(x): x for x in instruments}
+
+        try:
+            found = scan_zero_volume_close(minute_db, closes, list(names))
+        except Exception as e:
+            self.writeLog('检查收盘分钟线时出现错误，将逐个合约调整： %s' % e)
+            return instruments
+
+        return [names[x] for x in sorted(found) if x in names]
+
+    # ------------------------------------------------------------------
+    def _adjust_instrument(self, minute_db, instrument, end_date):
+        """调整单个合约当日最后一分钟数据(在工作线程中执行)"""
+        if not self._active:
+            return
+
+        try:
+            self.adjust_minute_bar(minute_db, instrument, end_date, prev_nday=1)
+        except Exception as e:
+            self.writeLog('调整 【 %s -- %s 】 数据时出现错误： %s' % (instrument.order_book_id, instrument.symbol, e))
+            self._checkpoint.mark(instrument.order_book_id, 'adjust', STATUS_FAILED, e)
+        else:
+            self._checkpoint.mark(instrument.order_book_id, 'adjust')
 
     # ------------------------------------------------------------------
     def update_day_bar(self, db, instrument, end_date):
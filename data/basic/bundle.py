@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-27 19:12:45
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-28 09:36:21
+"""
+进程内共享的 rqalpha bundle 缓存
+
+合约列表、ST、停牌及交易日历数据在首次访问时才读取，同一进程内的各数据服务共享
+同一份数据；每隔一段时间检查文件修改时间，bundle 更新后自动重新加载。
+每次加载的耗时记录在 load_times 中，并通知已注册的回调。
+"""
+import os
+import time
+from threading import RLock
+
+from rqalpha.data.date_set import DateSet
+from rqalpha.data.instrument_store import InstrumentStore
+from rqalpha.data.trading_dates_store import TradingDatesStore
+
+from .instrument_catalog import IGNORE_INDEX, InstrumentCatalog
+from .trading_calendar import TradingCalendar
+
+
+def bundle_path(name):
+    return os.path.join(os.path.expanduser("~/.rqalpha"), "bundle", name)
+
+
+def _mtime(path):
+    """文件修改时间，bcolz 目录取其内各文件的最大修改时间"""
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+
+    mtime = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for name in files:
+            mtime = max(mtime, os.path.getmtime(os.path.join(root, name)))
+    return mtime
+
+
+BUNDLE_FILES = {
+    'instruments': ('instruments.pk',
+                    lambda path: InstrumentCatalog(InstrumentStore(path).get_all_instruments(), IGNORE_INDEX)),
+    'st_stock_days': ('st_stock_days.bcolz', DateSet),
+    'suspended_days': ('suspended_days.bcolz', DateSet),
+    'trading_dates': ('trading_dates.bcolz',
+                      lambda path: TradingCalendar(TradingDatesStore(path).get_trading_calendar())),
+}
+
+
+########################################################################
+class BundleCache(object):
+    """
+     rqalpha bundle 缓存(线程安全)
+
+     :param float check_interval: 检查文件修改时间的最小间隔(秒)
+    """
+
+    def __init__(self, check_interval=10.0):
+        self._check_interval = check_interval
+        self._entries = {}              # name -> (数据, 修改时间, 上次检查时间)
+        self._listeners = []
+        self._lock = RLock()
+
+        self.load_times = {}
+
+    # ------------------------------------------------------------------
+    def add_listener(self, callback):
+        """注册加载回调，参数为 (名称, 路径, 耗时秒数)"""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    # ------------------------------------------------------------------
+    def get(self, name):
+        """获取数据，首次访问或文件更新后重新加载"""
+        file_name, loader = BUNDLE_FILES[name]
+        path = bundle_path(file_name)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(name)
+
+            if entry is not None:
+                data, mtime, checked = entry
+                if now - checked < self._check_interval:
+                    return data
+                try:
+                    if _mtime(path) == mtime:
+                        self._entries[name] = (data, mtime, now)
+                        return data
+                except OSError:
+                    # 更新过程中文件暂不可用时继续使用旧数据
+                    return data
+
+            mtime = _mtime(path)
+            start = time.time()
+            data = loader(path)
+            cost = time.time() - start
+
+            self._entries[name] = (data, mtime, now)
+            self.load_times[name] = cost
+            listeners = list(self._listeners)
+
+        for callback in listeners:
+            try:
+                callback(name, path, cost)
+            except Exception:
+                pass
+
+        return data
+
+    # ------------------------------------------------------------------
+    def invalidate(self, name=None):
+        """清除缓存，下次访问时重新加载"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    # ------------------------------------------------------------------
+    def report(self):
+        """各文件最近一次加载耗时"""
+        with self._lock:
+            return ['%s: %.3fs' % (k, v) for k, v in sorted(self.load_times.items())]
+
+
+_bundle = BundleCache()
+
+
+def get_bundle():
+    """进程内共享的 bundle 缓存"""
+    return _bundle
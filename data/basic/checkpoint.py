@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-28 10:05:37
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-28 16:48:12
+"""
+更新检查点：记录每次更新任务中各合约每类数据的完成状态
+
+检查点持久化在 MongoDB 的 update_checkpoint 集合中，每个 (数据源, 更新日期, 合约) 一条记录，
+各类数据的状态以单文档原子更新写入。进程中断或重试时重新读取检查点，
+已完成的数据直接跳过，只重新更新失败或尚未完成的合约。
+"""
+import datetime
+from threading import Lock
+
+from pymongo import ASCENDING
+
+from .manifest import MANIFEST_DB
+
+
+CHECKPOINT_COLLECTION = 'update_checkpoint'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+########################################################################
+class UpdateCheckpoint(object):
+    """
+     更新任务检查点(线程安全)
+
+     :param pymongo.MongoClient client: Mongo客户端
+     :param str source: 数据源名称
+     :param datetime.datetime run_date: 更新日期
+    """
+
+    def __init__(self, client, source, run_date):
+        self._cl = client[MANIFEST_DB][CHECKPOINT_COLLECTION]
+        self._cl.create_index([('source', ASCENDING), ('run', ASCENDING), ('symbol', ASCENDING)], unique=True)
+
+        self.source = source
+        self.run = run_date.strftime('%Y%m%d')
+
+        self._records = {}              # 合约 -> {数据类别: 状态}
+        self._lock = Lock()
+
+    # ------------------------------------------------------------------
+    def load(self):
+        """读取本次更新的检查点，并清除该数据源以往更新任务的记录"""
+        self._cl.delete_many({'source': self.source, 'run': {'$ne': self.run}})
+
+        records = {x['symbol']: x.get('status', {})
+                   for x in self._cl.find({'source': self.source, 'run': self.run},
+                                          {'_id': 0, 'symbol': 1, 'status': 1})}
+
+        with self._lock:
+            self._records = records
+
+        return self
+
+    # ------------------------------------------------------------------
+    def is_done(self, symbol, dataset):
+        with self._lock:
+            return self._records.get(symbol, {}).get(dataset) == STATUS_DONE
+
+    # ------------------------------------------------------------------
+    def is_complete(self, symbol, datasets):
+        """合约的各类数据是否均已完成"""
+        with self._lock:
+            status = self._records.get(symbol, {})
+            return all(status.get(x) == STATUS_DONE for x in datasets)
+
+    # ------------------------------------------------------------------
+    def mark(self, symbol, datasets, status=STATUS_DONE, error=None):
+        """
+         记录合约若干类数据的状态
+
+         :param str symbol: 合约代码
+         :param list[str] datasets: 数据类别
+         :param str status: STATUS_DONE | STATUS_FAILED
+         :param error: 失败原因
+        """
+        if isinstance(datasets, str):
+            datasets = [datasets]
+
+        update = {'$set': dict({'status.%s' % x: status for x in datasets}, updated=datetime.datetime.now())}
+        if status == STATUS_FAILED:
+            update['$set'].update({'error.%s' % x: str(error) for x in datasets})
+        else:
+            update['$unset'] = {'error.%s' % x: '' for x in datasets}
+
+        self._cl.update_one({'source': self.source, 'run': self.run, 'symbol': symbol}, update, upsert=True)
+
+        with self._lock:
+            self._records.setdefault(symbol, {}).update({x: status for x in datasets})
+
+    # ------------------------------------------------------------------
+    def failed(self):
+        """
+         本次更新失败的数据
+
+         :return: dict{合约: list[数据类别]}
+        """
+        with self._lock:
+            result = {s: sorted(k for k, v in status.items() if v == STATUS_FAILED)
+                      for s, status in self._records.items()}
+        return {s: v for s, v in result.items() if v}
+
+    # ------------------------------------------------------------------
+    def completed(self):
+        """已有完成记录的合约数"""
+        with self._lock:
+            return sum(1 for status in self._records.values() if STATUS_DONE in status.values())
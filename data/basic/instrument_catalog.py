@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-26 19:31:07
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-27 08:04:52
+"""
+合约目录：在合约列表之上预先建立按类型、交易所、行业、标的及上市区间的二级索引
+
+按日期筛选时，各类型合约按上市日期排序，先二分查找截取已上市的部分，
+再以退市日期数组整列比较，避免每次调用遍历全部合约。
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+
+from .trading_calendar import to_day, to_days
+
+
+STOCK_EXCHANGES = ('XSHE', 'XSHG')
+
+IGNORE_INDEX = ('000023.XSHG', '000140.XSHG', '000188.XSHG', '000801.XSHG', '000803.XSHG',
+                '000804.XSHG', '000806.XSHG', '000807.XSHG', '000809.XSHG', '000810.XSHG',
+                '000811.XSHG', '000812.XSHG', '000813.XSHG', '000815.XSHG', '000816.XSHG',
+                '000817.XSHG', '000818.XSHG', '000820.XSHG', '000821.XSHG', '000822.XSHG',
+                '000824.XSHG', '000825.XSHG', '000826.XSHG', '000829.XSHG', '000830.XSHG',
+                '000831.XSHG', '000832.XSHG', '000833.XSHG', '000834.XSHG', '000835.XSHG',
+                '000836.XSHG', '000837.XSHG', '000838.XSHG', '000839.XSHG', '000840.XSHG',
+                '000843.XSHG', '000844.XSHG', '000845.XSHG', '000846.XSHG', '000850.XSHG',
+                '000859.XSHG', '000861.XSHG', '000902.XSHG', '000907.XSHG', '000908.XSHG',
+                '000909.XSHG', '000910.XSHG', '000911.XSHG', '000912.XSHG', '000915.XSHG',
+                '000916.XSHG', '000917.XSHG', '000919.XSHG', '000920.XSHG', '000921.XSHG',
+                '000922.XSHG', '000923.XSHG', '000924.XSHG', '000925.XSHG', '000926.XSHG',
+                '000927.XSHG', '000929.XSHG', '000930.XSHG', '000931.XSHG', '000936.XSHG',
+                '000937.XSHG', '000938.XSHG', '000939.XSHG', '000940.XSHG', '000941.XSHG',
+                '000942.XSHG', '000943.XSHG', '000945.XSHG', '000946.XSHG', '000947.XSHG',
+                '000948.XSHG', '000949.XSHG', '000950.XSHG', '000951.XSHG', '000952.XSHG',
+                '000953.XSHG', '000954.XSHG', '000955.XSHG', '000956.XSHG', '000957.XSHG',
+                '000959.XSHG', '000960.XSHG', '000961.XSHG', '000962.XSHG', '000963.XSHG',
+                '000964.XSHG', '000965.XSHG', '000967.XSHG', '000968.XSHG', '000969.XSHG',
+                '000970.XSHG', '000972.XSHG', '000973.XSHG', '000975.XSHG', '000976.XSHG',
+                '000977.XSHG', '000978.XSHG', '000979.XSHG', '000980.XSHG', '000981.XSHG',
+                '000983.XSHG', '000985.XSHG', '000988.XSHG', '000994.XSHG', '000995.XSHG',
+                '000996.XSHG', '000997.XSHG', '000999.XSHG')
+
+
+########################################################################
+class InstrumentCatalog(object):
+    """
+     合约目录
+
+     :param list instruments: rqalpha Instrument 列表
+     :param ignore: 不计入股票合约列表的代码
+    """
+
+    def __init__(self, instruments, ignore=()):
+        self.instruments = {i.order_book_id: i for i in instruments}
+
+        by_type = defaultdict(list)
+        by_exchange = defaultdict(list)
+        by_industry = defaultdict(list)
+        by_underlying = defaultdict(list)
+
+        for o in sorted(self.instruments):
+            i = self.instruments[o]
+            by_type[i.type].append(o)
+            by_exchange[i.exchange].append(o)
+
+            if i.type == 'CS':
+                by_industry[getattr(i, 'industry_code', None)].append(o)
+            elif i.type == 'Future' and not o.endswith(('88', '99')):
+                by_underlying[i.underlying_symbol].append(o)
+
+        self._by_type = dict(by_type)
+        self._by_exchange = dict(by_exchange)
+        self._by_industry = dict(by_industry)
+        self._by_underlying = dict(by_underlying)
+
+        # 各类型按上市日期排序的 (合约, 上市日, 退市日) 数组
+        self._listing = {t: self._listing_arrays(ids) for t, ids in self._by_type.items()}
+        self._underlying_listing = {u: self._listing_arrays(ids) for u, ids in self._by_underlying.items()}
+
+        # 合约简称 -> 合约代码
+        self.symbol_map = {i.symbol: o for o, i in self.instruments.items()
+                           # 过滤掉 CSI300, SSE50, CSI500, SSE180
+                           if not o.endswith('INDX')}
+        try:
+            # FIXME
+            # 沪深300 中证500 固定使用上证的
+            for o in ['000300.XSHG', '000905.XSHG']:
+                self.symbol_map[self.instruments[o].symbol] = o
+            # 上证180 及 上证180指数 两个symbol都指向 000010.XSHG
+            self.symbol_map[self.instruments['SSE180.INDX'].symbol] = '000010.XSHG'
+        except KeyError:
+            pass
+
+        ignore = set(ignore)
+        self._stock_contracts = [self.instruments[o] for t in ('CS', 'INDX') for o in self._by_type.get(t, [])
+                                 if self.instruments[o].exchange in STOCK_EXCHANGES and o not in ignore and
+                                 re.match(r'^\d', o)]
+
+    # ------------------------------------------------------------------
+    def _listing_arrays(self, ids):
+        listed = to_days([self.instruments[o].listed_date for o in ids]) if ids else np.empty(0, dtype=np.int64)
+        de_listed = to_days([self.instruments[o].de_listed_date for o in ids]) if ids else np.empty(0, dtype=np.int64)
+
+        order = np.argsort(listed, kind='mergesort')
+        return np.array(ids, dtype=object)[order], listed[order], de_listed[order]
+
+    @staticmethod
+    def _active(arrays, day):
+        ids, listed, de_listed = arrays
+        right = np.searchsorted(listed, day, side='right')
+        return ids[:right][de_listed[:right] >= day].tolist()
+
+    # ------------------------------------------------------------------
+    def get(self, order_book_id):
+        return self.instruments.get(order_book_id)
+
+    def of_type(self, types):
+        """指定类型的合约代码(types为 None 时返回全部)"""
+        if types is None:
+            return sorted(self.instruments)
+        if isinstance(types, str):
+            types = [types]
+        return [o for t in types for o in self._by_type.get(t, [])]
+
+    def of_exchange(self, exchange):
+        return list(self._by_exchange.get(exchange, []))
+
+    def industry(self, code):
+        return list(self._by_industry.get(code, []))
+
+    # ------------------------------------------------------------------
+    def active(self, types, dt):
+        """指定日期处于上市状态的合约代码"""
+        day = to_day(dt)
+        if types is None:
+            types = list(self._listing.keys())
+        elif isinstance(types, str):
+            types = [types]
+        return [o for t in types if t in self._listing for o in self._active(self._listing[t], day)]
+
+    # ------------------------------------------------------------------
+    def all_instruments(self, types, dt=None):
+        ids = self.of_type(types) if dt is None else self.active(types, dt)
+        return [self.instruments[o] for o in ids]
+
+    # ------------------------------------------------------------------
+    def future_contracts(self, underlying, date):
+        """指定日期处于上市状态的某一品种期货合约(不含主力/指数连续合约)"""
+        arrays = self._underlying_listing.get(underlying)
+        if arrays is None:
+            return []
+        return sorted(self._active(arrays, to_day(date)))
+
+    # ------------------------------------------------------------------
+    def stock_contracts(self):
+        return list(self._stock_contracts)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-24 20:15:33
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-25 07:42:10
+"""
+合约日期区间存储(如 ST 期间)
+
+每个合约的区间合并为互不重叠的 [start, end) 有序数组，全部合约的区间按合约顺序拼接
+存储，以偏移量定位；判断一组日期是否落在区间内只需一次 searchsorted。
+日期均为 int YYYYMMDD，可持久化为 .npz 文件并按保存时间判断是否需要刷新。
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+OPEN_END = 99991231
+
+
+########################################################################
+class IntervalStore(object):
+    """
+     合约日期区间存储
+
+     :param dict intervals: {合约: [(start, end), ...]}，end为空表示至今
+    """
+
+    def __init__(self, intervals=None, created=None):
+        self._index = {}
+        starts, ends = [], []
+        offset = 0
+
+        for symbol in sorted(intervals or {}):
+            merged = self._merge(intervals[symbol])
+            if not merged:
+                continue
+            self._index[symbol] = (offset, offset + len(merged))
+            starts.extend(x[0] for x in merged)
+            ends.extend(x[1] for x in merged)
+            offset += len(merged)
+
+        self._starts = np.array(starts, dtype=np.int64)
+        self._ends = np.array(ends, dtype=np.int64)
+        self.created = time.time() if created is None else created
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _merge(intervals):
+        """按起始日期排序并合并重叠的区间"""
+        merged = []
+        for start, end in sorted((int(s), OPEN_END if e is None or pd.isnull(e) else int(e)) for s, e in intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_frame(cls, df, symbol='ts_code', start='start_date', end='end_date'):
+        """由区间记录表构建，日期列为 YYYYMMDD 整数或字符串"""
+        starts = pd.to_numeric(df[start], errors='coerce')
+        ends = pd.to_numeric(df[end], errors='coerce')
+        valid = starts.notnull().values
+
+        intervals = {}
+        for s, b, e in zip(df[symbol].values[valid], starts.values[valid], ends.values[valid]):
+            intervals.setdefault(s, []).append((b, None if pd.isnull(e) else e))
+        return cls(intervals)
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            store = cls(created=float(data['created']))
+            store._starts = data['starts']
+            store._ends = data['ends']
+            store._index = {s: (int(b), int(e)) for s, b, e in zip(data['symbols'], data['begins'], data['stops'])}
+        return store
+
+    def save(self, path):
+        symbols = sorted(self._index)
+        with open(path + '.tmp', mode='wb') as f:
+            np.savez(f, created=np.array(self.created), starts=self._starts, ends=self._ends,
+                     symbols=np.array(symbols, dtype=str),
+                     begins=np.array([self._index[x][0] for x in symbols], dtype=np.int64),
+                     stops=np.array([self._index[x][1] for x in symbols], dtype=np.int64))
+        os.replace(path + '.tmp', path)
+
+    # ------------------------------------------------------------------
+    def age(self):
+        """距构建时的秒数"""
+        return time.time() - self.created
+
+    @property
+    def symbols(self):
+        return sorted(self._index)
+
+    # ------------------------------------------------------------------
+    def intervals(self, symbol):
+        begin, stop = self._index.get(symbol, (0, 0))
+        return list(zip(self._starts[begin:stop].tolist(), self._ends[begin:stop].tolist()))
+
+    # ------------------------------------------------------------------
+    def contains(self, symbol, dates):
+        """
+         判断各日期是否处于合约的区间内
+
+         :param dates: int YYYYMMDD 或其数组
+         :return: bool | numpy.ndarray[bool]
+        """
+        scalar = np.isscalar(dates)
+        dates = np.atleast_1d(np.asarray(dates, dtype=np.int64))
+        begin, stop = self._index.get(symbol, (0, 0))
+
+        if begin == stop:
+            result = np.zeros(len(dates), dtype=bool)
+        else:
+            starts, ends = self._starts[begin:stop], self._ends[begin:stop]
+            pos = np.searchsorted(starts, dates, side='right') - 1
+            result = (pos >= 0) & (dates < ends[np.maximum(pos, 0)])
+
+        return bool(result[0]) if scalar else result
+
+    # ------------------------------------------------------------------
+    def symbols_on(self, date):
+        """指定日期处于区间内的全部合约"""
+        date = int(date)
+        positions = np.nonzero((self._starts <= date) & (date < self._ends))[0]
+
+        symbols = sorted(self._index, key=lambda x: self._index[x][0])
+        begins = np.array([self._index[x][0] for x in symbols], dtype=np.int64)
+        return sorted(set(symbols[i] for i in np.searchsorted(begins, positions, side='right') - 1))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-08-26 08:41:55
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-08-26 14:12:30
+"""
+数据更新清单：记录各数据库中每个合约集合最后一条数据的时间
+
+清单持久化在 MongoDB 的 manifest 集合中，每次写入数据后以 $max 原子更新，
+更新任务启动时一次查询即可得到全市场各合约的起始更新日期。
+
+数据修复、调整等原地改写历史数据的操作记录在 bar_rewrites 集合中(每个下游各一条，取最早的改写时间)，
+本地列式存储、N 分钟线合成等下游据此从改写处起重新同步，处理完后清除。
+"""
+from threading import Lock
+
+from pymongo import ASCENDING, DESCENDING, DeleteOne, UpdateOne
+
+
+MANIFEST_DB = 'meta_db'
+MANIFEST_COLLECTION = 'update_manifest'
+REWRITE_COLLECTION = 'bar_rewrites'
+
+# 需要跟随历史数据改写重新同步的下游
+REWRITE_BAR_STORE = 'bar_store'
+REWRITE_RESAMPLE = 'resample'
+REWRITE_TARGETS = (REWRITE_BAR_STORE, REWRITE_RESAMPLE)
+
+
+########################################################################
+class UpdateManifest(object):
+    """
+     合约数据最后更新时间清单(线程安全)
+
+     :param pymongo.MongoClient client: Mongo客户端
+    """
+
+    def __init__(self, client):
+        self._cl = client[MANIFEST_DB][MANIFEST_COLLECTION]
+        self._cl.create_index([('db', ASCENDING), ('symbol', ASCENDING)], unique=True)
+
+        self._records = {}
+        self._lock = Lock()
+
+    # ------------------------------------------------------------------
+    def load(self):
+        """一次性读取全部清单记录到内存"""
+        records = {(x['db'], x['symbol']): x['datetime']
+                   for x in self._cl.find({}, {'_id': 0, 'db': 1, 'symbol': 1, 'datetime': 1})}
+
+        with self._lock:
+            self._records = records
+
+        return self
+
+    # ------------------------------------------------------------------
+    def get(self, db_name, symbol):
+        """
+         获取指定集合最后一条数据的时间
+
+         :return: datetime.datetime | None
+        """
+        with self._lock:
+            return self._records.get((db_name, symbol))
+
+    # ------------------------------------------------------------------
+    def contains(self, db_name, symbol):
+        with self._lock:
+            return (db_name, symbol) in self._records
+
+    # ------------------------------------------------------------------
+    def last_datetime(self, cl):
+        """
+         获取集合最后一条数据的时间，清单中尚无记录时回查集合并补录
+
+         :param pymongo.collection.Collection cl: Mongo集合
+         :return: datetime.datetime | None
+        """
+        db_name = cl.database.name
+
+        if self.contains(db_name, cl.name):
+            return self.get(db_name, cl.name)
+
+        last_record = cl.find_one(sort=[('datetime', DESCENDING)], projection={'datetime': 1})
+
+        if last_record is None:
+            return None
+
+        self.update(db_name, cl.name, last_record['datetime'])
+        return last_record['datetime']
+
+    # ------------------------------------------------------------------
+    def update(self, db_name, symbol, last):
+        """以 $max 原子更新指定集合的最后数据时间"""
+        self._cl.update_one({'db': db_name, 'symbol': symbol}, {'$max': {'datetime': last}}, upsert=True)
+
+        with self._lock:
+            key = (db_name, symbol)
+            if key not in self._records or self._records[key] < last:
+                self._records[key] = last
+
+    # ------------------------------------------------------------------
+    def record(self, cl, documents):
+        """根据刚写入集合的文档更新清单"""
+        if documents:
+            self.update(cl.database.name, cl.name, max(x['datetime'] for x in documents))
+
+    # ------------------------------------------------------------------
+    def rebuild(self, db):
+        """
+         扫描指定数据库全部集合，重建其清单记录
+
+         :param pymongo.database.Database db: Mongo数据库
+        """
+        requests = []
+
+        for name in db.list_collection_names():
+            last_record = db[name].find_one(sort=[('datetime', DESCENDING)], projection={'datetime': 1})
+            if last_record:
+                requests.append(UpdateOne({'db': db.name, 'symbol': name},
+                                          {'$set': {'datetime': last_record['datetime']}}, upsert=True))
+
+        if requests:
+            self._cl.bulk_write(requests, ordered=False)
+
+        return self.load()
+
+
+########################################################################
+class RewriteLog(object):
+    """
+     历史数据改写记录
+
+     :param pymongo.MongoClient client: Mongo客户端
+    """
+
+    def __init__(self, client):
+        self._cl = client[MANIFEST_DB][REWRITE_COLLECTION]
+
+    # ------------------------------------------------------------------
+    def mark(self, db_name, symbol, since, targets=REWRITE_TARGETS):
+        """记录指定集合自 since 起的数据被改写，以 $min 保留最早的改写时间"""
+        for target in targets:
+            self._cl.update_one({'db': db_name, 'symbol': symbol, 'target': target},
+                                {'$min': {'since': since}}, upsert=True)
+
+    # ------------------------------------------------------------------
+    def pending(self, db_name, target):
+        """
+         下游尚未处理的改写记录
+
+         :return: dict{合约: 最早改写时间}
+        """
+        return {x['symbol']: x['since']
+                for x in self._cl.find({'db': db_name, 'target': target}, {'_id': 0, 'symbol': 1, 'since': 1})}
+
+    # ------------------------------------------------------------------
+    def clear(self, db_name, target, records):
+        """清除已处理的改写记录(处理期间又有更早的改写时保留)"""
+        requests = [DeleteOne({'db': db_name, 'symbol': symbol, 'target': target, 'since': {'$gte': since}})
+                    for symbol, since in records.items()]
+
+        if requests:
+            self._cl.bulk_write(requests, ordered=False)
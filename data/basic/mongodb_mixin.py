@@ -4,28 +4,23 @@
 # @Date:   2019-07-06 11:14:39
 # @Last Modified by:   freem
 # @Last Modified time: 2019-07-14 12:59:12
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure
+from pymongo import ASCENDING, DESCENDING
+
+from QuanTrader.api.mongo import connect_client, ensure_index
 
 
 class MongoDBMixin(object):
     """docstring for MongoDBMixin"""
     def __init__(self, config):
         super(MongoDBMixin, self).__init__()
-        url = 'mongodb://%s:%s' % (config.get('HOST', '127.0.0.1'), config.get('PORT', '27017'))
-
-        try:
-            self.dbClient = MongoClient(url, serverSelectionTimesoutMS=10)
-            self.dbClient.server_info()
-        except ConnectionFailure:
-            self.dbClient = None
+        self.dbClient = connect_client(config)
 
     def dbInsert(self, dbName, collectionName, d):
         """向MongoDB中插入数据，d是具体数据"""
         if self.dbClient:
             db = self.dbClient[dbName]
             collection = db[collectionName]
-            collection.ensure_index([('datetime', ASCENDING)], unique=True)
+            ensure_index(collection)
 
             if isinstance(d, dict):
                 collection.insert_one(d)
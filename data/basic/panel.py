@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-21 14:08:22
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-22 09:51:37
+"""
+截面面板加载器：按 交易日 x 合约 读取日线及因子数据
+
+各合约集合并发读取后按交易日历对齐为二维数组，单一集合结构(BarTable)下
+只需一次截面查询；构建好的面板缓存到 tmp 目录，数据更新日期变化后自动失效。
+
+示例::
+
+    loader = PanelLoader(client)
+    panel = loader.load(['close', 'adj_factor', 'pe_ttm'], '2019-01-01', '2019-06-30', db_name='factor_db')
+    panel['close']      # DataFrame，index为交易日，columns为 order_book_id
+"""
+import hashlib
+import os
+import shelve
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from QuanTrader.api.mongo import BarTable
+from QuanTrader.utils import get_temp_file
+
+from .instruments_mixin import InstrumentsMixin
+from .trading_dates_mixin import TradingDatesMixin
+
+
+SUFFIX_MAP = {'XSHE': 'SZ', 'XSHG': 'SH'}
+
+
+def to_db_symbol(order_book_id):
+    """order_book_id 转换为数据库集合名(如 000001.XSHE -> 000001.SZ)"""
+    code, suffix = order_book_id.split('.')
+    return '.'.join([code, SUFFIX_MAP.get(suffix, suffix)])
+
+
+def _load_updated_date():
+    """读取数据服务记录的最后更新日期"""
+    f = shelve.open(get_temp_file('temporary.qt'))
+    try:
+        return f.get('last_updated')
+    finally:
+        f.close()
+
+
+########################################################################
+class _Bundle(InstrumentsMixin, TradingDatesMixin):
+    """未指定数据源时使用的合约及交易日历数据"""
+
+    def __init__(self):
+        InstrumentsMixin.__init__(self)
+        TradingDatesMixin.__init__(self)
+
+
+########################################################################
+class PanelLoader(object):
+    """
+     截面面板加载器
+
+     :param pymongo.MongoClient client: Mongo客户端
+     :param source: 提供 all_instruments/get_trading_dates 的对象(如数据服务)，默认读取 rqalpha bundle
+     :param callable bar_db: Database -> bar 数据库的转换(如 BaseDataService.bar_db)，默认不转换
+     :param callable updated_date: 返回最后更新日期的函数，用于判断缓存是否失效
+     :param int max_workers: 并发读取线程数
+     :param bool cache: 是否使用磁盘缓存
+    """
+
+    def __init__(self, client, source=None, bar_db=None, updated_date=None, max_workers=8, cache=True):
+        self._client = client
+        self._source = source if source is not None else _Bundle()
+        self._bar_db = bar_db or (lambda db: db)
+        self._updated_date = updated_date or _load_updated_date
+        self._max_workers = max(int(max_workers), 1)
+        self._cache = cache
+
+    # ------------------------------------------------------------------
+    def universe(self, start_date, end_date, types=('CS', )):
+        """区间内处于上市状态的合约(order_book_id 升序)"""
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        return sorted(i.order_book_id for i in self._source.all_instruments(list(types))
+                      if i.listed_date <= end_date and i.de_listed_date >= start_date)
+
+    # ------------------------------------------------------------------
+    def load(self, fields, start_date, end_date, types=('CS', ), symbols=None, db_name='daily_db'):
+        """
+         加载面板数据
+
+         :param list[str] fields: 字段列表
+         :param symbols: order_book_id 列表，默认为 types 类型的全部合约
+         :return: dict{字段: DataFrame(index=交易日, columns=order_book_id)}
+        """
+        dates, symbols, arrays = self.load_arrays(fields, start_date, end_date, types, symbols, db_name)
+        index = pd.DatetimeIndex(dates, name='date')
+
+        return {k: pd.DataFrame(v, index=index, columns=symbols) for k, v in arrays.items()}
+
+    # ------------------------------------------------------------------
+    def load_arrays(self, fields, start_date, end_date, types=('CS', ), symbols=None, db_name='daily_db'):
+        """
+         加载面板数据为对齐的二维数组，缺失值为 NaN
+
+         :return: (交易日 datetime64 数组, order_book_id 列表, dict{字段: ndarray[交易日, 合约]})
+        """
+        fields = list(fields)
+        dates = np.asarray(self._source.get_trading_dates(start_date, end_date), dtype='datetime64[ns]')
+        if symbols is not None:
+            symbols = list(symbols)
+        else:
+            symbols = self.universe(dates[0], dates[-1], types) if len(dates) else []
+
+        path = self._cache_path(db_name, fields, dates, symbols)
+        updated = str(self._updated_date())
+
+        if self._cache:
+            arrays = self._read_cache(path, updated, fields)
+            if arrays is not None:
+                return dates, symbols, arrays
+
+        arrays = {k: np.full((len(dates), len(symbols)), np.nan) for k in fields}
+
+        if len(dates) and symbols:
+            db = self._bar_db(self._client[db_name])
+
+            if isinstance(db, BarTable):
+                self._fill_from_table(db, arrays, dates, symbols)
+            else:
+                self._fill_from_collections(db, arrays, dates, symbols)
+
+        if self._cache:
+            self._write_cache(path, updated, arrays)
+
+        return dates, symbols, arrays
+
+    # ------------------------------------------------------------------
+    def _read_symbol(self, db, symbol, fields, dates):
+        projection = dict({k: 1 for k in fields}, datetime=1, _id=0)
+        flt = {'datetime': {'$gte': pd.Timestamp(dates[0]).to_pydatetime(),
+                            '$lte': pd.Timestamp(dates[-1]).replace(hour=23, minute=59, second=59).to_pydatetime()}}
+
+        docs = list(db[to_db_symbol(symbol)].find(flt, projection))
+        if not docs:
+            return None, None
+
+        dt = pd.to_datetime([x['datetime'] for x in docs]).normalize().values
+        columns = {k: np.array([x.get(k, np.nan) for x in docs], dtype=float) for k in fields}
+        return dt, columns
+
+    # ------------------------------------------------------------------
+    def _fill_from_collections(self, db, arrays, dates, symbols):
+        fields = list(arrays.keys())
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            results = executor.map(lambda x: self._read_symbol(db, x, fields, dates), symbols)
+
+            for col, (dt, columns) in enumerate(results):
+                if dt is None:
+                    continue
+
+                rows = np.searchsorted(dates, dt)
+                valid = (rows < len(dates)) & (dates[np.minimum(rows, len(dates) - 1)] == dt)
+
+                for k, v in columns.items():
+                    arrays[k][rows[valid], col] = v[valid]
+
+    # ------------------------------------------------------------------
+    def _fill_from_table(self, table, arrays, dates, symbols):
+        db_symbols = [to_db_symbol(x) for x in symbols]
+        end = pd.Timestamp(dates[-1]).replace(hour=23, minute=59, second=59)
+
+        df = table.cross_section(dates[0], end, db_symbols, list(arrays.keys()))
+        if df.empty:
+            return
+
+        dt = pd.to_datetime(df['datetime']).dt.normalize().values
+        rows = np.searchsorted(dates, dt)
+        cols = pd.Index(db_symbols).get_indexer(df['symbol'])
+        valid = (rows < len(dates)) & (dates[np.minimum(rows, len(dates) - 1)] == dt) & (cols >= 0)
+
+        for k, v in arrays.items():
+            if k in df.columns:
+                v[rows[valid], cols[valid]] = df[k].values.astype(float)[valid]
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _cache_path(db_name, fields, dates, symbols):
+        key = '|'.join([db_name, ','.join(fields), str(dates[0]) if len(dates) else '',
+                        str(dates[-1]) if len(dates) else '', ','.join(symbols)])
+        return get_temp_file('panel_%s.npz' % hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _read_cache(path, updated, fields):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['__updated__']) != updated:
+                    return None
+                return {k: data[k] for k in fields}
+        except (IOError, KeyError, ValueError):
+            return None
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _write_cache(path, updated, arrays):
+        with open(path + '.tmp', mode='wb') as f:
+            np.savez(f, __updated__=np.array(updated), **arrays)
+        os.replace(path + '.tmp', path)
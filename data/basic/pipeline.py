@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-08-25 09:20:14
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-08-25 17:03:51
+"""
+并发更新流水线组件：数据源限流器及单线程批量写入器
+"""
+import time
+from queue import Empty, Queue
+from threading import Lock, Thread
+
+from pymongo.errors import BulkWriteError
+
+from QuanTrader.api.mongo import BulkWriter, ensure_index
+
+
+########################################################################
+class RateLimiter(object):
+    """
+     令牌桶限流器，限制同一数据源每秒的请求次数(线程安全)
+
+     :param float rate: 每秒允许的请求数，为 0 或 None 时不限流
+     :param int burst: 令牌桶容量(允许的瞬时突发请求数)
+    """
+
+    def __init__(self, rate=None, burst=1):
+        self._rate = float(rate) if rate else 0.0
+        self._burst = max(int(burst), 1)
+        self._tokens = float(self._burst)
+        self._stamp = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        if self._rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+                self._stamp = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+########################################################################
+class BatchWriter(object):
+    """
+     单线程批量写入器
+
+     各工作线程将 (collection, documents) 放入有界队列，由写入线程按集合合并后
+     交由 BulkWriter 按 datetime 幂等写入 MongoDB；队列满时 put 阻塞，形成背压。
+     commit 在指定集合此前提交的数据全部写入后回调，用于记录更新检查点。
+     写入线程不能因异常退出，因此 BulkWriter 抛出的错误在此转为 on_error 回调，
+     出错的集合记为失败，其下一次 commit 回调 False。
+
+     :param int batch_size: 单个集合缓冲达到该条数时立即写入
+     :param int queue_size: 队列容量
+     :param float flush_interval: 队列空闲超过该秒数时写入全部缓冲
+     :param callable on_error: 写入出错时的回调，参数为 (集合名, 异常)
+     :param callable on_written: 写入完成后的回调，参数为 (collection, documents)
+    """
+
+    _STOP = object()
+    _COMMIT = object()
+
+    def __init__(self, batch_size=5000, queue_size=64, flush_interval=1.0, on_error=None, on_written=None):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._on_error = on_error
+        self._on_written = on_written
+
+        self._queue = Queue(maxsize=queue_size)
+        self._buffers = {}
+        self._failed = set()            # 写入失败且尚未 commit 的集合
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------------------------------------------
+    def start(self):
+        if not self.running:
+            self._failed.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    def put(self, collection, documents):
+        """提交待写入的文档列表"""
+        if documents:
+            self._queue.put((collection, documents))
+
+    # ------------------------------------------------------------------
+    def commit(self, keys, callback):
+        """
+         指定集合此前提交的数据全部写入后回调 callback(是否全部写入成功)
+
+         :param keys: (数据库名, 集合名) 集合
+         :param callable callback: 回调函数
+        """
+        if self.running:
+            self._queue.put((self._COMMIT, (set(keys), callback)))
+        else:
+            callback(True)
+
+    # ------------------------------------------------------------------
+    def stop(self):
+        """写入全部缓冲数据后停止写入线程"""
+        if self.running:
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except Empty:
+                self._flush_all()
+                continue
+
+            if item is self._STOP:
+                self._flush_all()
+                break
+
+            collection, documents = item
+            if collection is self._COMMIT:
+                self._commit(*documents)
+                continue
+
+            key = (collection.database.name, collection.name)
+            _, buffer = self._buffers.setdefault(key, (collection, []))
+            buffer.extend(documents)
+
+            if len(buffer) >= self._batch_size:
+                self._flush(key)
+
+    # ------------------------------------------------------------------
+    def _commit(self, keys, callback):
+        for key in keys:
+            if key in self._buffers:
+                self._flush(key)
+
+        ok = not (keys & self._failed)
+        self._failed -= keys
+
+        try:
+            callback(ok)
+        except Exception as e:
+            if self._on_error:
+                self._on_error('commit', e)
+
+    # ------------------------------------------------------------------
+    def _flush_all(self):
+        for key in list(self._buffers.keys()):
+            self._flush(key)
+
+    # ------------------------------------------------------------------
+    def _flush(self, key):
+        collection, documents = self._buffers.pop(key)
+
+        try:
+            ensure_index(collection)
+            # 整个缓冲作为一批写入，writeErrors 中的序号即 documents 中的位置
+            with BulkWriter.for_collection(collection, batch_size=len(documents)) as writer:
+                writer.extend(documents)
+        except BulkWriteError as e:
+            # 部分写入失败不影响其余文档，只有写入成功的文档计入 on_written
+            errors = e.details.get('writeErrors', [])
+            failed = {x.get('index') for x in errors}
+            documents = [doc for i, doc in enumerate(documents) if i not in failed]
+            self._failed.add(key)
+            if self._on_error:
+                self._on_error(collection.full_name, errors[:1])
+        except Exception as e:
+            self._failed.add(key)
+            if self._on_error:
+                self._on_error(collection.full_name, e)
+            return
+
+        if not (self._on_written and documents):
+            return
+
+        # 回调出错(如更新清单时网络异常)不能中断写入线程，该集合本次提交按失败处理
+        try:
+            self._on_written(collection, documents)
+        except Exception as e:
+            self._failed.add(key)
+            if self._on_error:
+                self._on_error(collection.full_name, e)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-10-01 14:20:09
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-10-02 09:51:34
+"""
+按交易时段将 1 分钟线合成为 N 分钟线
+
+分钟线以结束时间标记(如 09:31 为 09:30-09:31 的 bar)。每根 bar 先换算为当日累计交易分钟数，
+跨越午间休市等时段间隔连续计数，再按 N 分钟分组，以该组名义结束时间为新 bar 的时间，
+例如 A 股 60 分钟线为 10:30、11:30、14:00、15:00 四根。
+夜盘(18:00 之后及次日凌晨)的 bar 计入下一交易日，需提供交易日历。
+
+合成结果写入各自的数据库(如 minute5_db)，每次只从已保存的最后两根 bar 之后增量合成，
+最后一根按完整数据重新合成覆盖，无需再从数据源下载；1 分钟线被调整或修复后，
+指定 since 从改写处所在的 bar 起重新合成。
+"""
+import numpy as np
+import pandas as pd
+from pymongo import DESCENDING
+
+from QuanTrader.api.mongo import BulkWriter, cursor_to_frame, ensure_index
+
+
+# 交易时段(按交易日内的先后顺序，夜盘在前)
+SESSIONS_STOCK = [('09:30', '11:30'), ('13:00', '15:00')]
+SESSIONS_FUTURES = [('21:00', '23:00'), ('09:00', '10:15'), ('10:30', '11:30'), ('13:30', '15:00')]
+
+RESAMPLE_FREQUENCIES = [5, 15, 30, 60]
+
+# 合成方式
+AGGREGATIONS = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+                'volume': 'sum', 'total_turnover': 'sum', 'open_interest': 'last'}
+
+_DAY_MINUTES = 24 * 60
+_NIGHT_START = 18 * 60      # 此后的 bar 属于下一交易日的夜盘
+_NIGHT_END = 6 * 60         # 此前的 bar 属于前一晚开始的夜盘
+
+
+def resample_db_name(minutes):
+    """N 分钟线数据库名"""
+    return 'minute%d_db' % minutes
+
+
+def _clock(minutes):
+    """将当日分钟数换算为交易日时钟：夜盘为负值，凌晨在夜盘之后、日盘之前"""
+    minutes = np.asarray(minutes, dtype=np.int64)
+    return np.where(minutes >= _NIGHT_START, minutes - _DAY_MINUTES, minutes)
+
+
+def _parse(value):
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+########################################################################
+class SessionResampler(object):
+    """
+     按交易时段合成 N 分钟线
+
+     :param int minutes: 合成周期(分钟)
+     :param list sessions: 交易时段 [('HH:MM', 'HH:MM'), ...]
+     :param TradingCalendar calendar: 交易日历，含夜盘时必须提供
+    """
+
+    def __init__(self, minutes, sessions=SESSIONS_STOCK, calendar=None):
+        self.minutes = int(minutes)
+        self.calendar = calendar
+
+        # 跨越午夜的夜盘(如 21:00-01:00)开始时间为负值，结束时间为凌晨的分钟数
+        starts = _clock([_parse(s) for s, _ in sessions])
+        ends = _clock([_parse(e) for _, e in sessions])
+
+        self._starts = starts
+        self._ends = ends
+        lengths = ends - starts
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self._total = int(lengths.sum())
+
+        self.night = bool((starts < 0).any())
+        assert not self.night or calendar is not None, "Night sessions require a trading calendar."
+
+    # ------------------------------------------------------------------
+    def labels(self, datetimes):
+        """
+         计算各 bar 所属 N 分钟线的名义结束时间
+
+         :param datetimes: bar 结束时间
+         :return: pd.DatetimeIndex
+        """
+        dt = pd.DatetimeIndex(datetimes)
+        minutes = dt.hour.values * 60 + dt.minute.values
+        clock = _clock(minutes)
+
+        # 当日累计交易分钟数(时段开始时刻的集合竞价 bar 计入第一分钟，时段外的 bar 归入相邻时段)
+        pos = np.minimum(np.searchsorted(self._ends, clock, side='left'), len(self._ends) - 1)
+        elapsed = np.clip(clock - self._starts[pos], 1, self._ends[pos] - self._starts[pos])
+        traded = self._offsets[pos] + elapsed
+
+        # 名义结束时间换算回交易日时钟
+        end = np.minimum((traded + self.minutes - 1) // self.minutes * self.minutes, self._total)
+        end_pos = np.searchsorted(self._offsets + (self._ends - self._starts), end, side='left')
+        end_clock = self._starts[end_pos] + end - self._offsets[end_pos]
+
+        # 交易日及夜盘开始的日期
+        dates = dt.normalize()
+        night_bar = minutes >= _NIGHT_START
+        night_bar |= self.night & (minutes < _NIGHT_END)
+        night_date = dates - pd.to_timedelta(np.where(minutes < _NIGHT_END, 1, 0), unit='D')
+        trading_day = dates
+
+        if night_bar.any():
+            trading_day = np.array(dates.values)
+            positions = self.calendar.next_positions(night_date[night_bar])
+            trading_day[night_bar] = self.calendar.dates[positions].values
+            trading_day = pd.DatetimeIndex(trading_day)
+
+        base = np.where(end_clock < _NIGHT_END, night_date.values, trading_day.values)
+        offset = np.where(end_clock < _NIGHT_END, end_clock + _DAY_MINUTES, end_clock)
+        return pd.DatetimeIndex(base + pd.to_timedelta(offset, unit='m').values)
+
+    # ------------------------------------------------------------------
+    def resample(self, df):
+        """
+         合成 N 分钟线
+
+         :param pd.DataFrame df: 按时间排序的 1 分钟线，含 datetime 及 AGGREGATIONS 中的字段
+         :return: pd.DataFrame
+        """
+        if df.empty:
+            return df
+
+        aggregations = {k: v for k, v in AGGREGATIONS.items() if k in df.columns}
+        bars = df[list(aggregations)].groupby(self.labels(df['datetime']).values, sort=True).agg(aggregations)
+        bars.index.name = 'datetime'
+        return bars.reset_index()
+
+
+# ----------------------------------------------------------------------
+def resample_collection(source, target, resampler, batch_size=1000, since=None):
+    """
+     由 1 分钟线集合增量合成 N 分钟线集合
+
+     :param source: 1 分钟线集合(pymongo.collection.Collection 或 SymbolView)
+     :param target: N 分钟线集合
+     :param SessionResampler resampler: 合成器
+     :param datetime.datetime since: 1 分钟线最早被改写的时间，为 None 时只合成新增数据
+     :return: int: 写入(新增及修改)的 bar 数
+     :raises pymongo.errors.BulkWriteError: 部分 bar 写入失败
+    """
+    if since is None:
+        # 最后一根可能为盘中合成的不完整 bar，从其前一根之后重新合成
+        last = [x['datetime'] for x in
+                target.find({}, {'_id': 0, 'datetime': 1}).sort('datetime', DESCENDING).limit(2)]
+        start = last[1] if len(last) > 1 else None
+    else:
+        # 结束时间早于 since 的 bar 不含被改写的数据，从其后重新合成
+        prev = target.find_one({'datetime': {'$lt': since}}, {'_id': 0, 'datetime': 1},
+                               sort=[('datetime', DESCENDING)])
+        start = prev['datetime'] if prev else None
+
+    fields = ['datetime'] + list(AGGREGATIONS)
+    projection = dict({k: 1 for k in fields}, _id=0)
+    cursor = source.find({'datetime': {'$gt': start}} if start else {}, projection).sort('datetime', 1)
+
+    df = cursor_to_frame(cursor, fields)
+    if df.empty:
+        return 0
+
+    bars = resampler.resample(df.dropna(subset=['datetime']))
+
+    ensure_index(target)
+    with BulkWriter(target, batch_size=batch_size) as writer:
+        for doc in bars.to_dict('records'):
+            doc['datetime'] = pd.Timestamp(doc['datetime']).to_pydatetime()
+            writer.add({k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in doc.items()})
+
+    return writer.written
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-25 19:52:48
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-26 08:20:16
+"""
+停牌日历存储
+
+以 交易日 x 合约 的位图保存停牌状态(每个交易日一行，按 np.packbits 压缩，每个合约占 1 bit)，
+"某合约某日是否停牌" 为 O(1) 查表，"某日全部停牌合约" 只需解包一行。
+contains(order_book_id, dates) 与 rqalpha DateSet 接口相同，可直接替换
+InstrumentsMixin 的停牌数据，供各数据服务共享。
+"""
+import os
+
+import numpy as np
+
+from .trading_calendar import days_to_ymd, to_days
+
+
+# 停牌日历的磁盘缓存文件名(合约以 order_book_id 为键)
+SUSPENSION_CACHE = 'suspension_days.npz'
+
+
+########################################################################
+class SuspensionStore(object):
+    """
+     停牌日历存储
+
+     :param list[str] symbols: 合约列表
+     :param dates: 覆盖的交易日(int YYYYMMDD 数组)
+     :param numpy.ndarray bits: 已压缩的位图 [交易日, ceil(合约数 / 8)]，默认全部未停牌
+    """
+
+    def __init__(self, symbols=None, dates=None, bits=None):
+        self._symbols = list(symbols or [])
+        self._symbol_index = {s: i for i, s in enumerate(self._symbols)}
+
+        self._dates = np.asarray(dates if dates is not None else [], dtype=np.int64)
+        self._date_index = {d: i for i, d in enumerate(self._dates.tolist())}
+
+        width = (len(self._symbols) + 7) // 8
+        self._bits = bits if bits is not None else np.zeros((len(self._dates), width), dtype=np.uint8)
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_records(cls, symbols, dates, records):
+        """
+         由停牌记录构建
+
+         :param records: 可迭代的 (合约, int YYYYMMDD) 停牌记录
+        """
+        store = cls(symbols, dates)
+        store.mark(records)
+        return store
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['symbols'].tolist(), data['dates'], data['bits'])
+
+    def save(self, path):
+        with open(path + '.tmp', mode='wb') as f:
+            np.savez(f, symbols=np.array(self._symbols, dtype=str), dates=self._dates, bits=self._bits)
+        os.replace(path + '.tmp', path)
+
+    # ------------------------------------------------------------------
+    @property
+    def symbols(self):
+        return list(self._symbols)
+
+    @property
+    def dates(self):
+        return self._dates
+
+    def covers(self, date):
+        """是否包含指定交易日的停牌数据"""
+        return int(date) in self._date_index
+
+    def covered(self, dates):
+        """
+         批量判断是否包含各日期的停牌数据
+
+         :param list['int' | 'np.int64' | 'pd.Timestamp'] dates: 日期列表
+         :return: numpy.ndarray[bool]
+        """
+        return np.isin(days_to_ymd(to_days(dates)), self._dates)
+
+    # ------------------------------------------------------------------
+    def extend(self, symbols=(), dates=()):
+        """追加合约及交易日(新交易日默认未停牌)"""
+        new_symbols = [s for s in symbols if s not in self._symbol_index]
+        new_dates = sorted(set(int(d) for d in dates) - set(self._date_index))
+
+        if new_symbols:
+            matrix = np.unpackbits(self._bits, axis=1)[:, :len(self._symbols)]
+            self._symbols.extend(new_symbols)
+            self._symbol_index = {s: i for i, s in enumerate(self._symbols)}
+            matrix = np.hstack([matrix, np.zeros((len(matrix), len(new_symbols)), dtype=np.uint8)])
+            self._bits = np.packbits(matrix, axis=1) if matrix.size else \
+                np.zeros((len(self._dates), (len(self._symbols) + 7) // 8), dtype=np.uint8)
+
+        if new_dates:
+            dates = np.concatenate([self._dates, np.array(new_dates, dtype=np.int64)])
+            order = np.argsort(dates, kind='mergesort')
+            rows = np.zeros((len(new_dates), self._bits.shape[1]), dtype=np.uint8)
+            self._bits = np.vstack([self._bits, rows])[order]
+            self._dates = dates[order]
+            self._date_index = {d: i for i, d in enumerate(self._dates.tolist())}
+
+    # ------------------------------------------------------------------
+    def mark(self, records):
+        """标记停牌记录，自动追加未知的合约及交易日"""
+        records = [(s, int(d)) for s, d in records]
+        self.extend([s for s, _ in records], [d for _, d in records])
+
+        if records:
+            rows = np.array([self._date_index[d] for _, d in records], dtype=np.int64)
+            cols = np.array([self._symbol_index[s] for s, _ in records], dtype=np.int64)
+            np.bitwise_or.at(self._bits, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+
+    # ------------------------------------------------------------------
+    def is_suspended_on(self, order_book_id, date):
+        """单个合约单日是否停牌"""
+        row = self._date_index.get(int(date))
+        col = self._symbol_index.get(order_book_id)
+
+        if row is None or col is None:
+            return False
+        return bool(self._bits[row, col >> 3] & (0x80 >> (col & 7)))
+
+    # ------------------------------------------------------------------
+    def contains(self, order_book_id, dates):
+        """
+         与 rqalpha DateSet.contains 相同的接口
+
+         :param list['int' | 'np.int64' | 'pd.Timestamp'] dates: 日期列表
+         :return: list[bool]
+        """
+        col = self._symbol_index.get(order_book_id)
+        if col is None or not len(self._dates):
+            return [False] * len(dates)
+
+        dates = days_to_ymd(to_days(dates))
+        pos = np.searchsorted(self._dates, dates)
+        found = (pos < len(self._dates)) & (self._dates[np.minimum(pos, len(self._dates) - 1)] == dates)
+
+        result = np.zeros(len(dates), dtype=bool)
+        result[found] = (self._bits[pos[found], col >> 3] & (0x80 >> (col & 7))) > 0
+        return result.tolist()
+
+    # ------------------------------------------------------------------
+    def is_suspended(self, order_book_id, dates):
+        """与 InstrumentsMixin.is_suspended 相同的接口"""
+        if not isinstance(dates, list):
+            dates = [dates]
+
+        return self.contains(order_book_id, dates)
+
+    # ------------------------------------------------------------------
+    def suspended_symbols(self, date):
+        """指定交易日全部停牌的合约"""
+        row = self._date_index.get(int(date))
+        if row is None:
+            return []
+
+        flags = np.unpackbits(self._bits[row])[:len(self._symbols)]
+        return [self._symbols[i] for i in np.nonzero(flags)[0]]
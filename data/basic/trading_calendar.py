@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-23 19:40:05
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-09-24 07:58:31
+"""
+交易日历索引
+
+交易日以 datetime64[ns] 及 int64 YYYYMMDD 两种数组保存，并为日历覆盖范围内的每个
+自然日建立稠密查找表(自然日 -> 不早于该日的第一个交易日位置)，单个日期的查询为 O(1)，
+且整数日期及 datetime 对象的查询无需构造 pd.Timestamp；各查询均提供接受数组的批量版本。
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def ymd_to_days(values):
+    """YYYYMMDD 整数数组转换为自 1970-01-01 起的天数数组"""
+    values = np.asarray(values, dtype=np.int64)
+    years = (values // 10000 - 1970).astype('datetime64[Y]')
+    months = years.astype('datetime64[M]') + (values // 100 % 100 - 1)
+    return (months.astype('datetime64[D]') + (values % 100 - 1)).astype(np.int64)
+
+
+def days_to_ymd(days):
+    """自 1970-01-01 起的天数数组转换为 YYYYMMDD 整数数组"""
+    days = np.asarray(days, dtype='datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    return ((years.astype(np.int64) + 1970) * 10000 + (months - years.astype('datetime64[M]')).astype(np.int64) * 100 +
+            (days - months.astype('datetime64[D]')).astype(np.int64) + 101)
+
+
+def to_days(values):
+    """
+     日期数组转换为自 1970-01-01 起的天数数组
+
+     :param values: YYYYMMDD 整数/字符串、datetime64、datetime、pd.Timestamp 或其数组
+    """
+    if isinstance(values, (pd.DatetimeIndex, pd.Series)):
+        return pd.DatetimeIndex(values).values.astype('datetime64[D]').astype(np.int64)
+
+    array = np.asarray(values)
+    if array.dtype.kind in 'iu':
+        return ymd_to_days(array)
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[D]').astype(np.int64)
+    if array.dtype.kind == 'U' and array.size and all(len(x) == 8 and x.isdigit() for x in array.ravel()):
+        return ymd_to_days(array.astype(np.int64))
+    if array.dtype.kind == 'O' and array.size and all(isinstance(x, datetime.date) for x in array.ravel()):
+        # 按公历序数换算，rqalpha 未退市合约的退市日期 2999-12-31 超出 datetime64[ns] 范围
+        return np.array([x.toordinal() - _EPOCH_ORDINAL for x in array.ravel()], dtype=np.int64).reshape(array.shape)
+
+    return pd.DatetimeIndex(np.atleast_1d(array)).values.astype('datetime64[D]').astype(np.int64).reshape(array.shape)
+
+
+def to_day(value):
+    """单个日期转换为自 1970-01-01 起的天数"""
+    if isinstance(value, (int, np.integer)):
+        return int(ymd_to_days(value))
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        # pd.Timestamp 同为 datetime 子类
+        return value.toordinal() - _EPOCH_ORDINAL
+    if isinstance(value, str) and len(value) >= 8:
+        digits = value[:10].replace('-', '')
+        if len(digits) == 8 and digits.isdigit():
+            return int(ymd_to_days(int(digits)))
+
+    return int(to_days([value])[0])
+
+
+########################################################################
+class TradingCalendar(object):
+    """
+     交易日历索引
+
+     :param dates: 升序交易日序列(DatetimeIndex、datetime64 数组或 YYYYMMDD 整数数组)
+    """
+
+    def __init__(self, dates):
+        days = np.unique(to_days(dates))
+        assert len(days), "Empty trading calendar."
+
+        self.days = days
+        self.values = days.astype('datetime64[D]').astype('datetime64[ns]')
+        self.int_dates = days_to_ymd(days)
+        self.dates = pd.DatetimeIndex(self.values)
+
+        # 稠密查找表：自然日偏移 -> 不早于该日的第一个交易日位置，以及该日是否为交易日
+        self._base = int(days[0])
+        self._left = np.searchsorted(days, np.arange(self._base, int(days[-1]) + 1)).astype(np.int64)
+        self._trading = np.zeros(len(self._left), dtype=bool)
+        self._trading[days - self._base] = True
+
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return len(self.days)
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_file(cls, path):
+        """从 save() 生成的 .npy 文件(int64 YYYYMMDD)加载"""
+        return cls(np.load(path, allow_pickle=False))
+
+    def save(self, path):
+        """以 int64 YYYYMMDD 数组保存为 .npy 文件"""
+        with open(path, mode='wb') as f:
+            np.save(f, self.int_dates)
+
+    # ------------------------------------------------------------------
+    def _bounds(self, days):
+        """批量返回 (不早于该日的第一个交易日位置, 晚于该日的第一个交易日位置)"""
+        offset = np.asarray(days, dtype=np.int64) - self._base
+        inside = (offset >= 0) & (offset < len(self._left))
+        clipped = np.clip(offset, 0, len(self._left) - 1)
+
+        left = np.where(inside, self._left[clipped], np.where(offset < 0, 0, len(self.days)))
+        right = left + (inside & self._trading[clipped])
+        return left, right
+
+    def _bound(self, day):
+        offset = day - self._base
+        if offset < 0:
+            return 0, 0
+        if offset >= len(self._left):
+            return len(self.days), len(self.days)
+
+        left = int(self._left[offset])
+        return left, left + int(self._trading[offset])
+
+    # ------------------------------------------------------------------
+    def index_of(self, date):
+        """交易日在日历中的位置，非交易日返回 -1"""
+        left, right = self._bound(to_day(date))
+        return left if right > left else -1
+
+    def indexes_of(self, dates):
+        left, right = self._bounds(to_days(dates))
+        return np.where(right > left, left, -1)
+
+    # ------------------------------------------------------------------
+    def is_trading_date(self, date):
+        left, right = self._bound(to_day(date))
+        return right > left
+
+    def is_trading_dates(self, dates):
+        """批量判断是否为交易日，返回 bool 数组"""
+        left, right = self._bounds(to_days(dates))
+        return right > left
+
+    # ------------------------------------------------------------------
+    def previous_position(self, date, n=1):
+        """date 之前第 n 个交易日的位置(n=0 时为不早于 date 的第一个交易日)，越界时取首个交易日"""
+        left, _ = self._bound(to_day(date))
+        return left - n if left >= n else 0
+
+    def previous_positions(self, dates, n=1):
+        left, _ = self._bounds(to_days(dates))
+        return np.maximum(left - np.asarray(n), 0)
+
+    # ------------------------------------------------------------------
+    def next_position(self, date, n=1):
+        """date 之后第 n 个交易日的位置，越界时取最后一个交易日"""
+        _, right = self._bound(to_day(date))
+        return min(right + n - 1, len(self.days) - 1)
+
+    def next_positions(self, dates, n=1):
+        _, right = self._bounds(to_days(dates))
+        return np.minimum(right + np.asarray(n) - 1, len(self.days) - 1)
+
+    # ------------------------------------------------------------------
+    def range_positions(self, start_date, end_date):
+        """[start_date, end_date] 区间交易日的切片位置 (left, right)"""
+        left, _ = self._bound(to_day(start_date))
+        _, right = self._bound(to_day(end_date))
+        return left, max(left, right)
+
+    def ranges_positions(self, start_dates, end_dates):
+        left, _ = self._bounds(to_days(start_dates))
+        _, right = self._bounds(to_days(end_dates))
+        return left, np.maximum(left, right)
+
+    # ------------------------------------------------------------------
+    def trading_dates(self, start_date, end_date):
+        left, right = self.range_positions(start_date, end_date)
+        return self.dates[left:right]
+
+    def trading_dates_int(self, start_date, end_date):
+        left, right = self.range_positions(start_date, end_date)
+        return self.int_dates[left:right]
+
+    def count(self, start_date, end_date):
+        """区间内交易日数量"""
+        left, right = self.range_positions(start_date, end_date)
+        return right - left
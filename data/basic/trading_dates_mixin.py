@@ -4,54 +4,57 @@
 # @Date:   2019-07-06 21:03:49
 # @Last Modified by:   freem
 # @Last Modified time: 2019-07-08 07:52:26
-import os
-import datetime
-import pandas as pd
-from functools import lru_cache
+from .bundle import get_bundle
 
-from rqalpha.data.trading_dates_store import TradingDatesStore
-
-
-def _to_timestamp(d):
-    if isinstance(d, int):
-        d = str(d)
-    return pd.Timestamp(d).replace(hour=0, minute=0, second=0, microsecond=0)
 
+class TradingDatesMixin(object):
+    """
+     交易日历查询，单个日期查询为 O(1) 查表，带 s 后缀的批量版本接受日期数组
 
-def _p(name):
-    return os.path.join(os.path.expanduser("~/.rqalpha"), "bundle", name)
+     日期参数可为 YYYYMMDD 整数/字符串、datetime、pd.Timestamp 或 datetime64，
+     交易日历来自进程内共享的 bundle 缓存(首次访问时加载)
+    """
+    def __init__(self):
+        pass
 
+    @property
+    def _calendar(self):
+        return get_bundle().get('trading_dates')
 
-class TradingDatesMixin(object):
-    """docstring for TradingDatesMixin"""
-    def __init__(self):
-        self._dates = TradingDatesStore(_p('trading_dates.bcolz')).get_trading_calendar()
+    @property
+    def _dates(self):
+        return self._calendar.dates
 
     def get_trading_dates(self, start_date, end_date):
         # 只需要date部分
-        start_date = _to_timestamp(start_date)
-        end_date = _to_timestamp(end_date)
-        left = self._dates.searchsorted(start_date)
-        right = self._dates.searchsorted(end_date, side='right')
-        return self._dates[left:right]
+        return self._calendar.trading_dates(start_date, end_date)
+
+    def get_trading_dates_int(self, start_date, end_date):
+        """区间内交易日的 int64 YYYYMMDD 数组"""
+        return self._calendar.trading_dates_int(start_date, end_date)
+
+    def get_trading_dates_batch(self, start_dates, end_dates):
+        """批量获取多个区间的交易日，返回 DatetimeIndex 列表"""
+        left, right = self._calendar.ranges_positions(start_dates, end_dates)
+        return [self._dates[i:j] for i, j in zip(left, right)]
 
     def get_previous_trading_date(self, date, n=1):
-        date = _to_timestamp(date)
-        pos = self._dates.searchsorted(date)
-        if pos >= n:
-            return self._dates[pos - n]
-        else:
-            return self._dates[0]
+        return self._dates[self._calendar.previous_position(date, n)]
+
+    def get_previous_trading_dates(self, dates, n=1):
+        """批量获取之前第 n 个交易日，n 可为与 dates 等长的数组"""
+        return self._dates[self._calendar.previous_positions(dates, n)]
 
     def get_next_trading_date(self, date, n=1):
-        date = _to_timestamp(date)
-        pos = self._dates.searchsorted(date, side='right')
-        if pos + n > len(self._dates):
-            return self._dates[-1]
-        else:
-            return self._dates[pos + n - 1]
+        return self._dates[self._calendar.next_position(date, n)]
+
+    def get_next_trading_dates(self, dates, n=1):
+        """批量获取之后第 n 个交易日，n 可为与 dates 等长的数组"""
+        return self._dates[self._calendar.next_positions(dates, n)]
 
     def is_trading_date(self, date):
-        date = _to_timestamp(date)
-        pos = self._dates.searchsorted(date)
-        return pos < len(self._dates) and self._dates[pos] == date
+        return self._calendar.is_trading_date(date)
+
+    def is_trading_dates(self, dates):
+        """批量判断是否为交易日，返回 bool 数组"""
+        return self._calendar.is_trading_dates(dates)
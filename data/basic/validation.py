@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# @Author: Freemoses
+# @Date:   2019-09-30 19:18:26
+# @Last Modified by:   Freemoses
+# @Last Modified time: 2019-10-01 10:42:57
+"""
+bar 数据质量校验
+
+写入数据库前对每批文档按列做向量化检查，每项检查返回异常行的掩码，并按其处理方式：
+    quarantine  从待写入数据中移除，连同原因写入隔离集合；其后的数据照常写入，
+                隔离集合中未处理(resolved 为 False)的记录即为数据缺口，供修复及重新合成使用
+    drop        直接丢弃(如已写入过的重复时间)
+    tag         照常写入，文档附加异常原因字段
+    report      只计入质量统计
+检查项可自由组合或自定义(继承 Check 并实现 __call__)，各批次的统计汇总在 QualityMetrics 中。
+
+示例::
+
+    validator = BarValidator([PriceCheck(), OHLCCheck(), TimestampCheck()], quarantine=db['bar_quarantine'])
+    bars = validator.validate(cl, bars, {'last': last_datetime})
+"""
+import datetime
+from collections import defaultdict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+from pymongo import ReplaceOne
+
+
+ACTION_QUARANTINE = 'quarantine'
+ACTION_DROP = 'drop'
+ACTION_TAG = 'tag'
+ACTION_REPORT = 'report'
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close']
+FRAME_FIELDS = ['datetime'] + PRICE_FIELDS + ['limit_up', 'limit_down']
+
+
+########################################################################
+class Check(object):
+    """
+     校验项基础类，子类以整列运算返回异常行的 bool 掩码
+
+     :param str action: 处理方式
+    """
+
+    name = 'check'
+
+    def __init__(self, action=ACTION_QUARANTINE):
+        self.action = action
+
+    def __call__(self, frame, context):
+        """
+         :param pd.DataFrame frame: 待写入数据
+         :param dict context: 批次信息，last 为集合中已有的最后时间，intraday 表示分钟线
+         :return: numpy.ndarray[bool] | None(不适用)
+        """
+        raise NotImplementedError
+
+
+class PriceCheck(Check):
+    """价格缺失或不为正"""
+
+    name = 'invalid_price'
+
+    def __call__(self, frame, context):
+        fields = [x for x in PRICE_FIELDS if x in frame.columns]
+        if not fields:
+            return None
+
+        prices = frame[fields].values.astype(np.float64)
+        return (np.isnan(prices) | (prices <= 0)).any(axis=1)
+
+
+class OHLCCheck(Check):
+    """最高价低于最低价，或开盘/收盘价超出最高、最低价范围"""
+
+    name = 'ohlc_inconsistent'
+
+    def __init__(self, action=ACTION_QUARANTINE, tolerance=1e-6):
+        super(OHLCCheck, self).__init__(action)
+        self.tolerance = tolerance
+
+    def __call__(self, frame, context):
+        if not all(x in frame.columns for x in PRICE_FIELDS):
+            return None
+
+        o, h, l, c = (frame[x].values.astype(np.float64) for x in PRICE_FIELDS)
+        high, low = h + self.tolerance, l - self.tolerance
+        return (h < low) | (o > high) | (o < low) | (c > high) | (c < low)
+
+
+class LimitPriceCheck(Check):
+    """
+     最高价超出涨停价或最低价低于跌停价(仅检查带有 limit_up / limit_down 的数据)
+
+     新股上市首日、复牌及除权除息日的涨跌停价常以不同基准计算，超出并不代表数据有误，默认只做标记
+    """
+
+    name = 'limit_breach'
+
+    def __init__(self, action=ACTION_TAG, tolerance=0.01):
+        super(LimitPriceCheck, self).__init__(action)
+        self.tolerance = tolerance
+
+    def __call__(self, frame, context):
+        if not {'limit_up', 'limit_down', 'close'}.issubset(frame.columns):
+            return None
+
+        up = frame['limit_up'].values.astype(np.float64)
+        down = frame['limit_down'].values.astype(np.float64)
+        high = frame['high' if 'high' in frame.columns else 'close'].values.astype(np.float64)
+        low = frame['low' if 'low' in frame.columns else 'close'].values.astype(np.float64)
+
+        with np.errstate(invalid='ignore'):
+            valid = up > 0
+            return valid & ((high > up + self.tolerance) | (low < down - self.tolerance))
+
+
+class TimestampCheck(Check):
+    """批次内时间重复(保留最后一条)或乱序"""
+
+    name = 'timestamp_order'
+
+    def __call__(self, frame, context):
+        if 'datetime' not in frame.columns:
+            return None
+
+        dt = pd.to_datetime(frame['datetime'])
+        duplicated = dt.duplicated(keep='last').values
+        values = dt.values
+        out_of_order = np.zeros(len(values), dtype=bool)
+        if len(values) > 1:
+            out_of_order[1:] = values[1:] < np.maximum.accumulate(values)[:-1]
+        return duplicated | out_of_order
+
+
+class StaleTimestampCheck(Check):
+    """不晚于集合中已有最后一条数据的时间(以往更新已写入的重复数据)"""
+
+    name = 'stale_timestamp'
+
+    def __init__(self, action=ACTION_DROP):
+        super(StaleTimestampCheck, self).__init__(action)
+
+    def __call__(self, frame, context):
+        last = context.get('last')
+        if last is None or 'datetime' not in frame.columns:
+            return None
+
+        return (pd.to_datetime(frame['datetime']) <= pd.Timestamp(last)).values
+
+
+class SessionCountCheck(Check):
+    """分钟线每个交易日的 bar 数少于应有数量"""
+
+    name = 'incomplete_session'
+
+    def __init__(self, action=ACTION_REPORT, expected=240):
+        super(SessionCountCheck, self).__init__(action)
+        self.expected = expected
+
+    def __call__(self, frame, context):
+        if not context.get('intraday') or 'datetime' not in frame.columns:
+            return None
+
+        days = pd.to_datetime(frame['datetime']).dt.normalize()
+        return (days.map(days.value_counts()) < self.expected).values
+
+
+def default_checks(tolerance=0.01, session_bars=240):
+    """默认校验项"""
+    return [PriceCheck(), OHLCCheck(), LimitPriceCheck(tolerance=tolerance), TimestampCheck(),
+            StaleTimestampCheck(), SessionCountCheck(expected=session_bars)]
+
+
+########################################################################
+class QualityMetrics(object):
+    """
+     数据质量统计(线程安全)
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.batches = 0
+            self.rows = 0
+            self.issues = defaultdict(int)          # 检查项 -> 异常行数
+            self.actions = defaultdict(int)         # 处理方式 -> 行数
+            self.collections = defaultdict(int)     # 集合 -> 异常行数
+
+    # ------------------------------------------------------------------
+    def record(self, name, rows, issues, actions):
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            for k, v in issues.items():
+                self.issues[k] += v
+            for k, v in actions.items():
+                self.actions[k] += v
+            if issues:
+                self.collections[name] += max(issues.values())
+
+    # ------------------------------------------------------------------
+    def summary(self, top=10):
+        """
+         统计汇总
+
+         :param int top: 列出异常行数最多的前 top 个集合
+         :return: dict
+        """
+        with self._lock:
+            worst = sorted(self.collections.items(), key=lambda x: x[1], reverse=True)[:top]
+            return {'batches': self.batches,
+                    'rows': self.rows,
+                    'issues': dict(self.issues),
+                    'actions': dict(self.actions),
+                    'worst': [{'collection': k, 'rows': v} for k, v in worst]}
+
+
+########################################################################
+class BarValidator(object):
+    """
+     写入前的 bar 数据校验器(线程安全)
+
+     :param list[Check] checks: 校验项，默认为 default_checks()
+     :param pymongo.collection.Collection quarantine: 隔离集合，为 None 时隔离的数据只计数不保存
+     :param str tag_field: tag 方式下记录异常原因的文档字段
+    """
+
+    def __init__(self, checks=None, quarantine=None, tag_field='quality_flags'):
+        self.checks = list(checks) if checks is not None else default_checks()
+        self.quarantine = quarantine
+        self.tag_field = tag_field
+        self.metrics = QualityMetrics()
+
+    def reset(self):
+        """开始新一次更新前清空统计"""
+        self.metrics.reset()
+
+    # ------------------------------------------------------------------
+    def validate(self, cl, documents, context=None):
+        """
+         校验一批待写入的文档
+
+         :param cl: 目标集合
+         :param list[dict] documents: 待写入文档(按时间排序)
+         :param dict context: 批次信息
+         :return: list[dict]: 需要写入的文档
+        """
+        if not documents:
+            return documents
+
+        name = '%s.%s' % (cl.database.name, cl.name)
+
+        context = context or {}
+        columns = [x for x in FRAME_FIELDS if x in documents[0]]
+        frame = pd.DataFrame.from_records(documents, columns=columns)
+
+        results = []
+        for check in self.checks:
+            mask = check(frame, context)
+            if mask is not None and mask.any():
+                results.append((check, np.asarray(mask, dtype=bool)))
+
+        if not results:
+            self.metrics.record(name, len(documents), {}, {})
+            return documents
+
+        removed = np.zeros(len(documents), dtype=bool)
+        masks = defaultdict(lambda: np.zeros(len(documents), dtype=bool))
+        for check, mask in results:
+            masks[check.action] |= mask
+            if check.action in (ACTION_QUARANTINE, ACTION_DROP):
+                removed |= mask
+
+        # 行号 -> 异常原因
+        reasons = defaultdict(list)
+        for check, mask in results:
+            for i in np.nonzero(mask)[0]:
+                reasons[i].append(check.name)
+
+        actions = {k: int(v.sum()) for k, v in masks.items()}
+
+        quarantined = np.nonzero(masks[ACTION_QUARANTINE])[0] if ACTION_QUARANTINE in masks else []
+        if len(quarantined) and self.quarantine is not None:
+            # 以 (集合, 时间) 记录缺口，重复下载到同一条异常数据时只更新原记录
+            now = datetime.datetime.now()
+            self.quarantine.bulk_write([
+                ReplaceOne({'collection': name, 'datetime': documents[i].get('datetime')},
+                           {'collection': name, 'db': cl.database.name, 'symbol': cl.name,
+                            'datetime': documents[i].get('datetime'), 'reasons': reasons[i],
+                            'document': dict(documents[i]), 'detected': now, 'resolved': False}, upsert=True)
+                for i in quarantined], ordered=False)
+
+        if ACTION_TAG in masks:
+            for i in np.nonzero(masks[ACTION_TAG] & ~removed)[0]:
+                documents[i][self.tag_field] = reasons[i]
+
+        self.metrics.record(name, len(documents),
+                            {check.name: int(mask.sum()) for check, mask in results}, actions)
+
+        return [doc for doc, r in zip(documents, removed) if not r]
@@ -10,6 +10,7 @@ import qdarkstyle
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+from QuanTrader.api.mongo import close_clients
 from QuanTrader.data import QuantOS
 from QuanTrader.utils import load_icon
 
@@ -205,6 +206,7 @@ class DataManager(QtWidgets.QWidget):
         """退出程序前调用，保证正常退出"""
         if self.currentSource:
             self.currentSource.close()
+        close_clients()
         QtWidgets.qApp.quit()
 
     # ------------------------------------------------------------------
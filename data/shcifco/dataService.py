@@ -6,12 +6,13 @@ import time
 import datetime
 import random
 
-from pymongo import MongoClient, ASCENDING
 
 from vnpy.data.shcifco.vnshcifco import ShcifcoApi, PERIOD_1MIN
 from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.app.ctaStrategy.ctaBase import MINUTE_DB_NAME
 
+from QuanTrader.api.mongo import BulkWriter, ensure_index, get_client
+
 
 # 加载配置
 config = open('config.json')
@@ -25,7 +26,7 @@ SHCIFCO_TOKEN = setting['SHCIFCO_TOKEN']
 SYMBOLS = setting['SYMBOLS']
 
 api = ShcifcoApi(SHCIFCO_IP, SHCIFCO_PORT, SHCIFCO_TOKEN)       # 历史行情服务API对象
-mc = MongoClient(MONGO_HOST, MONGO_PORT)                        # Mongo连接
+mc = get_client({'HOST': MONGO_HOST, 'PORT': MONGO_PORT})                        # Mongo连接
 db = mc[MINUTE_DB_NAME]                                         # 数据库
 
 
@@ -48,24 +49,31 @@ def generateVtBar(d):
     
     return bar
 
+#----------------------------------------------------------------------
+def reportBulkError(batch, details):
+    """输出批量写入错误"""
+    errors = details.get('writeErrors', [])
+    print(u'第%s批数据写入失败%s条：%s' %(batch, len(errors), errors[:1]))
+
 #----------------------------------------------------------------------
 def downMinuteBarBySymbol(symbol, num):
     """下载某一合约的分钟线数据"""
     start = time.time()
     
     cl = db[symbol]                                                 # 集合
-    cl.ensure_index([('datetime', ASCENDING)], unique=True)         # 添加索引
+    ensure_index(cl)                                                # 添加索引
     
     l = api.getHisBar(symbol, num, period=PERIOD_1MIN)
     if not l:
         print(u'%s数据下载失败' %symbol)
         return
     
-    for d in l:
-        bar = generateVtBar(d)
-        d = bar.__dict__
-        flt = {'datetime': bar.datetime}
-        cl.replace_one(flt, d, True)
+    with BulkWriter(cl, on_error=reportBulkError) as writer:
+        for d in l:
+            writer.add(generateVtBar(d).__dict__)
+
+    if writer.errors:
+        print(u'合约%s共%s条数据写入失败' %(symbol, writer.errors))
         
     end = time.time()
     cost = (end - start) * 1000
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""
+migrate_to_table 迁移到时间序列集合时可重复执行
+"""
+import datetime
+import importlib
+import os
+import sys
+import types
+
+# 只加载 api/mongo 下的目录模块，不执行依赖完整环境的 api.mongo.__init__
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for name, path in [('tpro', _ROOT), ('tpro.api', os.path.join(_ROOT, 'api')),
+                   ('tpro.api.mongo', os.path.join(_ROOT, 'api', 'mongo'))]:
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [path]
+        sys.modules[name] = package
+
+bar_table = importlib.import_module('tpro.api.mongo.bar_table')
+
+
+class _Cursor(object):
+
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        return _Cursor(sorted(self._docs, key=lambda x: x[key], reverse=direction < 0))
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class _Collection(object):
+    """只实现迁移用到的操作，不支持唯一索引(同时间序列集合)"""
+
+    def __init__(self):
+        self.docs = []
+
+    def _match(self, flt):
+        for doc in self.docs:
+            ok = True
+            for k, v in flt.items():
+                if isinstance(v, dict):
+                    ok &= k in doc and doc[k] > v['$gt']
+                else:
+                    ok &= doc.get(k) == v
+            if ok:
+                yield doc
+
+    def find(self, flt=None, projection=None):
+        return _Cursor([{k: v for k, v in x.items() if k != '_id'} for x in self._match(flt or {})])
+
+    def find_one(self, flt=None, projection=None, sort=None):
+        docs = list(self.find(flt).sort(*sort[0]) if sort else self.find(flt))
+        return docs[0] if docs else None
+
+    def insert_many(self, docs, ordered=True):
+        self.docs.extend(dict(x) for x in docs)
+
+    def bulk_write(self, requests, ordered=True):
+        self.insert_many([x._doc for x in requests])
+        return types.SimpleNamespace(inserted_count=len(requests), upserted_count=0, modified_count=0)
+
+    def create_index(self, keys, **kwargs):
+        pass
+
+
+class _Database(object):
+
+    def __init__(self, name):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, _Collection())
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+    def create_collection(self, name, **kwargs):
+        return self[name]
+
+
+def test_timeseries_migration_is_repeatable():
+    source = _Database('minute_db')
+    start = datetime.datetime(2019, 10, 8, 9, 31)
+    for symbol in ['000001.XSHE', '600000.XSHG']:
+        source[symbol].insert_many([{'datetime': start + datetime.timedelta(minutes=i), 'close': 10.0}
+                                    for i in range(5)])
+
+    table = bar_table.BarTable(_Database('minute_db'), timeseries=True)
+
+    assert bar_table.migrate_to_table(source, table, batch_size=2) == 10
+    assert bar_table.migrate_to_table(source, table, batch_size=2) == 0
+    assert len(table.collection.docs) == 10
+
+    source['000001.XSHE'].insert_many([{'datetime': start + datetime.timedelta(minutes=5), 'close': 10.0}])
+    assert bar_table.migrate_to_table(source, table) == 1
+    assert len(table.collection.docs) == 11
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""
+InstrumentCatalog 对 rqalpha 未退市合约(退市日期 2999-12-31)的处理
+"""
+import datetime
+import importlib
+import os
+import sys
+import types
+from collections import namedtuple
+
+import pytest
+
+# 只加载 data/basic 下的目录模块，不执行依赖 PyQt5 / pymongo 的 data.basic.__init__
+_BASIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'basic')
+_package = types.ModuleType('_catalog_basic')
+_package.__path__ = [_BASIC_DIR]
+sys.modules.setdefault('_catalog_basic', _package)
+
+catalog_module = importlib.import_module('_catalog_basic.instrument_catalog')
+InstrumentCatalog = catalog_module.InstrumentCatalog
+
+Instrument = namedtuple('Instrument', ['order_book_id', 'symbol', 'type', 'exchange', 'listed_date',
+                                       'de_listed_date', 'industry_code', 'underlying_symbol'])
+
+LIVE = datetime.datetime(2999, 12, 31)
+
+
+def _instrument(order_book_id, listed, de_listed=LIVE, type='CS', underlying=None):
+    exchange = order_book_id.split('.')[1] if '.' in order_book_id else 'SHFE'
+    return Instrument(order_book_id, order_book_id, type, exchange, listed, de_listed, 'J66', underlying)
+
+
+@pytest.fixture
+def catalog():
+    return InstrumentCatalog([
+        _instrument('000001.XSHE', datetime.datetime(1991, 4, 3)),
+        _instrument('600000.XSHG', datetime.datetime(1999, 11, 10)),
+        _instrument('000003.XSHE', datetime.datetime(1991, 1, 14), datetime.datetime(2002, 6, 14)),
+        _instrument('RB1910', datetime.datetime(2018, 10, 16), datetime.datetime(2019, 10, 15), 'Future', 'RB'),
+        _instrument('RB2010', datetime.datetime(2019, 10, 16), LIVE, 'Future', 'RB'),
+    ])
+
+
+def test_live_instruments_are_indexed(catalog):
+    assert [x.order_book_id for x in catalog.stock_contracts()] == ['000001.XSHE', '000003.XSHE', '600000.XSHG']
+    assert len(catalog.all_instruments(['CS'])) == 3
+
+
+def test_active_filters_by_listing_dates(catalog):
+    assert catalog.active('CS', datetime.datetime(2019, 1, 2)) == ['000001.XSHE', '600000.XSHG']
+    assert sorted(catalog.active('CS', 20000104)) == ['000001.XSHE', '000003.XSHE', '600000.XSHG']
+    assert catalog.future_contracts('RB', '2019-10-16') == ['RB2010']
+
+
+def test_to_days_beyond_datetime64_ns_range():
+    to_days = importlib.import_module('_catalog_basic.trading_calendar').to_days
+    expected = LIVE.toordinal() - datetime.date(1970, 1, 1).toordinal()
+    assert to_days([LIVE, datetime.datetime(1970, 1, 2)]).tolist() == [expected, 1]
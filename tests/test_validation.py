@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""
+BarValidator 的处理方式及隔离后的写入控制
+"""
+import datetime
+import importlib
+import os
+import sys
+import types
+
+_BASIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'basic')
+_package = types.ModuleType('_validation_basic')
+_package.__path__ = [_BASIC_DIR]
+sys.modules.setdefault('_validation_basic', _package)
+
+validation = importlib.import_module('_validation_basic.validation')
+
+
+class _Collection(object):
+    database = types.SimpleNamespace(name='minute_db')
+    name = '000001.XSHE'
+
+
+def _bar(minute, price):
+    return {'datetime': datetime.datetime(2019, 10, 8, 9, minute), 'open': price, 'high': price, 'low': price,
+            'close': price, 'limit_up': 10.0, 'limit_down': 8.0}
+
+
+def test_limit_breach_is_tagged_not_removed():
+    validator = validation.BarValidator([validation.LimitPriceCheck()])
+    bars = validator.validate(_Collection(), [_bar(31, 9.0), _bar(32, 10.5)])
+
+    assert len(bars) == 2
+    assert bars[1]['quality_flags'] == ['limit_breach']
+    assert validator.metrics.summary()['actions'] == {'tag': 1}
+
+
+def test_quarantine_removes_only_bad_rows():
+    validator = validation.BarValidator([validation.PriceCheck()])
+    bars = validator.validate(_Collection(), [_bar(31, 9.0), _bar(32, 0.0), _bar(33, 9.0)])
+
+    assert [x['datetime'].minute for x in bars] == [31, 33]
+    assert len(validator.validate(_Collection(), [_bar(34, 9.0)])) == 1
+    assert validator.metrics.summary()['actions'] == {'quarantine': 1}